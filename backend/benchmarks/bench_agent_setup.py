@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Per-request agent setup overhead: a new ReActAgent per /chat (tool wrappers,
+system prompt, memory, worker) against taking a reset agent from the pool.
+
+    uv run python benchmarks/bench_agent_setup.py --requests 2000
+
+Uses a MockLLM; only the setup path is timed, not the agent run.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.agent import ReActAgent
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.llms import ChatMessage, MessageRole, MockLLM
+
+from wenshu.agents.pool import AgentPool
+from wenshu.agents.tools import SYSTEM_PROMPT, create_agent, create_researcher_tool
+
+
+def per_request(setup, teardown, n_requests: int) -> np.ndarray:
+    latencies = []
+    for _ in range(n_requests):
+        started = time.perf_counter()
+        agent = setup()
+        latencies.append(time.perf_counter() - started)
+        # What a chat leaves behind before the agent is given back
+        agent.memory.put(ChatMessage(role=MessageRole.USER, content="q"))
+        teardown(agent)
+    return np.array(latencies) * 1e6
+
+
+def report(name: str, latencies: np.ndarray) -> None:
+    print(
+        f"{name:<32} mean={latencies.mean():8.1f} us  "
+        f"p50={np.percentile(latencies, 50):8.1f} us  "
+        f"p95={np.percentile(latencies, 95):8.1f} us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    Settings.llm = MockLLM()
+    callback_manager = CallbackManager([])
+    index = object()
+
+    def build_per_request():
+        # The agent construction /chat used before pooling
+        return ReActAgent.from_tools(
+            tools=create_researcher_tool(index),
+            llm=Settings.llm,
+            system_prompt=SYSTEM_PROMPT,
+            verbose=True,
+            callback_manager=callback_manager,
+        )
+
+    report(
+        "new agent per request",
+        per_request(build_per_request, lambda a: None, args.requests),
+    )
+
+    tools = create_researcher_tool()
+    pool = AgentPool(lambda: create_agent(None, callback_manager, tools), max_idle=4)
+    pool.warm_up(4)
+    report(
+        "pooled agent (reset on acquire)",
+        per_request(pool.acquire, pool.release, args.requests),
+    )
+    print(f"pool: {pool.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Latency / recall benchmark of two-stage (summary -> chunks) retrieval against
+flat chunk search.
+
+    uv run python benchmarks/bench_hierarchical.py --documents 10000 100000
+
+Documents are synthetic: each has a topic-centred document vector, its chunks
+are noisy copies of it and its summary embedding is the (noisy) mean of the
+chunks. Queries are perturbed chunks; ground truth is the flat exact top-k.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from wenshu.retrieval.summary_index import DocumentSummaryIndex
+from wenshu.vector_stores.matrix import normalize_rows
+from wenshu.vector_stores.mmap_store import MmapVectorStore
+
+
+def make_corpus(n_documents: int, chunks: int, dim: int, n_topics: int, seed: int = 0):
+    """(chunk vectors, chunk -> document index, summary vectors)"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    documents = topics[rng.integers(0, n_topics, n_documents)]
+    documents += 0.5 * rng.standard_normal(documents.shape).astype(np.float32)
+    owner = np.repeat(np.arange(n_documents), chunks)
+    vectors = documents[owner] + 0.8 * rng.standard_normal((len(owner), dim)).astype(
+        np.float32
+    )
+    vectors = normalize_rows(vectors)
+    summaries = vectors.reshape(n_documents, chunks, dim).mean(axis=1)
+    summaries += 0.05 * rng.standard_normal(summaries.shape).astype(np.float32)
+    return vectors, owner, normalize_rows(summaries)
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), n_queries, replace=False)
+    dim = vectors.shape[1]
+    # Perturbation of norm ~0.6 on the unit chunk vectors
+    noise = (
+        0.6 / np.sqrt(dim) * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    )
+    return normalize_rows(vectors[picks] + noise), picks
+
+
+def load_store(
+    store, vectors: np.ndarray, owner: np.ndarray, batch_size: int = 10000
+) -> None:
+    for start in range(0, len(vectors), batch_size):
+        store.add(
+            [
+                TextNode(
+                    id_=f"n{i}",
+                    text="",
+                    embedding=vectors[i].tolist(),
+                    relationships={
+                        NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"d{owner[i]}")
+                    },
+                )
+                for i in range(start, min(start + batch_size, len(vectors)))
+            ]
+        )
+
+
+def run_queries(search, queries: np.ndarray):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies) * 1000, results
+
+
+def recall(results, truth) -> float:
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / sum(len(t) for t in truth)
+
+
+def report(
+    name: str, latencies: np.ndarray, recall_value: float, target_hit: float
+) -> None:
+    print(
+        f"{name:<28} recall@k={recall_value:.3f}  target-doc={target_hit:.3f}  "
+        f"p50={np.percentile(latencies, 50):7.2f} ms  "
+        f"p95={np.percentile(latencies, 95):7.2f} ms"
+    )
+
+
+def bench(n_documents: int, args) -> None:
+    print(
+        f"\nCorpus: {n_documents} documents x {args.chunks} chunks, dim={args.dim}, "
+        f"{args.queries} queries, top_k={args.top_k}"
+    )
+    vectors, owner, summaries = make_corpus(
+        n_documents, args.chunks, args.dim, args.topics
+    )
+    queries, sources = make_queries(vectors, args.queries)
+    targets = [f"d{owner[i]}" for i in sources]
+
+    def target_rate(results) -> float:
+        hits = sum(
+            any(f"d{owner[int(node_id[1:])]}" == target for node_id in result)
+            for result, target in zip(results, targets)
+        )
+        return hits / len(targets)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MmapVectorStore(persist_dir=f"{tmp_dir}/chunks", dtype=args.dtype)
+        load_store(store, vectors, owner)
+        summary = DocumentSummaryIndex(f"{tmp_dir}/summaries", args.dtype)
+        summary.add([(f"d{d}", "", summaries[d].tolist()) for d in range(n_documents)])
+
+        def flat(query, doc_ids=None):
+            return store.query(
+                VectorStoreQuery(
+                    query_embedding=query.tolist(),
+                    similarity_top_k=args.top_k,
+                    doc_ids=doc_ids,
+                )
+            ).ids
+
+        latencies, truth = run_queries(flat, queries)
+        report("flat", latencies, 1.0, target_rate(truth))
+
+        for top_documents in args.top_documents:
+
+            def two_stage(query):
+                doc_ids = [doc_id for doc_id, _ in summary.search(query, top_documents)]
+                return flat(query, doc_ids)
+
+            latencies, results = run_queries(two_stage, queries)
+            report(
+                f"two-stage top_docs={top_documents}",
+                latencies,
+                recall(results, truth),
+                target_rate(results),
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, nargs="+", default=[10000])
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--top-documents", type=int, nargs="+", default=[20, 50, 200])
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    for n_documents in args.documents:
+        bench(n_documents, args)
+
+
+if __name__ == "__main__":
+    main()
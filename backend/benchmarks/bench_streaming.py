@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+SSE framing of the answer stream: one frame per token against frames
+coalesced by time window / size, on a simulated LLM token stream.
+
+    uv run python benchmarks/bench_streaming.py --tokens 2000 --rate 80
+
+Reports frames, bytes per token and framing CPU time per token; the
+coalesced stream also reports how late tokens reach the client.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from wenshu.utils.streaming import TokenCoalescer, create_sse_message
+
+# Typical Chinese answer deltas: one or two characters, sometimes punctuation
+_VOCAB = [
+    "招生",
+    "通知",
+    "学院",
+    "，",
+    "的",
+    "2024",
+    "年",
+    "。",
+    "要求",
+    "材料",
+    "提交",
+    "截止",
+]
+
+
+def token_stream(n_tokens: int, rate: float, seed: int = 0):
+    """(arrival time, token) pairs of an LLM decoding `rate` tokens per second"""
+    rng = np.random.default_rng(seed)
+    gaps = rng.exponential(1.0 / rate, n_tokens)
+    return list(zip(np.cumsum(gaps), rng.choice(_VOCAB, n_tokens)))
+
+
+def per_token(stream):
+    frames = []
+    started = time.perf_counter()
+    for arrival, token in stream:
+        frames.append(
+            (arrival, create_sse_message({"type": "token", "data": str(token)}))
+        )
+    return frames, time.perf_counter() - started, np.zeros(len(stream))
+
+
+def coalesced(stream, window: float, max_bytes: int):
+    """Replays the arrivals against the coalescer's deadlines"""
+    coalescer = TokenCoalescer(window=window, max_bytes=max_bytes)
+    frames, delays, arrivals = [], [], []
+    framing = 0.0
+
+    def flush(at: float):
+        nonlocal framing
+        started = time.perf_counter()
+        frames.append(
+            (at, create_sse_message({"type": "token", "data": coalescer.flush()}))
+        )
+        framing += time.perf_counter() - started
+        delays.extend(at - a for a in arrivals)
+        arrivals.clear()
+
+    for i, (arrival, token) in enumerate(stream):
+        deadline = coalescer.deadline()
+        if deadline is not None and deadline <= arrival:
+            flush(deadline)
+        arrivals.append(arrival)
+        if coalescer.add(str(token), now=arrival) or i == 0:
+            flush(arrival)
+    if coalescer.pending:
+        flush(stream[-1][0])
+    return frames, framing, np.array(delays)
+
+
+def report(
+    name: str, frames, framing: float, delays: np.ndarray, n_tokens: int
+) -> None:
+    sent = sum(len(message.encode("utf-8")) for _, message in frames)
+    print(
+        f"{name:<28} frames={len(frames):6d}  bytes/token={sent / n_tokens:6.1f}  "
+        f"framing={1e6 * framing / n_tokens:6.2f} us/token  "
+        f"added delay p95={1000 * np.percentile(delays, 95):6.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=80.0, help="tokens per second")
+    parser.add_argument("--window-ms", type=float, default=40.0)
+    parser.add_argument("--max-bytes", type=int, default=1024)
+    args = parser.parse_args()
+
+    stream = token_stream(args.tokens, args.rate)
+    report("frame per token", *per_token(stream), args.tokens)
+    for window_ms in sorted({20.0, args.window_ms, 100.0}):
+        report(
+            f"coalesced {window_ms:.0f} ms",
+            *coalesced(stream, window_ms / 1000, args.max_bytes),
+            args.tokens,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Recall / latency benchmark of the vector store backends against exact search.
+
+    uv run python benchmarks/bench_vector_stores.py --n 1000000 --dim 256
+
+Vectors are synthetic (gaussian clusters), queries are perturbed corpus
+vectors; ground truth is exact inner-product search over the full matrix.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from wenshu.vector_stores.ivf import IVFVectorStore
+from wenshu.vector_stores.matrix import normalize_rows, top_k_indices
+from wenshu.vector_stores.mmap_store import MmapVectorStore
+from wenshu.vector_stores.quantized_store import QuantizedVectorStore
+
+
+def make_corpus(n: int, dim: int, n_topics: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    labels = rng.integers(0, n_topics, n)
+    vectors = topics[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def make_queries(corpus: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.choice(len(corpus), n_queries, replace=False)]
+    return normalize_rows(
+        picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32)
+    )
+
+
+def load_store(store, corpus: np.ndarray, batch_size: int = 10000) -> float:
+    """Insert the corpus in batches (the incremental path) and return seconds taken"""
+    started = time.perf_counter()
+    for start in range(0, len(corpus), batch_size):
+        batch = corpus[start : start + batch_size]
+        store.add(
+            [
+                TextNode(id_=f"n{start + i}", text="", embedding=vector.tolist())
+                for i, vector in enumerate(batch)
+            ]
+        )
+    return time.perf_counter() - started
+
+
+def run_queries(search, queries: np.ndarray):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies) * 1000, results
+
+
+def recall(results, truth) -> float:
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / sum(len(t) for t in truth)
+
+
+def report(name: str, latencies: np.ndarray, recall_value: float) -> None:
+    print(
+        f"{name:<24} recall@k={recall_value:.3f}  "
+        f"p50={np.percentile(latencies, 50):7.2f} ms  "
+        f"p95={np.percentile(latencies, 95):7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--pq-m", type=int, default=32)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[50, 200])
+    args = parser.parse_args()
+
+    print(f"Corpus: {args.n} x {args.dim}, {args.queries} queries, top_k={args.top_k}")
+    corpus = make_corpus(args.n, args.dim, args.topics)
+    queries = make_queries(corpus, args.queries)
+
+    def exact(query):
+        return [f"n{i}" for i in top_k_indices(corpus @ query, args.top_k)]
+
+    latencies, truth = run_queries(exact, queries)
+    report("exact (numpy)", latencies, 1.0)
+
+    def store_search(store):
+        def search(query):
+            result = store.query(
+                VectorStoreQuery(
+                    query_embedding=query.tolist(), similarity_top_k=args.top_k
+                )
+            )
+            return result.ids
+
+        return search
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MmapVectorStore(persist_dir=tmp_dir, dtype=args.dtype)
+        print(f"mmap build (incremental inserts): {load_store(store, corpus):.1f} s")
+        store.persist(tmp_dir)
+
+        started = time.perf_counter()
+        store = MmapVectorStore.from_persist_dir(tmp_dir, dtype=args.dtype)
+        print(f"mmap cold load: {1000 * (time.perf_counter() - started):.1f} ms")
+        latencies, results = run_queries(store_search(store), queries)
+        report(f"mmap exact ({args.dtype})", latencies, recall(results, truth))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = IVFVectorStore(persist_dir=tmp_dir, dtype=args.dtype)
+        print(f"IVF build (incremental inserts): {load_store(store, corpus):.1f} s")
+
+        for nprobe in args.nprobe:
+            store.nprobe = nprobe
+            latencies, results = run_queries(store_search(store), queries)
+            report(f"ivf nprobe={nprobe}", latencies, recall(results, truth))
+
+    # Memory / recall trade-off of the quantized schemes
+    float32_bytes = args.n * args.dim * 4
+    for scheme in ("int8", "pq"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = QuantizedVectorStore(
+                persist_dir=tmp_dir, dtype=args.dtype, scheme=scheme, pq_m=args.pq_m
+            )
+            print(
+                f"{scheme} build (incremental inserts): {load_store(store, corpus):.1f} s"
+            )
+            usage = store.memory_usage()
+            print(
+                f"{scheme} resident codes: {usage['code_bytes'] / 2**20:.1f} MiB "
+                f"({float32_bytes / usage['code_bytes']:.0f}x smaller than float32)"
+            )
+            for rerank in args.rerank:
+                store.rerank_candidates = rerank
+                latencies, results = run_queries(store_search(store), queries)
+                report(f"{scheme} rerank={rerank}", latencies, recall(results, truth))
+
+
+if __name__ == "__main__":
+    main()
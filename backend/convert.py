@@ -75,11 +75,24 @@ class DocumentConverter:
         return False
 
     def convert_xls_to_xlsx(self, xls_path):
-        import pandas as pd
-
-        df = pd.read_excel(xls_path)
-        xlsx_path = xls_path.with_suffix(".xlsx")
-        df.to_excel(xlsx_path, index=False)
+        import xlrd
+        from openpyxl import Workbook
+
+        # Stream every sheet row by row: xlrd loads one sheet at a time
+        # (on_demand) and openpyxl's write-only workbook flushes rows to disk
+        source = xlrd.open_workbook(str(xls_path), on_demand=True)
+        target = Workbook(write_only=True)
+        try:
+            for sheet_index in range(source.nsheets):
+                sheet = source.sheet_by_index(sheet_index)
+                target_sheet = target.create_sheet(title=sheet.name)
+                for row in sheet.get_rows():
+                    target_sheet.append([cell.value for cell in row])
+                source.unload_sheet(sheet_index)
+            xlsx_path = xls_path.with_suffix(".xlsx")
+            target.save(xlsx_path)
+        finally:
+            source.release_resources()
 
         self.log.append(f"✅ {xls_path.name} → {xlsx_path.name}")
         self.cleanup_commands.append(f"rm '{xls_path}'")
@@ -108,7 +121,7 @@ class DocumentConverter:
     def process_files(self, files_by_ext):
         # Install dependencies
         subprocess.check_call(
-            [sys.executable, "-m", "pip", "install", "pandas", "openpyxl"]
+            [sys.executable, "-m", "pip", "install", "xlrd", "openpyxl"]
         )
 
         # Convert files
@@ -174,5 +187,3 @@ if __name__ == "__main__":
     data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
     converter = DocumentConverter(data_dir)
     converter.run()
-
-
@@ -0,0 +1,74 @@
+import time
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from wenshu.agents.budget import BudgetGuard, RequestBudget
+from wenshu.agents.context import RequestContext, request_scope
+from wenshu.agents.tools import BudgetedReActChatFormatter
+
+
+def _context(**budget) -> RequestContext:
+    context = RequestContext(user_query="q")
+    context.budget = RequestBudget(**budget)
+    return context
+
+
+def test_check_passes_within_budget():
+    guard = BudgetGuard()
+    assert guard.check(_context()) is None
+    assert guard.exhausted == {}
+
+
+def test_check_deadline():
+    guard = BudgetGuard()
+    context = _context(deadline_seconds=10)
+    context.started_at = time.monotonic() - 11
+    assert "deadline" in guard.check(context)
+    assert guard.exhausted == {"deadline": 1}
+
+
+def test_check_research_steps_only_when_counting_steps():
+    guard = BudgetGuard()
+    context = _context(max_research_steps=2)
+    context.research_steps = 2
+    # Reaching the step limit leaves nothing unfinished for the agent prompt
+    assert guard.check(context, count_steps=False) is None
+    assert "2 research steps" in guard.check(context)
+
+
+def test_check_prompt_tokens_and_first_reason_sticks():
+    guard = BudgetGuard()
+    context = _context(max_prompt_tokens=5, deadline_seconds=10)
+    guard.charge(
+        context,
+        [ChatMessage(role=MessageRole.USER, content="one two three four five six")],
+    )
+    reason = guard.check(context)
+    assert "prompt tokens" in reason
+
+    context.started_at = time.monotonic() - 11
+    assert guard.check(context) == reason
+    assert guard.exhausted == {"prompt_tokens": 1}
+
+
+def test_zero_disables_a_limit():
+    guard = BudgetGuard()
+    context = _context(deadline_seconds=0, max_research_steps=0, max_prompt_tokens=0)
+    context.started_at = time.monotonic() - 3600
+    context.research_steps = 100
+    context.prompt_tokens = 10**9
+    assert guard.check(context) is None
+    assert guard.hard_deadline(context) is None
+
+
+def test_agent_prompts_are_charged_only_for_new_messages():
+    formatter = BudgetedReActChatFormatter()
+    context = _context()
+    history = [ChatMessage(role=MessageRole.USER, content="q")]
+    with request_scope(context):
+        formatter.format([], history, [])
+        first = context.prompt_tokens
+        # The next iteration repeats the same prompt: nothing new to charge
+        formatter.format([], history, [])
+    assert first > 0
+    assert context.prompt_tokens == first
@@ -0,0 +1,62 @@
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from wenshu.agents.fast_path import is_refusal
+from wenshu.agents.router import Route
+from wenshu.api.chat import _is_grounded, _without_current_query
+
+
+def _route(route: Route) -> dict:
+    return {"type": "route", "data": {"route": route.value}}
+
+
+def _step(sufficient: bool) -> dict:
+    return {"type": "research_step", "data": {"is_sufficient": sufficient}}
+
+
+def _answer(text: str) -> dict:
+    return {"type": "token", "data": text}
+
+
+CONFIDENT = {"type": "confidence", "data": {"top_score": 0.91}}
+
+
+def test_confident_single_shot_answer_is_grounded():
+    events = [_route(Route.SINGLE_SHOT), CONFIDENT, _answer("开学时间为 9 月 1 日。")]
+    assert _is_grounded(events)
+
+
+def test_single_shot_answer_without_confidence_check_is_not_cached():
+    events = [_route(Route.SINGLE_SHOT), _answer("开学时间为 9 月 1 日。")]
+    assert not _is_grounded(events)
+
+
+def test_single_shot_refusal_is_not_cached():
+    events = [_route(Route.SINGLE_SHOT), CONFIDENT, _answer("文档中没有提到开学时间。")]
+    assert not _is_grounded(events)
+
+
+def test_is_refusal():
+    assert is_refusal("The excerpts do not contain the answer.")
+    assert is_refusal("抱歉，未找到相关规定。")
+    assert not is_refusal("根据《通知》，报名截止日期为 3 月 5 日。")
+
+
+def test_research_answer_needs_a_sufficient_last_step():
+    escalated = [_route(Route.SINGLE_SHOT), _route(Route.RESEARCH)]
+    assert _is_grounded(escalated + [_step(False), _step(True), _answer("…")])
+    assert not _is_grounded(escalated + [_step(True), _step(False), _answer("…")])
+    assert not _is_grounded([_route(Route.DIRECT), _answer("你好！")])
+
+
+def test_budget_cut_research_is_not_cached():
+    events = [_step(True), {"type": "budget_exhausted", "data": {}}, _answer("…")]
+    assert not _is_grounded(events)
+
+
+def test_without_current_query():
+    history = [
+        ChatMessage(role=MessageRole.ASSISTANT, content="a"),
+        ChatMessage(role=MessageRole.USER, content="q"),
+    ]
+    assert _without_current_query("q", history) == history[:1]
+    assert _without_current_query("other", history) == history
@@ -0,0 +1,95 @@
+import asyncio
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from wenshu.services.history_service import SUMMARY_MESSAGE_PREFIX, ChatHistoryManager
+
+
+def _turns(n, size=10):
+    messages = []
+    for i in range(n):
+        messages.append(
+            ChatMessage(role=MessageRole.USER, content=f"q{i}".ljust(size, "."))
+        )
+        messages.append(
+            ChatMessage(role=MessageRole.ASSISTANT, content=f"a{i}".ljust(size, "."))
+        )
+    return messages
+
+
+def _manager(token_budget, folds):
+    # One token per character keeps the budget arithmetic readable
+    manager = ChatHistoryManager(
+        keep_turns=2, token_budget=token_budget, summary_tokens=20, tokenizer=list
+    )
+
+    async def fold(summary, messages):
+        folds.append([m.content for m in messages])
+        return (summary + "|" if summary else "") + ",".join(
+            m.content[:2] for m in messages
+        )
+
+    manager._fold = fold
+    return manager
+
+
+async def test_short_history_is_kept_verbatim():
+    folds = []
+    messages = _turns(2)
+    assert await _manager(1000, folds).compact(messages) == messages
+    assert folds == []
+
+
+async def test_old_turns_are_summarized_when_over_budget():
+    folds = []
+    manager = _manager(token_budget=60, folds=folds)
+    compacted = await manager.compact(_turns(4))
+
+    assert compacted[0].content == SUMMARY_MESSAGE_PREFIX + "q0,a0,q1,a1"
+    assert [m.content[:2] for m in compacted[1:]] == ["q2", "a2", "q3", "a3"]
+    assert manager.compactions == 1
+
+    # The next turn folds only the turn that left the window into that summary
+    compacted = await manager.compact(_turns(5))
+    assert compacted[0].content == SUMMARY_MESSAGE_PREFIX + "q0,a0,q1,a1|q2,a2"
+    assert [len(fold) for fold in folds] == [4, 2]
+
+
+async def test_summary_is_reused_for_the_same_prefix():
+    folds = []
+    manager = _manager(token_budget=60, folds=folds)
+    await manager.compact(_turns(4))
+    await manager.compact(_turns(4))
+    assert len(folds) == 1
+    assert manager.summaries_reused == 1
+
+
+async def test_fitting_history_is_summarized_in_the_background():
+    folds = []
+    manager = _manager(token_budget=200, folds=folds)
+    manager.keep_turns = 1
+    messages = _turns(3)
+    # Still fits the budget: nothing is dropped this turn
+    assert await manager.compact(messages) == messages
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert len(folds) == 1
+    # The next turn uses the summary built meanwhile
+    compacted = await manager.compact(messages)
+    assert compacted[0].content.startswith(SUMMARY_MESSAGE_PREFIX)
+
+
+async def test_background_summary_failure_is_counted():
+    manager = _manager(token_budget=200, folds=[])
+    manager.keep_turns = 1
+
+    async def fold(summary, messages):
+        raise RuntimeError("LLM unavailable")
+
+    manager._fold = fold
+    await manager.compact(_turns(3))
+    assert len(manager._background) == 1
+    await asyncio.gather(*manager._background, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert manager._background == set()
+    assert manager.failures == 1
@@ -0,0 +1,85 @@
+import pytest
+
+from wenshu.retrieval.metadata_index import (
+    DocumentFilter,
+    MetadataIndex,
+    normalize_date,
+)
+
+
+class _Node:
+    def __init__(self, ref_doc_id, metadata):
+        self.ref_doc_id = ref_doc_id
+        self.metadata = metadata
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MetadataIndex(tmp_path / "metadata.sqlite3")
+    index.add_nodes(
+        [
+            _Node(
+                "notice",
+                {
+                    "document_schema": "administrative_document",
+                    "document_type": "通知",
+                    "issuing_department": "中国人民大学教务处",
+                    "document_number": "人大发〔2024〕12号",
+                    "issue_date": "2024年3月5日",
+                },
+            ),
+            _Node(
+                "paper",
+                {
+                    "document_schema": "academic_paper",
+                    "title": "检索增强生成",
+                    "authors": ["张三", "李四"],
+                    "publication_date": "2023-09",
+                },
+            ),
+            # Written before document_schema was recorded, without a date
+            _Node("minutes", {"meeting_title": "院务会", "participants": ["王五"]}),
+        ]
+    )
+    return index
+
+
+def test_normalize_date():
+    assert normalize_date("2024年3月5日") == "2024-03-05"
+    assert normalize_date("2024.3") == "2024-03"
+    assert normalize_date("无") is None
+
+
+def test_parse_filter_department_type_and_year(index):
+    doc_filter = index.parse_filter("2024年教务处的通知")
+    assert doc_filter.year == 2024
+    assert doc_filter.issuing_departments == ["中国人民大学教务处"]
+    assert doc_filter.document_type == "通知"
+
+
+def test_parse_filter_ignores_years_in_document_numbers(index):
+    assert index.parse_filter("人大发〔2024〕12号讲了什么").year is None
+    assert index.parse_filter("2023-2024 学年的安排").year is None
+
+
+def test_parse_filter_schema_keyword_and_person(index):
+    doc_filter = index.parse_filter("张三写的论文")
+    assert doc_filter.document_schema == "academic_paper"
+    assert doc_filter.person == "张三"
+
+
+def test_parse_filter_only_uses_known_values(index):
+    assert index.parse_filter("图书馆的公告").is_empty()
+
+
+def test_candidate_doc_ids(index):
+    assert index.candidate_doc_ids(DocumentFilter(person="李四")) == ["paper"]
+    # Documents without a date stay candidates of a year filter
+    assert sorted(index.candidate_doc_ids(DocumentFilter(year=2024))) == [
+        "minutes",
+        "notice",
+    ]
+    # The legacy node's schema is inferred from its fields
+    assert index.candidate_doc_ids(
+        DocumentFilter(document_schema="meeting_minutes")
+    ) == ["minutes"]
@@ -0,0 +1,38 @@
+from wenshu.agents import researcher
+from wenshu.agents.context import RequestContext, request_scope
+from wenshu.retrieval.result_cache import chunk_retrieval_cache
+
+
+async def test_results_are_cached_per_index_version(monkeypatch):
+    calls = []
+
+    async def retrieve_nodes(search_query, index, doc_ids):
+        calls.append(index)
+        return [index]
+
+    monkeypatch.setattr(researcher, "retrieve_nodes", retrieve_nodes)
+    monkeypatch.setattr(researcher.RetrievalConfig, "HIERARCHICAL_ENABLED", False)
+    chunk_retrieval_cache.clear()
+
+    def request(index, version):
+        context = RequestContext(user_query="考试安排")
+        context.index, context.index_version = index, version
+        return context
+
+    with request_scope(request("old", 1)):
+        assert await researcher._retrieve_from_documents("考试安排", "old", None) == [
+            "old"
+        ]
+    # A request on the reloaded index doesn't get the old snapshot's results
+    with request_scope(request("new", 2)):
+        assert await researcher._retrieve_from_documents("考试安排", "new", None) == [
+            "new"
+        ]
+    with request_scope(request("new", 2)):
+        await researcher._retrieve_from_documents("考试安排", "new", None)
+    assert calls == ["old", "new"]
+
+    # Outside a request the version is unknown: nothing is cached
+    await researcher._retrieve_from_documents("考试安排", "new", None)
+    assert calls == ["old", "new", "new"]
+    chunk_retrieval_cache.clear()
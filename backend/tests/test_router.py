@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+from typing import List
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from wenshu.agents import fast_path
+from wenshu.agents.researcher import RetrievedContext
+from wenshu.agents.router import QueryRouter, Route
+
+KEYWORDS = ["你好", "时间", "比较"]
+
+
+class _KeywordEmbedding(BaseEmbedding):
+    """One dimension per keyword the text contains"""
+
+    def _embed(self, text: str) -> List[float]:
+        return [float(word in text) for word in KEYWORDS] + [0.01]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _router() -> QueryRouter:
+    return QueryRouter(
+        examples={
+            Route.DIRECT: ["你好呀"],
+            Route.SINGLE_SHOT: ["开学时间"],
+            Route.RESEARCH: ["比较两年的政策"],
+        }
+    )
+
+
+async def test_embedding_stage_never_answers_directly(monkeypatch):
+    monkeypatch.setattr(Settings, "_embed_model", _KeywordEmbedding())
+    router = _router()
+    # Nearest to the small-talk example, but only the rules skip retrieval
+    assert await router.classify_by_embedding("你好，请问校长是谁") is None
+    decision = await router.classify_by_embedding("报到时间")
+    assert decision.route == Route.SINGLE_SHOT
+
+
+async def test_rules_still_route_small_talk_directly():
+    decision = await _router().route("你好", [])
+    assert (decision.route, decision.method) == (Route.DIRECT, "rule")
+
+
+def _retrieved(scores: List[float]) -> RetrievedContext:
+    nodes = [NodeWithScore(node=TextNode(text="通知"), score=s) for s in scores]
+    return RetrievedContext(nodes, "通知", [1.0, 0.0], None, [])
+
+
+async def test_single_shot_without_stored_embeddings_checks_retriever_scores(
+    monkeypatch,
+):
+    async def retrieve_context(queries, index):
+        return retrieved
+
+    monkeypatch.setattr(fast_path, "retrieve_context", retrieve_context)
+    monkeypatch.setattr(fast_path.RetrievalConfig, "HYBRID_ENABLED", False)
+    monkeypatch.setattr(fast_path.ChatConfig, "ROUTER_SINGLE_SHOT_MIN_SCORE", 0.5)
+
+    retrieved = _retrieved([0.3, 0.8])
+    assert await fast_path.single_shot_retrieve("开学时间", None) == (retrieved, 0.8)
+    retrieved = _retrieved([0.3])
+    assert await fast_path.single_shot_retrieve("开学时间", None) == (None, 0.3)
+
+    # Fused hybrid scores can't be checked: the research loop takes over
+    monkeypatch.setattr(fast_path.RetrievalConfig, "HYBRID_ENABLED", True)
+    monkeypatch.setattr(fast_path, "sparse_index", SimpleNamespace(size=1))
+    retrieved = _retrieved([1.0])
+    assert await fast_path.single_shot_retrieve("开学时间", None) == (None, None)
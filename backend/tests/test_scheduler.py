@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from wenshu.services.scheduler import RequestScheduler, WorkloadClass, WorkloadLimits
+
+
+def _scheduler(total_slots=2, chat_reserved_slots=1, chat_concurrency=2, max_queue=1):
+    return RequestScheduler(
+        total_slots=total_slots,
+        chat_reserved_slots=chat_reserved_slots,
+        limits={
+            WorkloadClass.CHAT: WorkloadLimits(
+                priority=0,
+                max_concurrency=chat_concurrency,
+                max_queue=max_queue,
+                max_wait=1.0,
+            ),
+            WorkloadClass.INGESTION: WorkloadLimits(
+                priority=2, max_concurrency=2, max_queue=1, max_wait=0.05
+            ),
+        },
+    )
+
+
+async def test_reserved_slot_is_kept_for_chat():
+    scheduler = _scheduler()
+    await scheduler.acquire(WorkloadClass.INGESTION)
+    # The second slot is reserved: ingestion waits, then gets shed
+    with pytest.raises(HTTPException) as error:
+        await scheduler.acquire(WorkloadClass.INGESTION)
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+    # Chat still gets the reserved slot at once
+    await asyncio.wait_for(scheduler.acquire(WorkloadClass.CHAT), 0.1)
+
+
+async def test_full_queue_is_shed_with_429():
+    scheduler = _scheduler(total_slots=1, chat_reserved_slots=0)
+    await scheduler.acquire(WorkloadClass.CHAT)
+    waiter = asyncio.create_task(scheduler.acquire(WorkloadClass.CHAT))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as error:
+        await scheduler.acquire(WorkloadClass.CHAT)
+    assert error.value.status_code == 429
+    assert "queue is full" in error.value.detail
+
+    # A released slot goes to the queued request
+    scheduler.release(WorkloadClass.CHAT, held=3.0)
+    await asyncio.wait_for(waiter, 0.1)
+    metrics = scheduler.metrics()
+    assert metrics["slots_in_use"] == 1
+
+
+async def test_slot_is_released_when_the_block_ends():
+    scheduler = _scheduler()
+    async with scheduler.slot(WorkloadClass.CHAT):
+        assert scheduler.metrics()["slots_in_use"] == 1
+    assert scheduler.metrics()["slots_in_use"] == 0
+
+
+async def test_lease_release_is_idempotent():
+    scheduler = _scheduler()
+    lease = await scheduler.lease(WorkloadClass.CHAT)
+    lease.release()
+    lease.release()
+    assert scheduler.metrics()["slots_in_use"] == 0
+
+
+def test_retry_after_survives_zero_concurrency():
+    scheduler = _scheduler(chat_concurrency=0)
+    assert scheduler.retry_after(WorkloadClass.CHAT) >= 1
@@ -0,0 +1,57 @@
+from wenshu.retrieval.metadata_index import DocumentFilter
+from wenshu.retrieval.sharding import ShardedRetriever, ShardRouter
+
+
+class _Sharded:
+    """The parts of ShardedIndex the query plan reads"""
+
+    def __init__(self, documents):
+        self.documents = documents  # shard key -> ref doc ids
+        self.shards = {key: object() for key in documents}
+
+    def shard_of(self, ref_doc_id):
+        return next(
+            (k for k, docs in self.documents.items() if ref_doc_id in docs), None
+        )
+
+    def document_count(self, key):
+        return len(self.documents[key])
+
+
+SHARDED = _Sharded(
+    {
+        "academic_paper": ["p1", "p2"],
+        "administrative_document": ["a1", "a2", "a3"],
+        "meeting_minutes": ["m1"],
+    }
+)
+
+
+def test_shard_plan_without_doc_ids_searches_every_shard():
+    plan = ShardedRetriever(SHARDED, 5)._shard_plan()
+    assert plan == {key: None for key in SHARDED.shards}
+
+
+def test_shard_plan_restricts_to_the_shards_of_the_doc_ids():
+    plan = ShardedRetriever(
+        SHARDED, 5, doc_ids=["a1", "a3", "p1", "p2", "unknown"]
+    )._shard_plan()
+    # Part of a shard keeps its row filter, a whole shard is scanned without one
+    assert plan == {"administrative_document": ["a1", "a3"], "academic_paper": None}
+
+
+def test_shard_plan_with_no_matching_documents_is_empty():
+    assert ShardedRetriever(SHARDED, 5, doc_ids=[])._shard_plan() == {}
+
+
+def test_router_routes_only_explicit_targets():
+    router = ShardRouter("document_schema")
+    keys = ["academic_paper", "administrative_document"]
+    assert router.route("有哪些论文", keys) == ["academic_paper"]
+    assert router.route(
+        "最近的安排", keys, DocumentFilter(document_schema="administrative_document")
+    ) == ["administrative_document"]
+    # A schema without a shard, or no target at all, searches everything
+    assert router.route("会议纪要", keys) is None
+    assert router.route("academic_paper 是什么", keys) is None
+    assert router.metrics() == {"routed": 2, "fanned_out": 2, "fallbacks": 0}
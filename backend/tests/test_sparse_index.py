@@ -0,0 +1,87 @@
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from wenshu.retrieval.hybrid import reciprocal_rank_fusion
+from wenshu.retrieval.sparse_index import SparseIndex, _Segment, tokenize
+
+
+def _node(node_id: str, ref_doc_id: str, text: str) -> TextNode:
+    return TextNode(
+        id_=node_id,
+        text=text,
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)},
+    )
+
+
+def test_tokenize_mixes_cjk_bigrams_and_words():
+    assert sorted(tokenize("人大发〔2024〕12号")) == sorted(
+        ["人", "大", "发", "人大", "大发", "号", "2024", "12"]
+    )
+
+
+def test_segment_delta_encoding_round_trip(tmp_path):
+    docs = [
+        (f"n{i}", f"d{i % 3}", tokenize(text))
+        for i, text in enumerate(
+            [
+                "教务处 通知",
+                "研究生院 通知 通知",
+                "教务处 考试 安排",
+                "考试 通知",
+                "学院",
+            ]
+        )
+    ]
+    segment = _Segment.build(docs)
+    segment.save(tmp_path, "seg_000000")
+
+    # Stored doc numbers are gaps within each postings list, not absolute
+    with np.load(tmp_path / "seg_000000.npz") as arrays:
+        deltas = arrays["deltas"]
+    assert deltas.sum() < segment.postings.sum()
+
+    loaded = _Segment.load(tmp_path, "seg_000000")
+    np.testing.assert_array_equal(loaded.offsets, segment.offsets)
+    np.testing.assert_array_equal(loaded.postings, segment.postings)
+    np.testing.assert_array_equal(loaded.tfs, segment.tfs)
+    assert loaded.terms == segment.terms
+    assert loaded.node_ids == segment.node_ids
+
+
+def test_sparse_index_persist_and_load_keep_results(tmp_path):
+    index = SparseIndex(tmp_path)
+    index.add(
+        [
+            _node("n1", "d1", "教务处关于考试安排的通知"),
+            _node("n2", "d2", "学院会议纪要"),
+        ]
+    )
+    index.add([_node("n3", "d3", "研究生院考试通知")])
+    index.delete("d2")
+    before = index.search("考试通知", top_k=5)
+    index.persist()
+
+    loaded = SparseIndex(tmp_path).load()
+    assert loaded.size == 2
+    assert loaded.search("考试通知", top_k=5) == before
+    assert loaded.search("会议纪要", top_k=5) == []
+
+
+def test_sparse_index_search_within_documents(tmp_path):
+    index = SparseIndex(tmp_path)
+    index.add([_node("n1", "d1", "考试通知"), _node("n2", "d2", "考试安排")])
+    assert [node_id for node_id, _ in index.search("考试", 5, doc_ids=["d2"])] == ["n2"]
+    assert index.search("考试", 5, doc_ids=[]) == []
+
+
+def test_reciprocal_rank_fusion_orders_and_scales():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["a", "c"]], k=60)
+    assert [node_id for node_id, _ in fused] == ["a", "c", "b"]
+    # First in every list scores exactly 1.0
+    assert fused[0][1] == 1.0
+    assert all(0 < score < 1 for _, score in fused[1:])
+
+
+def test_reciprocal_rank_fusion_single_list_keeps_order():
+    fused = reciprocal_rank_fusion([["x", "y", "z"]])
+    assert [node_id for node_id, _ in fused] == ["x", "y", "z"]
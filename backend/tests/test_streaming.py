@@ -0,0 +1,37 @@
+from wenshu.utils.streaming import TokenCoalescer
+
+
+def test_coalescer_buffers_until_the_window_passes():
+    coalescer = TokenCoalescer(window=0.04, max_bytes=1024)
+    assert coalescer.deadline() is None
+    assert not coalescer.add("你", now=10.0)
+    assert not coalescer.add("好", now=10.01)
+    # The window counts from the oldest buffered token
+    assert coalescer.deadline() == 10.04
+    assert coalescer.pending == 2
+    assert coalescer.flush() == "你好"
+    assert coalescer.pending == 0
+    assert coalescer.deadline() is None
+
+
+def test_coalescer_is_due_once_the_frame_is_full():
+    coalescer = TokenCoalescer(window=10.0, max_bytes=6)
+    assert not coalescer.add("ab", now=0.0)
+    # "你" is 3 bytes in UTF-8: 2 + 3 < 6, then 2 + 3 + 3 >= 6
+    assert not coalescer.add("你", now=0.0)
+    assert coalescer.add("好", now=0.0)
+    assert coalescer.flush() == "ab你好"
+
+
+def test_coalescer_without_window_sends_every_token():
+    coalescer = TokenCoalescer(window=0.0)
+    assert coalescer.add("a", now=0.0)
+    assert coalescer.flush() == "a"
+
+
+def test_coalescer_restarts_the_window_after_a_flush():
+    coalescer = TokenCoalescer(window=0.04)
+    coalescer.add("a", now=1.0)
+    coalescer.flush()
+    coalescer.add("b", now=5.0)
+    assert coalescer.deadline() == 5.04
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from wenshu.services import sync_service
+from wenshu.services.sync_service import DocumentSyncService
+
+
+def _service(tmp_path, monkeypatch) -> DocumentSyncService:
+    monkeypatch.setattr(
+        sync_service.APIConfig, "STORAGE_DIR", str(tmp_path / "storage")
+    )
+    doc_processor = SimpleNamespace(
+        file_extractor={".txt": None},
+        spreadsheet_processor=SimpleNamespace(SUPPORTED_EXTENSIONS=[".csv"]),
+    )
+    return DocumentSyncService(doc_processor, documents_dir=str(tmp_path / "docs"))
+
+
+def test_compute_changes(tmp_path, monkeypatch):
+    service = _service(tmp_path, monkeypatch)
+    (tmp_path / "docs" / "sub").mkdir(parents=True)
+    (tmp_path / "docs" / "a.txt").write_text("a")
+    (tmp_path / "docs" / "sub" / "b.csv").write_text("b")
+    (tmp_path / "docs" / "~$lock.txt").write_text("")
+    service.manifest["gone.txt"] = {"mtime_ns": 0, "size": 0, "sha256": ""}
+
+    changes = service.compute_changes()
+    assert changes.added == ["a.txt", "sub/b.csv"]
+    assert changes.modified == []
+    assert changes.deleted == ["gone.txt"]
+
+
+def test_file_removed_during_the_scan_counts_as_deleted(tmp_path, monkeypatch):
+    service = _service(tmp_path, monkeypatch)
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "a.txt").write_text("changed")
+    service.manifest["a.txt"] = {"mtime_ns": 0, "size": 0, "sha256": ""}
+
+    def removed(file_path):
+        raise FileNotFoundError(file_path)
+
+    monkeypatch.setattr(sync_service, "_file_sha256", removed)
+    changes = service.compute_changes()
+    assert changes.modified == []
+    assert changes.deleted == ["a.txt"]
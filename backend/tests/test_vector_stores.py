@@ -0,0 +1,46 @@
+import numpy as np
+
+from wenshu.vector_stores.matrix import EmbeddingMatrix, normalize_rows
+
+
+def _matrix(directory) -> EmbeddingMatrix:
+    matrix = EmbeddingMatrix(directory)
+    vectors = normalize_rows([[3.0, 0.0], [0.0, 2.0], [1.0, 1.0]])
+    matrix.append(["n1", "n2", "n3"], ["d1", "d1", "d2"], vectors)
+    return matrix
+
+
+def test_get_returns_the_stored_rows(tmp_path):
+    matrix = _matrix(tmp_path)
+    embeddings = matrix.get(["n1", "n3", "unknown"])
+    np.testing.assert_allclose(embeddings[0], [1.0, 0.0])
+    np.testing.assert_allclose(embeddings[1], [0.70710677, 0.70710677], rtol=1e-6)
+    # Unknown ids come back as zero rows
+    assert not embeddings[2].any()
+
+
+def test_rows_for_node_and_doc_ids(tmp_path):
+    matrix = _matrix(tmp_path)
+    assert matrix.rows_for(["n3", "n1"]).tolist() == [0, 2]
+    assert matrix.rows_for(doc_ids=["d1"]).tolist() == [0, 1]
+
+
+def test_delete_and_reload(tmp_path):
+    matrix = _matrix(tmp_path)
+    assert matrix.delete("d1") == [0, 1]
+    assert matrix.size == 1
+    matrix.flush(compact_ratio=1.0)
+
+    loaded = EmbeddingMatrix(tmp_path).load()
+    assert loaded.size == 1
+    assert loaded.rows_for(doc_ids=["d2"]).tolist() == [2]
+    np.testing.assert_allclose(loaded.get(["n3"]), matrix.get(["n3"]))
+
+
+def test_rows_for_narrows_node_ids_by_doc_ids(tmp_path):
+    matrix = _matrix(tmp_path)
+    all_nodes = ["n1", "n2", "n3"]
+    # as_retriever() passes every node id: doc_ids must still restrict them
+    assert matrix.rows_for(all_nodes, doc_ids=["d2"]).tolist() == [2]
+    assert matrix.rows_for(["n1"], doc_ids=["d1"]).tolist() == [0]
+    assert matrix.rows_for(all_nodes, doc_ids=[]).tolist() == []
@@ -10,15 +10,14 @@ __version__ = "0.1.0"
 __author__ = "RUC Information School"
 __email__ = "info@ruc.edu.cn"
 
+# from .agents.tools import create_agent
+from .agents.callbacks import StreamingCallbackHandler
 from .api.chat import setup_chat_routes
 from .api.documents import setup_document_routes
-from .config import APIConfig, init_settings, load_vector_index
+from .config import APIConfig, init_settings, load_knowledge_index, load_vector_index
 from .models.document_schemas import DOCUMENT_TYPE_REGISTRY
 from .processors.document_processor import DocumentProcessor
 
-# from .agents.tools import create_agent
-from .agents.callbacks import StreamingCallbackHandler
-
 # from .main import main
 
 __all__ = [
@@ -29,6 +28,7 @@ __all__ = [
     "setup_document_routes",
     "APIConfig",
     "init_settings",
+    "load_knowledge_index",
     "load_vector_index",
     "DOCUMENT_TYPE_REGISTRY",
     "DocumentProcessor",
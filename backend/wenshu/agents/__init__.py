@@ -2,7 +2,31 @@
 AI agents and tools
 """
 
+from .budget import BudgetGuard, RequestBudget, budget_guard
 from .callbacks import StreamingCallbackHandler
+from .context import RequestContext, current_request, request_scope
+from .events import EventBus, EventChannel, event_bus
+from .pool import AgentPool
+from .prefetch import SpeculativePrefetcher, speculative_prefetcher
+from .router import QueryRouter, Route, query_router
 from .tools import create_agent
 
-__all__ = ["StreamingCallbackHandler", "create_agent"]
+__all__ = [
+    "AgentPool",
+    "BudgetGuard",
+    "EventBus",
+    "EventChannel",
+    "QueryRouter",
+    "RequestBudget",
+    "RequestContext",
+    "Route",
+    "SpeculativePrefetcher",
+    "StreamingCallbackHandler",
+    "budget_guard",
+    "create_agent",
+    "current_request",
+    "event_bus",
+    "query_router",
+    "request_scope",
+    "speculative_prefetcher",
+]
@@ -0,0 +1,170 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.utils import get_tokenizer
+
+from ..config import ChatConfig
+from .context import RequestContext
+
+BUDGET_EXHAUSTED_INSTRUCTION = """
+The research budget of this request is spent ({reason}). Do not call any more tools. Answer now from the findings gathered so far, starting with "Thought: I can answer without using any more tools." followed by "Answer:". Tell the user briefly that the answer is based on partial research and may be incomplete.
+"""
+
+
+@dataclass
+class RequestBudget:
+    """Limits of one chat request; 0 disables a limit."""
+
+    deadline_seconds: float = 90.0
+    max_research_steps: int = 4
+    max_prompt_tokens: int = 60000
+    # How long after the deadline the agent may take to start its answer
+    # before it is stopped and the answer is synthesized from the findings
+    synthesis_grace_seconds: float = 30.0
+
+    @classmethod
+    def from_config(cls) -> "RequestBudget":
+        return cls(
+            deadline_seconds=ChatConfig.REQUEST_DEADLINE_SECONDS,
+            max_research_steps=ChatConfig.REQUEST_MAX_RESEARCH_STEPS,
+            max_prompt_tokens=ChatConfig.REQUEST_MAX_PROMPT_TOKENS,
+            synthesis_grace_seconds=ChatConfig.REQUEST_SYNTHESIS_GRACE_SECONDS,
+        )
+
+
+class BudgetGuard:
+    """
+    Enforces the per-request budgets: wall-clock deadline, researcher calls
+    and LLM prompt tokens (the new part of each agent turn's prompt, and
+    every research evaluation).
+
+    The researcher checks the budget before and after each step and, once
+    it's spent, stops searching and hands the agent everything found so
+    far as a sufficient result; the agent's prompt formatter adds an
+    instruction to answer now. The stream stops an agent that is still
+    reasoning past the deadline's grace period and synthesizes the answer
+    from the findings itself.
+    """
+
+    def __init__(self, default: Optional[RequestBudget] = None):
+        self.default = default or RequestBudget()
+        self._tokenizer = get_tokenizer()
+        self.exhausted: Dict[str, int] = {}
+        self.hard_stops = 0
+
+    def budget(self, context: RequestContext) -> RequestBudget:
+        return context.budget or self.default
+
+    def charge(self, context: RequestContext, prompt) -> int:
+        """Adds the tokens of a prompt (text or chat messages) to the request's spend."""
+        if isinstance(prompt, str):
+            texts = [prompt]
+        else:
+            texts = [m.content or "" for m in prompt]
+        tokens = sum(len(self._tokenizer(text)) for text in texts)
+        context.prompt_tokens += tokens
+        return tokens
+
+    def check(self, context: RequestContext, count_steps: bool = True) -> Optional[str]:
+        """
+        Why the request's budget is spent, or None while it isn't; the first
+        reason sticks. The step limit only matters where another research
+        step is wanted (count_steps); reaching it with a sufficient step
+        leaves nothing unfinished.
+        """
+        if context.budget_exhausted:
+            return context.budget_exhausted
+        budget = self.budget(context)
+        kind = reason = None
+        elapsed = time.monotonic() - context.started_at
+        if budget.deadline_seconds and elapsed >= budget.deadline_seconds:
+            kind, reason = (
+                "deadline",
+                f"deadline of {budget.deadline_seconds:g}s reached",
+            )
+        elif (
+            count_steps
+            and budget.max_research_steps
+            and context.research_steps >= budget.max_research_steps
+        ):
+            kind, reason = (
+                "research_steps",
+                f"{budget.max_research_steps} research steps done",
+            )
+        elif (
+            budget.max_prompt_tokens
+            and context.prompt_tokens >= budget.max_prompt_tokens
+        ):
+            kind, reason = (
+                "prompt_tokens",
+                f"{budget.max_prompt_tokens} prompt tokens used",
+            )
+        if reason:
+            context.budget_exhausted = reason
+            self.exhausted[kind] = self.exhausted.get(kind, 0) + 1
+            print(f"⏱️ Budget of request {context.request_id} exhausted: {reason}")
+        return reason
+
+    def hard_stop(self, context: RequestContext) -> None:
+        """The stream stopped the agent past the deadline's grace period."""
+        self.check(context)
+        self.hard_stops += 1
+        print(
+            f"⏱️ Stopped the agent of request {context.request_id}; answering from its findings"
+        )
+
+    def hard_deadline(self, context: RequestContext) -> Optional[float]:
+        """Monotonic time at which a still-reasoning agent is stopped, or None"""
+        budget = self.budget(context)
+        if not budget.deadline_seconds:
+            return None
+        return (
+            context.started_at
+            + budget.deadline_seconds
+            + budget.synthesis_grace_seconds
+        )
+
+    def findings_so_far(self, context: RequestContext) -> str:
+        if not context.findings:
+            return (
+                "No relevant information was found before the research budget ran out."
+            )
+        return "\n\n".join(
+            f"Findings of research step {i}:\n{finding}"
+            for i, finding in enumerate(context.findings, start=1)
+        )
+
+    def answer_now_message(self, context: RequestContext) -> ChatMessage:
+        return ChatMessage(
+            role=MessageRole.USER,
+            content=BUDGET_EXHAUSTED_INSTRUCTION.format(
+                reason=context.budget_exhausted
+            ),
+        )
+
+    def usage(self, context: RequestContext) -> Dict[str, object]:
+        """What the request spent, for the SSE announcement"""
+        return {
+            "reason": context.budget_exhausted,
+            "elapsed_ms": round(1000 * (time.monotonic() - context.started_at)),
+            "research_steps": context.research_steps,
+            "prompt_tokens": context.prompt_tokens,
+        }
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "limits": {
+                "deadline_seconds": self.default.deadline_seconds,
+                "max_research_steps": self.default.max_research_steps,
+                "max_prompt_tokens": self.default.max_prompt_tokens,
+                "synthesis_grace_seconds": self.default.synthesis_grace_seconds,
+            },
+            "exhausted": dict(self.exhausted),
+            "hard_stops": self.hard_stops,
+        }
+
+
+# Create a single instance of the guard to be used across the application
+budget_guard = BudgetGuard(RequestBudget.from_config())
@@ -1,14 +1,20 @@
-import asyncio
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 
 from llama_index.core.callbacks.base_handler import BaseCallbackHandler
-from llama_index.core.callbacks.schema import EventPayload, CBEventType
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+
+from .events import EventBus, event_bus
 
 
 class StreamingCallbackHandler(BaseCallbackHandler):
-    """Custom callback handler for capturing Agent intermediate steps, including thoughts."""
+    """
+    Custom callback handler for capturing Agent intermediate steps, including thoughts.
+
+    One handler serves every agent; events go through the event bus to the
+    SSE stream of the request that produced them.
+    """
 
-    def __init__(self):
+    def __init__(self, bus: EventBus = event_bus):
         # We listen to specific events and ignore the rest to reduce noise.
         super().__init__(
             event_starts_to_ignore=[
@@ -30,12 +36,13 @@ class StreamingCallbackHandler(BaseCallbackHandler):
                 CBEventType.TREE,
             ],
         )
-        self.step_queue = asyncio.Queue()
-        self.tool_name: str = ""
+        self.event_bus = bus
+        # Tool name of each running function call, by callback event id
+        self._tool_names: Dict[str, str] = {}
 
     def _push_to_queue(self, event_data: dict):
-        """Helper to push event data to the queue."""
-        asyncio.create_task(self.step_queue.put(event_data))
+        """Helper to publish event data to the current request's channel."""
+        self.event_bus.publish(event_data)
 
     def on_event_start(
         self,
@@ -48,12 +55,13 @@ class StreamingCallbackHandler(BaseCallbackHandler):
         """Handle event starts, specifically for function calls."""
         if event_type == CBEventType.FUNCTION_CALL and payload:
             tool_metadata = payload.get(EventPayload.TOOL)
-            self.tool_name = getattr(tool_metadata, "name", "Unknown")
+            tool_name = getattr(tool_metadata, "name", "Unknown")
+            self._tool_names[event_id] = tool_name
             arguments = payload.get(EventPayload.FUNCTION_CALL, {})
             self._push_to_queue(
                 {
                     "type": "tool_call_start",
-                    "data": {"tool_name": self.tool_name, "arguments": arguments},
+                    "data": {"tool_name": tool_name, "arguments": arguments},
                 }
             )
         return event_id
@@ -81,12 +89,11 @@ class StreamingCallbackHandler(BaseCallbackHandler):
                 {
                     "type": "tool_call_end",
                     "data": {
-                        "tool_name": self.tool_name,
+                        "tool_name": self._tool_names.pop(event_id, ""),
                         "result": response_str,
                     },
                 }
             )
-            self.tool_name = ""  # Reset after use
 
     # The methods below are required by the base class but not used in this implementation.
     def start_trace(self, trace_id: Optional[str] = None) -> None:
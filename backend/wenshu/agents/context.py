@@ -0,0 +1,80 @@
+import asyncio
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from .budget import RequestBudget
+
+
+@dataclass
+class RequestContext:
+    """
+    State of one chat request: the original user query, the index it
+    searches, the retrieval results already computed for it and the
+    research budget spent so far.
+
+    The stream activates the context in the agent's task, so the (shared)
+    researcher tool and everything it calls read the state of their own
+    request; concurrent chats in one worker never see each other's query
+    or results.
+    """
+
+    user_query: str
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    # When the request arrived; latencies (time to first token) count from here
+    started_at: float = field(default_factory=time.monotonic)
+    # How the query router decided to serve the request (Route value)
+    route: Optional[str] = None
+    # Index snapshot taken when the request starts; a reload mid-request
+    # doesn't switch it under the research loop
+    index: Any = None
+    # Version of that snapshot; shared retrieval results are cached per version
+    index_version: int = 0
+    # Nodes retrieved during this request, keyed like the shared result cache.
+    # Unlike the shared cache this is never evicted or cleared by a commit,
+    # so every research step of a request sees the same results for a query
+    retrieved: Dict[Hashable, Any] = field(default_factory=dict)
+    # Background retrievals of the suggested next queries, by query and filter
+    prefetches: Dict[Hashable, asyncio.Task] = field(default_factory=dict)
+    # Budget accounting; limits default to the configured RequestBudget
+    budget: Optional["RequestBudget"] = None
+    research_steps: int = 0
+    context_tokens: int = 0
+    prompt_tokens: int = 0
+    # Leading agent prompt messages already charged (the ReAct prompt only grows)
+    charged_agent_messages: int = 0
+    # Summary of each research step, for answering when the budget runs out
+    findings: List[str] = field(default_factory=list)
+    budget_exhausted: Optional[str] = None
+
+    def close(self) -> None:
+        """Drops the per-request results once the response is finished."""
+        for task in self.prefetches.values():
+            task.cancel()
+        self.prefetches.clear()
+        self.retrieved.clear()
+        self.index = None
+
+
+_current_request: ContextVar[Optional[RequestContext]] = ContextVar(
+    "current_request", default=None
+)
+
+
+def current_request() -> Optional[RequestContext]:
+    """The context of the request being served by this task, if any."""
+    return _current_request.get()
+
+
+@contextmanager
+def request_scope(context: RequestContext) -> Iterator[RequestContext]:
+    """Makes context the current request for the enclosed code (and tasks it spawns)."""
+    token = _current_request.set(context)
+    try:
+        yield context
+    finally:
+        _current_request.reset(token)
@@ -0,0 +1,149 @@
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ..config import SchedulerConfig
+from .context import current_request
+
+# Events that are only informative; dropped first when a channel overflows
+_DROPPABLE_EVENTS = ("thought",)
+
+
+class EventChannel:
+    """
+    Bounded buffer of the agent step events of one chat request.
+
+    The agent's callbacks publish synchronously, so they can't wait for the
+    SSE stream to catch up. A full channel drops its oldest thought (or
+    oldest event) instead of growing, and the researcher tool waits on
+    `wait_writable` before each research step. A slow client slows down its
+    own agent, never the other chats of the worker.
+    """
+
+    def __init__(self, request_id: str, max_events: int = 64):
+        self.request_id = request_id
+        self.max_events = max_events
+        self.dropped = 0
+        self.closed = False
+        self._events: Deque[dict] = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+
+    def publish(self, event: dict) -> None:
+        """Adds an event; safe to call from threads other than the stream's loop."""
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop or self._loop is None:
+            self._publish(event)
+        else:
+            self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: dict) -> None:
+        if self.closed:
+            return
+        if len(self._events) >= self.max_events:
+            victim = next(
+                (
+                    i
+                    for i, e in enumerate(self._events)
+                    if e.get("type") in _DROPPABLE_EVENTS
+                ),
+                0,
+            )
+            del self._events[victim]
+            self.dropped += 1
+        self._events.append(event)
+        self._readable.set()
+        if len(self._events) >= self.max_events:
+            self._writable.clear()
+
+    async def get(self) -> dict:
+        """Next event, waiting until one is published."""
+        while not self._events:
+            self._readable.clear()
+            await self._readable.wait()
+        event = self._events.popleft()
+        if len(self._events) < self.max_events:
+            self._writable.set()
+        return event
+
+    def drain(self) -> List[dict]:
+        """Takes every buffered event without waiting."""
+        events = list(self._events)
+        self._events.clear()
+        self._writable.set()
+        return events
+
+    async def wait_writable(self) -> None:
+        """Waits until the stream has consumed enough of the buffer."""
+        await self._writable.wait()
+
+    def close(self) -> None:
+        self.closed = True
+        self._events.clear()
+        # Release a producer waiting on a stream that went away
+        self._writable.set()
+
+
+class EventBus:
+    """
+    Routes agent step events to the channel of the request that produced
+    them. The request is identified by the RequestContext active in the
+    agent's task, so each SSE stream only sees its own agent's events.
+    """
+
+    def __init__(self, max_events: int = 64):
+        self.max_events = max_events
+        self._channels: Dict[str, EventChannel] = {}
+        self.published = 0
+        self.unrouted = 0
+        self.dropped = 0
+
+    def open(self, request_id: str) -> EventChannel:
+        channel = EventChannel(request_id, self.max_events)
+        self._channels[request_id] = channel
+        return channel
+
+    def close(self, request_id: str) -> None:
+        channel = self._channels.pop(request_id, None)
+        if channel is not None:
+            self.dropped += channel.dropped
+            channel.close()
+
+    def channel(self, request_id: str) -> Optional[EventChannel]:
+        return self._channels.get(request_id)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Publishes to the current request's channel; events of no open request are discarded."""
+        context = current_request()
+        channel = self._channels.get(context.request_id) if context else None
+        if channel is None:
+            self.unrouted += 1
+            return
+        self.published += 1
+        channel.publish(event)
+
+    async def wait_writable(self, request_id: str) -> None:
+        channel = self._channels.get(request_id)
+        if channel is not None:
+            await channel.wait_writable()
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "open_channels": len(self._channels),
+            "published": self.published,
+            "unrouted": self.unrouted,
+            "dropped": self.dropped + sum(c.dropped for c in self._channels.values()),
+        }
+
+
+# Create a single instance of the bus to be used across the application
+event_bus = EventBus(max_events=SchedulerConfig.CHAT_EVENT_BUFFER)
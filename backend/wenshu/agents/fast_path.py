@@ -0,0 +1,124 @@
+import re
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from ..config import ChatConfig, RetrievalConfig
+from ..retrieval import early_exit_policy, sparse_index
+from .researcher import RetrievedContext, retrieve_context
+
+DIRECT_SYSTEM_PROMPT = """
+You are the assistant of a document knowledge base (notices, papers, meeting minutes and other institutional documents). Users ask you questions about these documents; you find the answers by searching them.
+
+The current message needs no search: it is small talk or about you. Reply briefly and naturally in the user's language. Never state facts about documents, dates, people or policies in this reply; if the user wants such information, invite them to ask their question.
+"""
+
+SINGLE_SHOT_PROMPT_TEMPLATE = """
+Answer the user's question using only the document excerpts below.
+
+**Document Excerpts:**
+---------------------
+{context_str}
+---------------------
+
+**Question:**
+{query}
+
+Answer in the language of the question. Be direct and precise: quote the relevant figures, dates, names and document titles. If the excerpts don't contain the answer, say so plainly instead of guessing.
+"""
+
+
+BEST_EFFORT_PROMPT_TEMPLATE = """
+The research on the user's question was stopped before it finished ({reason}). Answer it as well as possible using only the findings gathered so far.
+
+**Findings:**
+---------------------
+{findings}
+---------------------
+
+**Question:**
+{query}
+
+Answer in the language of the question. Start by saying briefly that the research was cut short and the answer may be incomplete; then give what the findings support and name what is still open. Do not guess beyond the findings.
+"""
+
+# Ways an answer says the excerpts don't answer the question
+_REFUSAL = re.compile(
+    r"(未|没有|没)(找到|提及|提到|包含|涉及|说明)|找不到|无法(回答|确定|找到)|不包含|没有相关"
+    r"|(do not|don't|does not|doesn't) (contain|mention|include)|not mentioned"
+    r"|no (relevant )?information|(cannot|can't|could not|couldn't) (answer|find)",
+    re.IGNORECASE,
+)
+
+
+def is_refusal(answer: str) -> bool:
+    """Whether an answer says the documents don't answer the question"""
+    return bool(_REFUSAL.search(answer))
+
+
+def direct_messages(query: str, chat_history: List[ChatMessage]) -> List[ChatMessage]:
+    return (
+        [ChatMessage(role=MessageRole.SYSTEM, content=DIRECT_SYSTEM_PROMPT)]
+        + chat_history
+        + [ChatMessage(role=MessageRole.USER, content=query)]
+    )
+
+
+def single_shot_messages(
+    query: str, chat_history: List[ChatMessage], retrieved: RetrievedContext
+) -> List[ChatMessage]:
+    prompt = SINGLE_SHOT_PROMPT_TEMPLATE.format(
+        context_str=retrieved.context_str, query=query
+    )
+    return chat_history + [ChatMessage(role=MessageRole.USER, content=prompt)]
+
+
+def best_effort_messages(
+    query: str, chat_history: List[ChatMessage], findings: str, reason: str
+) -> List[ChatMessage]:
+    prompt = BEST_EFFORT_PROMPT_TEMPLATE.format(
+        reason=reason, findings=findings, query=query
+    )
+    return chat_history + [ChatMessage(role=MessageRole.USER, content=prompt)]
+
+
+async def single_shot_retrieve(
+    query: str, index
+) -> Tuple[Optional[RetrievedContext], Optional[float]]:
+    """
+    The one retrieval of a single-shot answer and its confidence: the top
+    dense cosine, from the stored embeddings or, for a store that keeps
+    none, from the dense retriever's own scores.
+    The retrieval is None when its best hit is too weak to answer from, or
+    when there is no dense score to check (the query then goes to the
+    research loop, whose first step finds these results in the request's
+    cache).
+    """
+    retrieved = await retrieve_context([query], index)
+    if retrieved is None:
+        return None, None
+    # Same dense confidence the early-exit policy uses
+    confidence = early_exit_policy.confidence(
+        retrieved.query_embedding, retrieved.embeddings
+    )
+    if confidence is not None:
+        top_score = confidence[0]
+    elif RetrievalConfig.HYBRID_ENABLED and sparse_index.size:
+        # Fused RRF scores rank the hits but say nothing about how close they are
+        print("🚦 Single-shot retrieval can't be checked without stored embeddings")
+        return None, None
+    else:
+        # Dense-only retrieval scores the nodes by cosine similarity
+        top_score = max(node.score or 0.0 for node in retrieved.nodes)
+    if top_score < ChatConfig.ROUTER_SINGLE_SHOT_MIN_SCORE:
+        print(f"🚦 Single-shot retrieval too weak (top score {top_score:.3f})")
+        return None, top_score
+    return retrieved, top_score
+
+
+async def stream_llm_answer(messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
+    """Answer tokens of one LLM call"""
+    async for chunk in await Settings.llm.astream_chat(messages):
+        if chunk.delta:
+            yield chunk.delta
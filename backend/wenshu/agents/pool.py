@@ -0,0 +1,57 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from llama_index.core.agent import ReActAgent
+
+
+class AgentPool:
+    """
+    Reusable ReAct agent runners.
+
+    A runner's per-chat state is its memory and task state; the tools,
+    prompt formatter, output parser and LLM it holds are immutable and
+    shared. So instead of building an agent per /chat, a runner is taken
+    from the pool, reset, and given back when the stream ends. The pool
+    grows on demand and keeps at most max_idle runners.
+    """
+
+    def __init__(self, factory: Callable[[], Optional[ReActAgent]], max_idle: int = 4):
+        self._factory = factory
+        self.max_idle = max_idle
+        self._idle: Deque[ReActAgent] = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self) -> Optional[ReActAgent]:
+        with self._lock:
+            agent = self._idle.pop() if self._idle else None
+        if agent is None:
+            agent = self._factory()
+            if agent is not None:
+                self.created += 1
+            return agent
+        # A cancelled stream may have left history or tasks behind
+        agent.reset()
+        self.reused += 1
+        return agent
+
+    def release(self, agent: Optional[ReActAgent]) -> None:
+        if agent is None:
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(agent)
+
+    def warm_up(self, count: int) -> None:
+        """Builds runners ahead of the first requests."""
+        for _ in range(max(0, min(count, self.max_idle) - len(self._idle))):
+            agent = self._factory()
+            if agent is None:
+                return
+            self.created += 1
+            self.release(agent)
+
+    def metrics(self) -> Dict[str, int]:
+        return {"idle": len(self._idle), "created": self.created, "reused": self.reused}
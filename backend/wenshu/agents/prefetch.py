@@ -0,0 +1,121 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from llama_index.core.schema import NodeWithScore
+
+from ..config import RetrievalConfig
+from ..retrieval import DocumentFilter
+from ..retrieval.embedding_cache import normalize_query
+from .context import RequestContext, current_request
+
+
+def prefetch_key(query: str, doc_filter: Optional[DocumentFilter]) -> Hashable:
+    described = doc_filter.describe() if doc_filter is not None else {}
+    return (
+        normalize_query(query),
+        tuple(sorted((key, str(value)) for key, value in described.items())),
+    )
+
+
+class SpeculativePrefetcher:
+    """
+    Retrieves a research step's suggested next queries while the agent is
+    still deciding on its next call.
+
+    An insufficient step returns suggestions the agent is told to search
+    next; their retrievals start in the background as soon as the step
+    returns, under the request's context. The next step takes the running
+    (or finished) retrieval of each of its queries instead of starting its
+    own, and the results land in the request's retrieval cache either way.
+    Prefetches of the request that are still running when it ends are
+    cancelled.
+    """
+
+    def __init__(self, enabled: bool = True, max_queries: int = 3):
+        self.enabled = enabled
+        self.max_queries = max_queries
+        self.started = 0
+        self.used = 0
+        self.unused = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def schedule(
+        self,
+        queries: List[str],
+        doc_filter: Optional[DocumentFilter],
+        retrieve: Callable[[str], Awaitable[List[NodeWithScore]]],
+    ) -> int:
+        """Starts retrieve(query) for each suggestion not yet fetched; returns how many started"""
+        context = current_request()
+        if not self.enabled or context is None:
+            return 0
+        started = 0
+        for query in queries[: self.max_queries]:
+            key = prefetch_key(query, doc_filter)
+            if not key[0] or key in context.prefetches:
+                continue
+            # The task copies the current context, so the results go to this request
+            context.prefetches[key] = asyncio.create_task(retrieve(query))
+            started += 1
+        self.started += started
+        if started:
+            print(f"🔮 Prefetching {started} suggested queries")
+        return started
+
+    async def take(
+        self, query: str, doc_filter: Optional[DocumentFilter]
+    ) -> Optional[List[NodeWithScore]]:
+        """The prefetched nodes of a query (waiting for them if still running), or None"""
+        context = current_request()
+        if context is None:
+            return None
+        task = context.prefetches.pop(prefetch_key(query, doc_filter), None)
+        if task is None:
+            return None
+        try:
+            nodes = await task
+        except asyncio.CancelledError:
+            # The step itself being cancelled propagates; a dropped prefetch doesn't
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+            return None
+        except Exception as e:
+            self.failed += 1
+            print(f"Warning: prefetch of '{query}' failed, retrieving again: {e}")
+            return None
+        self.used += 1
+        return nodes
+
+    def cancel(self, context: RequestContext) -> None:
+        """Drops the request's prefetches that no step took."""
+        for task in context.prefetches.values():
+            if task.done():
+                # Retrieving the exception keeps asyncio from logging it again
+                if not task.cancelled() and task.exception() is not None:
+                    self.failed += 1
+                else:
+                    self.unused += 1
+            else:
+                task.cancel()
+                self.cancelled += 1
+        context.prefetches.clear()
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "used": self.used,
+            "unused": self.unused,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "use_rate": round(self.used / self.started, 4) if self.started else 0.0,
+        }
+
+
+# Create a single instance of the prefetcher to be used across the application
+speculative_prefetcher = SpeculativePrefetcher(
+    enabled=RetrievalConfig.PREFETCH_ENABLED,
+    max_queries=RetrievalConfig.PREFETCH_MAX_QUERIES,
+)
@@ -1,11 +1,41 @@
-from typing import List, Dict, Any
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
 
-from llama_index.core import VectorStoreIndex, Settings
-from llama_index.core.prompts import PromptTemplate
+import numpy as np
+from llama_index.core import Settings, VectorStoreIndex
 from llama_index.core.output_parsers import PydanticOutputParser
 from llama_index.core.program import LLMTextCompletionProgram
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.schema import NodeWithScore, QueryBundle
 from pydantic import BaseModel, Field
 
+from ..config import RetrievalConfig
+from ..retrieval import (
+    ContextPacker,
+    DocumentFilter,
+    HybridRetriever,
+    collapse_duplicates,
+    dense_retriever,
+    diversify,
+    early_exit_policy,
+    metadata_index,
+    query_embedding_cache,
+    sparse_index,
+    stored_embeddings,
+    summary_index,
+)
+from ..retrieval.embedding_cache import normalize_query
+from ..retrieval.result_cache import (
+    chunk_retrieval_cache,
+    doc_ids_key,
+    document_selection_cache,
+)
+from ..retrieval.sharding import ShardedIndex, shard_router
+from .budget import budget_guard
+from .context import RequestContext, current_request
+from .prefetch import speculative_prefetcher
+
 
 # Pydantic model for structured output from the evaluation step
 class ResearchState(BaseModel):
@@ -48,32 +78,262 @@ Based on the snippets, analyze the information and determine your next step. The
 """
 
 
-async def research_and_evaluate(
-    user_query: str, search_query: str, index: VectorStoreIndex
-) -> Dict[str, Any]:
+def resolve_candidate_docs(
+    search_query: str, doc_filter: Optional[DocumentFilter] = None
+) -> Optional[List[str]]:
     """
-    Performs a single research step:
-    1. Retrieves documents based on the search_query.
-    2. Evaluates if the retrieved documents are sufficient to answer the user_query.
-    3. Returns a structured state object including summaries and suggestions for the next steps.
+    Ref doc ids the retrieval is restricted to, or None for the whole corpus.
+
+    Explicit filters always apply; filters parsed from the query are dropped
+    when they match nothing, since the parse may have been a false positive.
     """
+    if not metadata_index.size:
+        return None
+    explicit = doc_filter is not None and not doc_filter.is_empty()
+    if not explicit:
+        doc_filter = metadata_index.parse_filter(search_query)
+        if doc_filter.is_empty():
+            return None
+
+    doc_ids = metadata_index.candidate_doc_ids(doc_filter)
     print(
-        f"🔬 Conducting research step. User Query: '{user_query}', Search Query: '{search_query}'"
+        f"🗂️ Metadata filter {doc_filter.describe()} "
+        f"({'explicit' if explicit else 'parsed'}) matched {len(doc_ids)} documents"
     )
+    if not doc_ids and not explicit:
+        return None
+    return doc_ids
 
-    # 1. Retrieve documents
-    retriever = index.as_retriever(similarity_top_k=5)
-    nodes = await retriever.aretrieve(search_query)
+
+async def retrieve_nodes(
+    search_query: str, index: VectorStoreIndex, doc_ids: Optional[List[str]] = None
+):
+    """
+    Dense + BM25 fused retrieval (or dense only), within doc_ids if set.
+    With diversification on, over-fetches candidates and keeps a
+    de-duplicated MMR selection of SIMILARITY_TOP_K of them.
+    """
+    # Repeated queries (ReAct loop, parallel users) reuse the cached embedding
+    query_bundle = QueryBundle(
+        query_str=search_query,
+        embedding=await query_embedding_cache.aget_query_embedding(
+            search_query, Settings.embed_model
+        ),
+    )
+
+    top_k = RetrievalConfig.SIMILARITY_TOP_K
+    fetch_k = (
+        max(top_k, RetrievalConfig.MMR_CANDIDATE_TOP_K)
+        if RetrievalConfig.DIVERSIFY_ENABLED
+        else top_k
+    )
+
+    if RetrievalConfig.HYBRID_ENABLED and sparse_index.size:
+        retriever = HybridRetriever(
+            index,
+            sparse_index,
+            similarity_top_k=fetch_k,
+            candidate_top_k=max(fetch_k, RetrievalConfig.HYBRID_CANDIDATE_TOP_K),
+            rrf_k=RetrievalConfig.RRF_K,
+        )
+        nodes = await retriever.aretrieve(query_bundle, doc_ids=doc_ids)
+    else:
+        retriever = dense_retriever(index, fetch_k, doc_ids)
+        nodes = await retriever.aretrieve(query_bundle)
+
+    if not RetrievalConfig.DIVERSIFY_ENABLED:
+        return nodes
+    selected = diversify(
+        index,
+        nodes,
+        top_k,
+        mmr_lambda=RetrievalConfig.MMR_LAMBDA,
+        embedding_threshold=RetrievalConfig.NEAR_DUPLICATE_THRESHOLD,
+    )
+    print(f"🧹 Diversified {len(nodes)} candidates into {len(selected)} nodes")
+    return selected
+
+
+def _result_key(search_query: str, doc_ids: Optional[List[str]]) -> Optional[tuple]:
+    """
+    Key of the cached results for a query, tagged with the version of the
+    request's index snapshot: a request still on the old snapshot after a
+    commit can't hand its results to requests on the new one. None outside
+    a request, whose index version is unknown; such lookups aren't cached.
+    """
+    context = current_request()
+    if context is None or context.index is None:
+        return None
+    return (context.index_version, normalize_query(search_query), doc_ids_key(doc_ids))
+
+
+async def select_documents(
+    search_query: str, doc_ids: Optional[List[str]] = None
+) -> Optional[List[str]]:
+    """
+    Stage one of hierarchical retrieval: the HIERARCHICAL_TOP_DOCUMENTS
+    documents (within doc_ids if set) whose summaries best match the query.
+    Returns doc_ids unchanged for small candidate sets, or while the summary
+    index doesn't cover the corpus yet.
+    """
+    corpus_size = metadata_index.size
+    candidates = corpus_size if doc_ids is None else len(doc_ids)
+    if candidates < max(
+        RetrievalConfig.HIERARCHICAL_MIN_DOCUMENTS,
+        RetrievalConfig.HIERARCHICAL_TOP_DOCUMENTS + 1,
+    ):
+        return doc_ids
+    if summary_index.size < corpus_size:
+        return doc_ids
+
+    key = _result_key(search_query, doc_ids)
+    selected = document_selection_cache.get(key) if key is not None else None
+    if selected is None:
+        embedding = await query_embedding_cache.aget_query_embedding(
+            search_query, Settings.embed_model
+        )
+        hits = await asyncio.to_thread(
+            summary_index.search,
+            embedding,
+            RetrievalConfig.HIERARCHICAL_TOP_DOCUMENTS,
+            doc_ids,
+        )
+        selected = [doc_id for doc_id, _ in hits]
+        if key is not None:
+            document_selection_cache.put(key, selected)
+        print(f"📚 Selected {len(selected)} of {candidates} documents by summary")
+    return selected
+
+
+def merge_retrieved_nodes(
+    results: List[List[NodeWithScore]], max_nodes: int
+) -> List[NodeWithScore]:
+    """De-duplicate nodes retrieved by several queries, keeping each node's best score"""
+    best: Dict[str, NodeWithScore] = {}
+    for nodes in results:
+        for node in nodes:
+            node_id = node.node.node_id
+            if node_id not in best or (node.score or 0.0) > (
+                best[node_id].score or 0.0
+            ):
+                best[node_id] = node
+    merged = sorted(best.values(), key=lambda n: n.score or 0.0, reverse=True)
+    return merged[:max_nodes]
+
+
+async def _retrieve_for_query(
+    search_query: str, index: VectorStoreIndex, doc_filter: Optional[DocumentFilter]
+) -> List[NodeWithScore]:
+    # Retrieve documents, scoring only the documents that pass the filters
+    doc_ids = resolve_candidate_docs(search_query, doc_filter)
+    if doc_ids == []:
+        return []
+    shard_keys = None
+    if (
+        doc_ids is None
+        and isinstance(index, ShardedIndex)
+        and RetrievalConfig.SHARD_ROUTING_ENABLED
+    ):
+        # Unfiltered query that explicitly targets one shard: search only that shard
+        shard_keys = shard_router.route(search_query, list(index.shards), doc_filter)
+        if shard_keys is not None:
+            doc_ids = index.doc_ids(shard_keys)
+            print(f"🧭 Routed query to shards {shard_keys} ({len(doc_ids)} documents)")
+    nodes = await _retrieve_from_documents(search_query, index, doc_ids)
+    if shard_keys is not None and not nodes:
+        shard_router.fell_back()
+        print(f"🧭 Shards {shard_keys} returned nothing; searching all shards")
+        nodes = await _retrieve_from_documents(search_query, index, None)
+    return nodes
+
+
+async def _retrieve_from_documents(
+    search_query: str, index: VectorStoreIndex, doc_ids: Optional[List[str]]
+) -> List[NodeWithScore]:
+    if RetrievalConfig.HIERARCHICAL_ENABLED:
+        doc_ids = await select_documents(search_query, doc_ids)
+
+    key = _result_key(search_query, doc_ids)
+    if key is None:
+        return await retrieve_nodes(search_query, index, doc_ids)
+    context = current_request()
+    if key in context.retrieved:
+        return list(context.retrieved[key])
+    nodes = chunk_retrieval_cache.get(key)
+    if nodes is None:
+        nodes = await retrieve_nodes(search_query, index, doc_ids)
+        chunk_retrieval_cache.put(key, nodes)
+    context.retrieved[key] = nodes
+    return list(nodes)
+
+
+@dataclass
+class RetrievedContext:
+    """Nodes retrieved for a set of queries, packed into the context budget."""
+
+    nodes: List[NodeWithScore]
+    context_str: str
+    query_embedding: List[float]
+    # Stored embeddings of the nodes (None if the store doesn't keep them)
+    embeddings: Optional[np.ndarray]
+    retrieved_docs_preview: List[Dict[str, str]]
+
+
+async def retrieve_context(
+    search_queries: List[str],
+    index: VectorStoreIndex,
+    doc_filter: Optional[DocumentFilter] = None,
+) -> Optional[RetrievedContext]:
+    """
+    Retrieves documents for every query at once, merges them by node id and
+    packs them into the context budget. None when nothing was found.
+    """
+    results = await asyncio.gather(
+        *(_retrieve_or_prefetched(q, index, doc_filter) for q in search_queries)
+    )
+    if len(results) == 1:
+        nodes = results[0]
+    else:
+        nodes = merge_retrieved_nodes(results, RetrievalConfig.MULTI_QUERY_MAX_NODES)
+        if RetrievalConfig.DIVERSIFY_ENABLED:
+            # Different queries often hit sibling chunks with the same text
+            embeddings = stored_embeddings(index, [n.node.node_id for n in nodes])
+            kept = collapse_duplicates(
+                nodes,
+                embeddings,
+                embedding_threshold=RetrievalConfig.NEAR_DUPLICATE_THRESHOLD,
+            )
+            nodes = [nodes[i] for i in kept]
+        print(
+            f"🔀 Merged {sum(len(r) for r in results)} nodes from "
+            f"{len(search_queries)} queries into {len(nodes)} unique nodes"
+        )
 
     if not nodes:
-        return {
-            "is_sufficient": False,
-            "summary_of_findings": "No documents were found for the query. Please try a different query.",
-            "suggested_next_queries": [],
-            "retrieved_docs_preview": [],
-        }
+        return None
 
-    context_str = "\n\n".join([n.get_content() for n in nodes])
+    # Fit the nodes into the context budget, keeping the most relevant sentences.
+    # The query embedding is a cache hit from retrieval; node embeddings come
+    # from the vector store, so packing costs no model calls
+    packer = ContextPacker(
+        token_budget=RetrievalConfig.CONTEXT_TOKEN_BUDGET,
+        min_tokens_per_node=RetrievalConfig.CONTEXT_MIN_TOKENS_PER_NODE,
+    )
+    query_embedding = await query_embedding_cache.aget_query_embedding(
+        search_queries[0], Settings.embed_model
+    )
+    embeddings = stored_embeddings(index, [n.node.node_id for n in nodes])
+    passages = packer.pack(
+        search_queries, nodes, embeddings=embeddings, query_embedding=query_embedding
+    )
+    context = current_request()
+    if context is not None:
+        context.context_tokens += sum(p.tokens for p in passages)
+    print(
+        f"📦 Packed {len(passages)}/{len(nodes)} nodes into "
+        f"{sum(p.tokens for p in passages)} tokens "
+        f"({sum(p.truncated for p in passages)} truncated, budget {packer.token_budget})"
+    )
 
     # Prepare the document previews to be sent to the frontend immediately
     retrieved_docs_preview = [
@@ -84,6 +344,97 @@ async def research_and_evaluate(
         }
         for node in nodes
     ]
+    return RetrievedContext(
+        nodes=nodes,
+        context_str=packer.render(passages),
+        query_embedding=query_embedding,
+        embeddings=embeddings,
+        retrieved_docs_preview=retrieved_docs_preview,
+    )
+
+
+async def _retrieve_or_prefetched(
+    search_query: str, index: VectorStoreIndex, doc_filter: Optional[DocumentFilter]
+) -> List[NodeWithScore]:
+    nodes = await speculative_prefetcher.take(search_query, doc_filter)
+    if nodes is not None:
+        print(f"🔮 Using prefetched results for '{search_query}'")
+        return list(nodes)
+    return await _retrieve_for_query(search_query, index, doc_filter)
+
+
+def _budget_exhausted_result(context: RequestContext) -> Dict[str, Any]:
+    """What the agent gets once the budget is spent: everything found so far, to answer from"""
+    return {
+        "is_sufficient": True,
+        "summary_of_findings": budget_guard.findings_so_far(context),
+        "suggested_next_queries": [],
+        "searched_queries": [],
+        "retrieved_docs_preview": [],
+        "budget_exhausted": context.budget_exhausted,
+    }
+
+
+async def research_and_evaluate(
+    user_query: str,
+    search_query: str,
+    index: VectorStoreIndex,
+    doc_filter: Optional[DocumentFilter] = None,
+    follow_up_queries: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Performs a single research step:
+    1. Retrieves documents for the search_query and any follow_up_queries
+       concurrently, within the documents matching doc_filter (or filters
+       parsed from each query), and merges them by node id.
+    2. Evaluates if the retrieved documents are sufficient to answer the user_query
+       (one evaluation call, however many queries were searched). A single-query
+       step whose best hit passes the early-exit thresholds skips the call.
+    3. Returns a structured state object including summaries and suggestions for the next steps.
+    """
+    # Drop repeated queries (same text after normalization)
+    search_queries, seen = [], set()
+    for query in [search_query] + (follow_up_queries or []):
+        key = normalize_query(query or "")
+        if key and key not in seen:
+            seen.add(key)
+            search_queries.append(query)
+    context = current_request()
+    if context is not None:
+        # A spent budget stops the research: the agent answers from what it has
+        if budget_guard.check(context):
+            return _budget_exhausted_result(context)
+        context.research_steps += 1
+    print(
+        f"🔬 Conducting research step. User Query: '{user_query}', Search Queries: {search_queries}"
+    )
+
+    # 1. Retrieve documents for every query at once
+    retrieved = await retrieve_context(search_queries, index, doc_filter)
+    if retrieved is None:
+        return {
+            "is_sufficient": False,
+            "summary_of_findings": "No documents were found for the query. Please try a different query.",
+            "suggested_next_queries": [],
+            "searched_queries": search_queries,
+            "retrieved_docs_preview": [],
+        }
+
+    # Confident single lookup: the passages are the findings, no evaluation call
+    if len(search_queries) == 1 and early_exit_policy.should_exit(
+        retrieved.query_embedding, retrieved.embeddings
+    ):
+        print("⚡ Retrieval confidence above thresholds; skipping evaluation.")
+        if context is not None:
+            context.findings.append(retrieved.context_str)
+        return {
+            "is_sufficient": True,
+            "summary_of_findings": retrieved.context_str,
+            "suggested_next_queries": [],
+            "searched_queries": search_queries,
+            "retrieved_docs_preview": retrieved.retrieved_docs_preview,
+            "early_exit": True,
+        }
 
     # 2. Evaluate sufficiency and suggest next steps
     program = LLMTextCompletionProgram.from_defaults(
@@ -93,14 +444,39 @@ async def research_and_evaluate(
         verbose=True,
     )
 
+    if context is not None:
+        budget_guard.charge(
+            context, EVALUATION_PROMPT_TEMPLATE + user_query + retrieved.context_str
+        )
     response_obj: ResearchState = await program.acall(
-        user_query=user_query, context_str=context_str
+        user_query=user_query, context_str=retrieved.context_str
     )
+    if context is not None:
+        context.findings.append(response_obj.summary_of_findings)
 
     # 3. Combine evaluation results with document previews
     final_result = response_obj.model_dump()
-    final_result["retrieved_docs_preview"] = retrieved_docs_preview
+    final_result["searched_queries"] = search_queries
+    final_result["retrieved_docs_preview"] = retrieved.retrieved_docs_preview
 
     print(f"🔍 Research step complete. Evaluation: {final_result}")
 
+    # Out of budget with the research unfinished: answer from the findings now
+    if (
+        context is not None
+        and not response_obj.is_sufficient
+        and budget_guard.check(context)
+    ):
+        final_result.update(_budget_exhausted_result(context))
+        final_result["searched_queries"] = search_queries
+        final_result["retrieved_docs_preview"] = retrieved.retrieved_docs_preview
+
+    # The agent is told to search the suggestions next: start them now
+    elif not response_obj.is_sufficient and response_obj.suggested_next_queries:
+        speculative_prefetcher.schedule(
+            response_obj.suggested_next_queries,
+            doc_filter,
+            lambda query: _retrieve_for_query(query, index, doc_filter),
+        )
+
     return final_result
@@ -0,0 +1,283 @@
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from enum import Enum
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.llms import ChatMessage
+
+from ..config import ChatConfig
+from ..retrieval.embedding_cache import query_embedding_cache
+from .context import RequestContext
+
+# Recent latencies kept per route for the percentiles reported on /metrics
+_SAMPLE_SIZE = 1000
+
+
+class Route(str, Enum):
+    """How a chat query is served."""
+
+    # No retrieval: greetings, thanks, questions about the assistant itself
+    DIRECT = "direct"
+    # One retrieval and one answer call: simple fact lookups
+    SINGLE_SHOT = "single_shot"
+    # The ReAct research loop
+    RESEARCH = "research"
+
+
+_SMALL_TALK = re.compile(
+    r"^(你好|您好|嗨|哈喽|hi|hello|hey|谢谢|多谢|感谢|谢啦|thanks|thank you|thx|"
+    r"再见|拜拜|bye|好的|好|ok|okay|收到|明白了?|知道了|早上好|中午好|下午好|晚上好)"
+    r"[\s!！。.,，~～?？]*(你|您)?[\s!！。.~～?？]*$",
+    re.IGNORECASE,
+)
+_ABOUT_ASSISTANT = re.compile(
+    r"(你是谁|你叫什么|你能做什么|你可以做什么|你会什么|你有什么功能|怎么使用你|"
+    r"who are you|what can you do|what are you)",
+    re.IGNORECASE,
+)
+# Questions that need several lookups or reasoning across documents
+_RESEARCH_CUES = re.compile(
+    r"(比较|对比|区别|差异|异同|分别|哪些|所有|全部|列出|列举|汇总|总结|梳理|归纳|分析|"
+    r"趋势|变化|演变|为什么|原因|影响|如何|怎么|怎样|步骤|流程|历年|"
+    r"compare|difference|versus|\bvs\b|why|how(?! (many|much|long|old))|list all|summari[sz]e|analy[sz]e|trend)",
+    re.IGNORECASE,
+)
+# Follow-ups that lean on the conversation; only the agent resolves them
+_FOLLOW_UP_CUES = re.compile(
+    r"(它|他们|她们|这个|那个|这些|那些|这份|那份|上面|上述|刚才|之前|前面|继续|还有呢|然后呢|"
+    r"\bit\b|\bthat\b|\bthose\b|\bthese\b|\babove\b|\bprevious\b)",
+    re.IGNORECASE,
+)
+_QUESTION_MARKS = re.compile(r"[?？]")
+
+# Routes the embedding stage chooses between. Skipping retrieval is only
+# safe for what the rules recognise: a factual question that merely looks
+# like small talk must not be answered without the knowledge base
+EMBEDDING_ROUTES = (Route.SINGLE_SHOT, Route.RESEARCH)
+
+# Labelled examples for the embedding stage, which decides what the rules don't
+ROUTE_EXAMPLES: Dict[Route, List[str]] = {
+    Route.SINGLE_SHOT: [
+        "2024年研究生招生报名截止时间是什么时候",
+        "教务处的联系电话是多少",
+        "奖学金申请需要提交哪份表格",
+        "期末考试安排在第几周",
+        "图书馆的开放时间",
+        "关于暑期实习的通知是哪个部门发布的",
+        "What is the deadline for thesis submission?",
+        "Who signed the notice on course registration?",
+    ],
+    Route.RESEARCH: [
+        "比较2023年和2024年招生政策的变化",
+        "总结近三年所有关于学术诚信的通知",
+        "为什么今年的课程改革会影响研究生培养方案",
+        "列出所有与实验室安全相关的规定并分析其要求",
+        "各学院的奖学金评定标准有什么不同",
+        "梳理新校区建设相关会议纪要中的主要决定",
+        "Compare the funding rules across departments",
+        "Summarize every meeting about the new campus and its open issues",
+    ],
+}
+
+
+@dataclass
+class RouteDecision:
+    route: Route
+    # "rule", "embedding" or "fallback"
+    method: str
+    reason: str
+    similarity: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        data = {"route": self.route.value, "method": self.method, "reason": self.reason}
+        if self.similarity is not None:
+            data["similarity"] = round(self.similarity, 4)
+        return data
+
+
+class QueryRouter:
+    """
+    Cheap classifier in front of the agent: rules first, then the nearest
+    labelled example by query embedding. Only the rules answer directly; the
+    embedding stage picks between a single-shot answer and research.
+
+    The query embedding is the one retrieval needs anyway (it comes from the
+    shared query embedding cache), and the example embeddings are computed
+    once per embedding model, so routing costs no model calls of its own.
+    Anything the rules and the examples don't decide clearly goes to the
+    research loop, and a single-shot query whose retrieval turns out weak is
+    escalated to it as well.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        min_similarity: float = 0.5,
+        min_margin: float = 0.02,
+        max_single_shot_chars: int = 60,
+        examples: Optional[Dict[Route, List[str]]] = None,
+    ):
+        self.enabled = enabled
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.max_single_shot_chars = max_single_shot_chars
+        self.examples = examples or ROUTE_EXAMPLES
+        self._example_routes: List[Route] = []
+        self._example_matrix: Optional[np.ndarray] = None
+        self._example_model: Optional[int] = None
+        self._examples_lock = asyncio.Lock()
+        self._latencies: Dict[Route, deque] = {
+            route: deque(maxlen=_SAMPLE_SIZE) for route in Route
+        }
+        self.decisions: Dict[str, int] = {}
+        self.escalations = 0
+        self.completed: Dict[Route, int] = {route: 0 for route in Route}
+
+    def classify_by_rules(
+        self, query: str, chat_history: List[ChatMessage]
+    ) -> Optional[RouteDecision]:
+        text = query.strip()
+        if not text:
+            return RouteDecision(Route.DIRECT, "rule", "empty query")
+        if _SMALL_TALK.match(text):
+            return RouteDecision(Route.DIRECT, "rule", "small talk")
+        if len(text) <= 30 and _ABOUT_ASSISTANT.search(text):
+            return RouteDecision(Route.DIRECT, "rule", "about the assistant")
+        if chat_history and _FOLLOW_UP_CUES.search(text):
+            return RouteDecision(
+                Route.RESEARCH, "rule", "follow-up on the conversation"
+            )
+        if _RESEARCH_CUES.search(text):
+            return RouteDecision(Route.RESEARCH, "rule", "multi-step question")
+        if len(_QUESTION_MARKS.findall(text)) > 1:
+            return RouteDecision(Route.RESEARCH, "rule", "several questions")
+        if len(text) > self.max_single_shot_chars:
+            return RouteDecision(Route.RESEARCH, "rule", "long query")
+        return None
+
+    async def _examples_for_model(self) -> Tuple[List[Route], np.ndarray]:
+        model = Settings.embed_model
+        async with self._examples_lock:
+            if self._example_matrix is None or self._example_model != id(model):
+                routes, texts = [], []
+                for route, examples in self.examples.items():
+                    if route not in EMBEDDING_ROUTES:
+                        continue
+                    routes.extend([route] * len(examples))
+                    texts.extend(examples)
+                matrix = np.asarray(
+                    await model.aget_text_embedding_batch(texts), dtype=np.float32
+                )
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+                self._example_routes, self._example_matrix = routes, matrix
+                self._example_model = id(model)
+        return self._example_routes, self._example_matrix
+
+    async def classify_by_embedding(self, query: str) -> Optional[RouteDecision]:
+        routes, matrix = await self._examples_for_model()
+        vector = np.asarray(
+            await query_embedding_cache.aget_query_embedding(
+                query, Settings.embed_model
+            ),
+            dtype=np.float32,
+        )
+        if vector.shape[0] != matrix.shape[1]:
+            return None
+        scores = matrix @ (vector / (np.linalg.norm(vector) or 1.0))
+        # Best example of each route
+        best: Dict[Route, float] = {}
+        for route, score in zip(routes, scores):
+            best[route] = max(best.get(route, -1.0), float(score))
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        (route, similarity), runner_up = ranked[0], (
+            ranked[1][1] if len(ranked) > 1 else -1.0
+        )
+        if similarity < self.min_similarity or similarity - runner_up < self.min_margin:
+            return None
+        return RouteDecision(route, "embedding", "nearest example", similarity)
+
+    async def route(self, query: str, chat_history: List[ChatMessage]) -> RouteDecision:
+        decision = None
+        if self.enabled:
+            decision = self.classify_by_rules(query, chat_history)
+            if decision is None:
+                try:
+                    decision = await self.classify_by_embedding(query)
+                except Exception as e:
+                    print(
+                        f"Warning: embedding routing failed, using the research loop: {e}"
+                    )
+        if decision is None:
+            decision = RouteDecision(
+                Route.RESEARCH,
+                "fallback",
+                "routing disabled" if not self.enabled else "no clear route",
+            )
+        key = f"{decision.route.value}/{decision.method}"
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        print(
+            f"🚦 Routed '{query}' to {decision.route.value} ({decision.method}: {decision.reason})"
+        )
+        return decision
+
+    def escalate(self, context: RequestContext, reason: str) -> RouteDecision:
+        """A fast path gave up before answering: the research loop takes over."""
+        self.escalations += 1
+        context.route = Route.RESEARCH.value
+        print(f"🚦 Escalating '{context.user_query}' to research: {reason}")
+        return RouteDecision(Route.RESEARCH, "escalation", reason)
+
+    def record(self, context: RequestContext) -> None:
+        route = Route(context.route or Route.RESEARCH.value)
+        self.completed[route] += 1
+        self._latencies[route].append(time.monotonic() - context.started_at)
+
+    async def record_after(
+        self, context: RequestContext, stream: AsyncGenerator[str, None]
+    ) -> AsyncGenerator[str, None]:
+        """Wraps a streaming body; the request's route and latency are recorded when it ends."""
+        try:
+            # Closing the wrapper closes the body too, so it cleans up at once
+            async with aclosing(stream) as messages:
+                async for message in messages:
+                    yield message
+        finally:
+            self.record(context)
+
+    def metrics(self) -> Dict[str, object]:
+        total = sum(self.completed.values())
+        routes = {}
+        for route in Route:
+            latencies = self._latencies[route]
+            stats = {
+                "completed": self.completed[route],
+                "share": round(self.completed[route] / total, 4) if total else 0.0,
+            }
+            if latencies:
+                p50, p95 = np.percentile(
+                    np.fromiter(latencies, dtype=np.float64), [50, 95]
+                )
+                stats["latency_p50_ms"] = round(1000 * float(p50), 1)
+                stats["latency_p95_ms"] = round(1000 * float(p95), 1)
+            routes[route.value] = stats
+        return {
+            "enabled": self.enabled,
+            "routes": routes,
+            "decisions": dict(self.decisions),
+            "escalations": self.escalations,
+        }
+
+
+# Create a single instance of the router to be used across the application
+query_router = QueryRouter(
+    enabled=ChatConfig.ROUTER_ENABLED,
+    min_similarity=ChatConfig.ROUTER_MIN_SIMILARITY,
+    min_margin=ChatConfig.ROUTER_MIN_MARGIN,
+    max_single_shot_chars=ChatConfig.ROUTER_MAX_SINGLE_SHOT_CHARS,
+)
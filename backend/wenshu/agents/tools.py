@@ -1,44 +1,146 @@
 import json
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 from llama_index.core import Settings
 from llama_index.core.agent import ReActAgent
+from llama_index.core.agent.react.formatter import ReActChatFormatter
+from llama_index.core.agent.react.output_parser import ReActOutputParser
+from llama_index.core.agent.react.prompts import CONTEXT_REACT_CHAT_SYSTEM_HEADER
+from llama_index.core.agent.react.types import BaseReasoningStep
 from llama_index.core.callbacks import CallbackManager
-from llama_index.core.tools import FunctionTool
-
+from llama_index.core.llms import ChatMessage
+from llama_index.core.tools import BaseTool, FunctionTool
+
+from ..config import ChatConfig
+from ..models.document_schemas import DOCUMENT_TYPE_REGISTRY
+from ..retrieval import DocumentFilter
+from .budget import budget_guard
+from .context import current_request
+from .events import event_bus
 from .researcher import research_and_evaluate
 
-# This dictionary will hold the original user query for the duration of a single chat interaction.
-# In a production environment, this should be handled by a more robust state management system.
-__temp_state_cache = {}
+SYSTEM_PROMPT = """
+You are a highly skilled research assistant. Your goal is to provide a comprehensive, well-supported answer to the user's query by conducting iterative research.
+
+**Your ONLY tool is `researcher(search_query: str)`.**
+It also accepts optional filters (`document_type`, `issuing_department`, `year`, `person`). Use them only when the user explicitly restricts the documents, e.g. "2024 年教务处的通知" -> year=2024, issuing_department="教务处", document_type="通知".
+
+**Your workflow is a strict, multi-step loop:**
+
+1.  **START**: On your first turn, you MUST call the `researcher` tool using the user's original, full query as the `search_query`.
 
+2.  **ANALYZE**: The tool will return a JSON object. You MUST carefully analyze its fields:
+    - `is_sufficient`: A boolean. `true` means you have enough information. `false` means you need to dig deeper.
+    - `summary_of_findings`: A text summary of what was found in the last step.
+    - `suggested_next_queries`: A list of new, more specific queries to try if `is_sufficient` is `false`.
 
-def create_researcher_tool(index) -> List[FunctionTool]:
+3.  **DECIDE & ITERATE**:
+    - **If `is_sufficient` is `false`**: You MUST call the `researcher` tool again with ALL of `suggested_next_queries` in one call: the best one as `search_query` and the rest as `follow_up_queries`. They are searched concurrently, so do not call the tool once per query. You must announce that you are continuing research based on the new findings.
+    - **If `is_sufficient` is `true`**: Your research is complete.
+
+4.  **SYNTHESIZE & ANSWER**: Once `is_sufficient` is `true`, you MUST formulate a final, comprehensive answer for the user. Base your answer on the `summary_of_findings` from the LAST tool call. Do not call any more tools.
+
+You must continue this loop until you have sufficient information to provide a high-quality answer.
+
+**Budget**: each request has a limited research budget. If a tool result contains `budget_exhausted`, the research is over: do not call the tool again, answer from its `summary_of_findings` and tell the user the answer is based on partial research.
+"""
+
+
+class BudgetedReActChatFormatter(ReActChatFormatter):
+    """
+    ReAct prompts charged to the budget of the request being served. Each
+    iteration's prompt repeats the previous one plus the new reasoning step,
+    so only the messages not charged yet count: the prompt-token budget
+    bounds what the agent's context grows to, not the sum over iterations.
+    Once the budget is spent, the prompt ends with an instruction to answer
+    from the findings instead of researching further.
+    """
+
+    def format(
+        self,
+        tools: Sequence[BaseTool],
+        chat_history: List[ChatMessage],
+        current_reasoning: Optional[List[BaseReasoningStep]] = None,
+    ) -> List[ChatMessage]:
+        messages = super().format(tools, chat_history, current_reasoning)
+        context = current_request()
+        if context is not None:
+            budget_guard.charge(context, messages[context.charged_agent_messages :])
+            context.charged_agent_messages = len(messages)
+            if budget_guard.check(context, count_steps=False):
+                messages.append(budget_guard.answer_now_message(context))
+        return messages
+
+
+# Prompt formatting and output parsing are stateless: shared by every agent
+_react_chat_formatter = BudgetedReActChatFormatter(
+    system_header=CONTEXT_REACT_CHAT_SYSTEM_HEADER, context=SYSTEM_PROMPT
+)
+_output_parser = ReActOutputParser()
+
+
+def create_researcher_tool(index=None) -> List[FunctionTool]:
     """
     Creates the 'researcher' tool for the agent.
     This tool is a wrapper around the multi-step research_and_evaluate function.
+
+    The tool holds no per-request state: the user query, the index snapshot
+    and the caches come from the RequestContext active when it runs, so one
+    tool instance serves every pooled agent. index is only a fallback for
+    agents used outside a request.
     """
-    if not index:
-        return []
 
-    async def researcher(search_query: str) -> str:
+    async def researcher(
+        search_query: str,
+        follow_up_queries: Optional[List[str]] = None,
+        document_type: Optional[str] = None,
+        issuing_department: Optional[str] = None,
+        year: Optional[int] = None,
+        person: Optional[str] = None,
+    ) -> str:
         """
         Your primary tool for conducting research.
         - On the first turn, provide the user's full, original query to start the research.
-        - On subsequent turns, use the suggestions from the previous step to refine your search.
+        - On subsequent turns, use the suggestions from the previous step to refine your search:
+          pass the best one as search_query and the others as follow_up_queries. All of
+          them are searched concurrently and evaluated together in a single step.
+        - Optional filters restrict the search to matching documents: document_type
+          (e.g. 通知, academic_paper, meeting_minutes), issuing_department (e.g. 教务处),
+          year (e.g. 2024), person (author / participant / key personnel name).
         - The tool returns a JSON object detailing the findings and suggests next steps.
         """
-        # Retrieve the original user query from the temporary cache
-        user_query = __temp_state_cache.get("user_query", "")
+        context = current_request()
+        search_index = context.index if context and context.index is not None else index
+        if search_index is None:
+            return json.dumps({"error": "Knowledge base not loaded."})
+
+        # The original user query comes from this request's context
+        user_query = context.user_query if context else ""
         if not user_query:
             # This should not happen if the orchestrator sets it, but as a fallback:
             user_query = search_query
             print(
-                "Warning: Original user query not found in cache. Using search_query as user_query."
+                "Warning: Original user query not found in request context. Using search_query as user_query."
             )
 
         # Await the async research function directly, as we are in an async context.
-        result = await research_and_evaluate(user_query, search_query, index)
+        doc_filter = DocumentFilter(
+            issuing_departments=[issuing_department] if issuing_department else [],
+            year=year,
+            person=person,
+        )
+        if document_type in DOCUMENT_TYPE_REGISTRY:
+            doc_filter.document_schema = document_type
+        else:
+            doc_filter.document_type = document_type
+        if context:
+            # Backpressure: don't start another step while the client is behind
+            await event_bus.wait_writable(context.request_id)
+
+        # The researcher reads the request's caches and budget through the same context
+        result = await research_and_evaluate(
+            user_query, search_query, search_index, doc_filter, follow_up_queries
+        )
 
         # The agent expects a string observation, so we serialize the JSON result.
         return json.dumps(result, ensure_ascii=False)
@@ -51,52 +153,28 @@ def create_researcher_tool(index) -> List[FunctionTool]:
 
 
 def create_agent(
-    index, callback_manager: CallbackManager, user_query: str
+    index,
+    callback_manager: CallbackManager,
+    tools: Optional[List[FunctionTool]] = None,
 ) -> Optional[ReActAgent]:
-    """Create and configure the ReAct agent with the iterative researcher tool."""
-
-    # Store the user's original query in a temporary cache for the researcher tool to access.
-    __temp_state_cache["user_query"] = user_query
-
-    tools = create_researcher_tool(index)
+    """
+    Create and configure the ReAct agent with the iterative researcher tool.
+    Pass pre-built tools to share them between agents.
+    """
+    tools = tools if tools is not None else create_researcher_tool(index)
 
     if not tools:
         return None
 
-    system_prompt = """
-You are a highly skilled research assistant. Your goal is to provide a comprehensive, well-supported answer to the user's query by conducting iterative research.
-
-**Your ONLY tool is `researcher(search_query: str)`.**
-
-**Your workflow is a strict, multi-step loop:**
-
-1.  **START**: On your first turn, you MUST call the `researcher` tool using the user's original, full query as the `search_query`.
-
-2.  **ANALYZE**: The tool will return a JSON object. You MUST carefully analyze its fields:
-    - `is_sufficient`: A boolean. `true` means you have enough information. `false` means you need to dig deeper.
-    - `summary_of_findings`: A text summary of what was found in the last step.
-    - `suggested_next_queries`: A list of new, more specific queries to try if `is_sufficient` is `false`.
-
-3.  **DECIDE & ITERATE**:
-    - **If `is_sufficient` is `false`**: You MUST pick the best query from `suggested_next_queries` and call the `researcher` tool again with it. You must announce that you are continuing research based on the new findings.
-    - **If `is_sufficient` is `true`**: Your research is complete.
-
-4.  **SYNTHESIZE & ANSWER**: Once `is_sufficient` is `true`, you MUST formulate a final, comprehensive answer for the user. Base your answer on the `summary_of_findings` from the LAST tool call. Do not call any more tools.
-
-You must continue this loop until you have sufficient information to provide a high-quality answer.
-"""
-
     agent = ReActAgent.from_tools(
         tools=tools,
         llm=Settings.llm,
-        system_prompt=system_prompt,
+        react_chat_formatter=_react_chat_formatter,
+        output_parser=_output_parser,
+        # Every allowed research step, a refused one and the answer
+        max_iterations=(ChatConfig.REQUEST_MAX_RESEARCH_STEPS or 8) + 2,
         verbose=True,
         callback_manager=callback_manager,
     )
 
     return agent
-
-
-# Function to clear the state cache after a request is complete
-def clear_state_cache():
-    __temp_state_cache.clear()
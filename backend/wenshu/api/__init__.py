@@ -4,5 +4,6 @@ API endpoints
 
 from .chat import setup_chat_routes
 from .documents import setup_document_routes
+from .metrics import setup_metrics_routes
 
-__all__ = ["setup_chat_routes", "setup_document_routes"]
+__all__ = ["setup_chat_routes", "setup_document_routes", "setup_metrics_routes"]
@@ -1,47 +1,268 @@
+import asyncio
 import json
+from contextlib import aclosing
+from typing import AsyncGenerator, List, Optional
 
-from fastapi import Form
+from fastapi import Form, HTTPException
 from fastapi.responses import StreamingResponse
+from llama_index.core import Settings
 from llama_index.core.llms import ChatMessage, MessageRole
 
+from ..agents.context import RequestContext
+from ..agents.fast_path import is_refusal
+from ..agents.router import Route, query_router
+from ..config import RetrievalConfig
+from ..retrieval.embedding_cache import query_embedding_cache
 from ..services.agent_service import agent_service
-from ..utils.streaming import stream_generator_with_steps
+from ..services.answer_cache import answer_cache
+from ..services.conversation_store import conversation_store
+from ..services.history_service import history_manager
+from ..services.ingestion_service import ingestion_service
+from ..services.scheduler import WorkloadClass, request_scheduler
+from ..utils.streaming import (
+    ReleasingStreamingResponse,
+    create_sse_message,
+    replay_cached_answer,
+    stream_fast_path,
+    stream_generator_with_steps,
+)
+
+
+def _parse_history(chat_history: str) -> List[ChatMessage]:
+    try:
+        history_dicts = json.loads(chat_history)
+        return [
+            ChatMessage(
+                role=(
+                    MessageRole.USER
+                    if msg.get("role") == "user"
+                    else MessageRole.ASSISTANT
+                ),
+                content=msg.get("content"),
+            )
+            for msg in history_dicts
+        ]
+    except json.JSONDecodeError:
+        return []
+
+
+def _without_current_query(query: str, history: List[ChatMessage]) -> List[ChatMessage]:
+    """The client may already include the query; the agent adds it again itself"""
+    if (
+        history
+        and history[-1].role == MessageRole.USER
+        and history[-1].content == query
+    ):
+        return history[:-1]
+    return history
+
+
+def _is_grounded(events: List[dict]) -> bool:
+    """
+    The answer came from the documents: a single-shot answer whose retrieval
+    passed the confidence check and that doesn't say the documents lack the
+    answer, or a research loop that ended on a step that found sufficient
+    information (not one cut short by the request's budget)
+    """
+    if any(e.get("type") == "budget_exhausted" for e in events):
+        # Partial research: not worth replaying to the next asker
+        return False
+    routes = [e for e in events if e.get("type") == "route"]
+    if routes and routes[-1]["data"].get("route") == Route.SINGLE_SHOT.value:
+        confident = any(e.get("type") == "confidence" for e in events)
+        return confident and not is_refusal(events[-1]["data"])
+    steps = [e for e in events if e.get("type") == "research_step"]
+    return bool(steps) and steps[-1]["data"].get("is_sufficient", False)
+
+
+async def _announce_conversation(
+    conversation_id: str, stream: AsyncGenerator[str, None]
+) -> AsyncGenerator[str, None]:
+    """Tells the client which conversation to continue before the stream itself"""
+    yield create_sse_message(
+        {"type": "conversation", "data": {"conversation_id": conversation_id}}
+    )
+    async with aclosing(stream) as messages:
+        async for message in messages:
+            yield message
 
 
 def setup_chat_routes(app, callback_handler):
     """Setup chat-related API routes"""
 
     @app.post("/chat")
-    async def chat_endpoint(query: str = Form(...), chat_history: str = Form("[]")):
-        """Main chat endpoint with streaming support"""
-        # Create a new agent instance specifically for this query
-        agent = agent_service.get_agent_for_query(query)
-        if not agent:
-            return {"error": "Agent could not be created. Please check server logs."}
+    async def chat_endpoint(
+        query: str = Form(...),
+        chat_history: str = Form("[]"),
+        conversation_id: Optional[str] = Form(None),
+    ):
+        """
+        Main chat endpoint with streaming support.
 
-        try:
-            history_dicts = json.loads(chat_history)
-            llama_chat_history = [
-                ChatMessage(
-                    role=(
-                        MessageRole.USER
-                        if msg.get("role") == "user"
-                        else MessageRole.ASSISTANT
+        With a conversation_id the history comes from the conversation store
+        and the client only sends the new message. Without one a new
+        conversation is started (seeded with chat_history, for clients that
+        still send it); its id is the first SSE event and the
+        X-Conversation-Id header.
+        """
+        if conversation_id:
+            llama_chat_history = await asyncio.to_thread(
+                conversation_store.get_messages, conversation_id
+            )
+            if llama_chat_history is None:
+                raise HTTPException(status_code=404, detail="Conversation not found.")
+        else:
+            llama_chat_history = _without_current_query(
+                query, _parse_history(chat_history)
+            )
+
+        # Latencies of the request (time to first token, per route) count from here
+        context = RequestContext(user_query=query)
+
+        async def start_turn() -> dict:
+            # Only an admitted (or cached) request starts a conversation; the
+            # question is recorded up front, so a failed answer keeps it too
+            nonlocal conversation_id
+            if not conversation_id:
+                conversation_id = await asyncio.to_thread(
+                    conversation_store.create, llama_chat_history
+                )
+            try:
+                await asyncio.to_thread(
+                    conversation_store.append, conversation_id, MessageRole.USER, query
+                )
+            except KeyError:
+                # Deleted or pruned since its history was read
+                raise HTTPException(status_code=404, detail="Conversation not found.")
+            return {
+                "X-Conversation-Id": conversation_id,
+                # Reverse proxies must pass the frames through as they are written
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            }
+
+        async def record_answer(answer: str) -> None:
+            await asyncio.to_thread(
+                conversation_store.append,
+                conversation_id,
+                MessageRole.ASSISTANT,
+                answer,
+            )
+
+        # A first-turn question close enough to an answered one is replayed
+        # from the answer cache, without taking a chat slot
+        embedding = None
+        if RetrievalConfig.ANSWER_CACHE_ENABLED and not llama_chat_history:
+            try:
+                # The researcher's first step reuses this embedding from the cache
+                embedding = await query_embedding_cache.aget_query_embedding(
+                    query, Settings.embed_model
+                )
+            except Exception as e:
+                print(f"Warning: answer cache skipped, query embedding failed: {e}")
+
+        index_version = ingestion_service.index_version
+        if embedding is not None:
+            hit = answer_cache.lookup(query, embedding, index_version)
+            if hit is not None:
+                entry, similarity = hit
+                print(
+                    f"💾 Answer cache hit ({similarity:.3f}) for '{query}' <- '{entry.query}'"
+                )
+                headers = await start_turn()
+                await record_answer(entry.events[-1]["data"])
+                return StreamingResponse(
+                    _announce_conversation(
+                        conversation_id,
+                        replay_cached_answer(
+                            entry.events,
+                            {"query": entry.query, "similarity": round(similarity, 4)},
+                        ),
                     ),
-                    content=msg.get("content"),
+                    media_type="text/event-stream",
+                    headers=headers,
+                )
+
+        async def on_complete(events: List[dict]) -> None:
+            # The last event holds the whole answer
+            await record_answer(events[-1]["data"])
+            if embedding is not None and _is_grounded(events):
+                answer_cache.put(query, embedding, index_version, events)
+
+        # Wait for a chat slot (or get shed with 429) before doing any work.
+        # Once the response exists it owns the slot; until then every exit
+        # of the handler releases it here
+        lease = await request_scheduler.lease(WorkloadClass.CHAT)
+        try:
+            headers = await start_turn()
+
+            # Old turns are folded into a rolling summary to bound the prompt
+            llama_chat_history = await history_manager.compact(llama_chat_history)
+
+            # Greetings and simple lookups skip the research loop
+            decision = await query_router.route(query, llama_chat_history)
+            context.route = decision.route.value
+
+            if decision.route != Route.RESEARCH:
+                agent_service.bind_index(context)
+                body = stream_fast_path(
+                    query=query,
+                    chat_history=llama_chat_history,
+                    decision=decision,
+                    callback_handler=callback_handler,
+                    context=context,
+                    on_complete=on_complete,
+                )
+            else:
+                # Take an agent from the pool for this query's research loop
+                agent = agent_service.get_agent_for_query(query, context)
+                if not agent:
+                    lease.release()
+                    return {
+                        "error": "Agent could not be created. Please check server logs."
+                    }
+                # The generator will now also handle cleaning up the state
+                body = stream_generator_with_steps(
+                    query=query,
+                    chat_history=llama_chat_history,
+                    agent=agent,
+                    callback_handler=callback_handler,
+                    context=context,
+                    on_complete=on_complete,
                 )
-                for msg in history_dicts
-            ]
-        except json.JSONDecodeError:
-            llama_chat_history = []
-
-        # The generator will now also handle cleaning up the state
-        return StreamingResponse(
-            stream_generator_with_steps(
-                query=query,
-                chat_history=llama_chat_history,
-                agent=agent,
-                callback_handler=callback_handler,
-            ),
-            media_type="text/event-stream",
+
+            # The chat slot is released once the response ends, however it
+            # ends; the route's latency is recorded when the body does
+            response = ReleasingStreamingResponse(
+                query_router.record_after(
+                    context, _announce_conversation(conversation_id, body)
+                ),
+                release=lease.release,
+                media_type="text/event-stream",
+                headers=headers,
+            )
+        except BaseException:
+            lease.release()
+            raise
+        return response
+
+    @app.get("/conversations/{conversation_id}")
+    async def get_conversation(conversation_id: str):
+        """Messages of a server-side conversation"""
+        messages = await asyncio.to_thread(
+            conversation_store.get_messages, conversation_id
         )
+        if messages is None:
+            raise HTTPException(status_code=404, detail="Conversation not found.")
+        return {
+            "conversation_id": conversation_id,
+            "messages": [
+                {"role": m.role.value, "content": m.content} for m in messages
+            ],
+        }
+
+    @app.delete("/conversations/{conversation_id}")
+    async def delete_conversation(conversation_id: str):
+        if not await asyncio.to_thread(conversation_store.delete, conversation_id):
+            raise HTTPException(status_code=404, detail="Conversation not found.")
+        return {"status": "success", "conversation_id": conversation_id}
@@ -1,16 +1,17 @@
+import asyncio
 import hashlib
 import json
 import pickle
 from datetime import datetime
+from typing import Optional
 
 from fastapi import File, Form, HTTPException, UploadFile
 
-from ..config import APIConfig
 from ..models.document_schemas import DOCUMENT_TYPE_REGISTRY, get_model_for_type
-from ..services.agent_service import agent_service
-
+from ..retrieval.sharding import ShardedIndex
+from ..services.ingestion_service import ingestion_service
+from ..services.scheduler import WorkloadClass, request_scheduler
 
-from typing import Optional
 
 def setup_document_routes(app, doc_processor, index):
     """Setup document-related API routes with optimized single-parsing approach"""
@@ -26,6 +27,12 @@ def setup_document_routes(app, doc_processor, index):
                 status_code=500, detail="Document processor not initialized"
             )
 
+        # Parsing and metadata extraction run in an ingestion slot so they
+        # never take the slots reserved for interactive chat
+        async with request_scheduler.slot(WorkloadClass.INGESTION):
+            return await _upload_document(file)
+
+    async def _upload_document(file: UploadFile):
         try:
             # Save uploaded file temporarily
             file_hash = hashlib.md5(await file.read()).hexdigest()
@@ -39,8 +46,9 @@ def setup_document_routes(app, doc_processor, index):
             # 单次解析：获取 Markdown 和原始 Document
             try:
                 print("[Optimization] Starting single document parsing...")
-                markdown_content, original_document = (
-                    doc_processor.read_and_process_document(temp_file_path)
+                # Docling parsing is CPU bound: keep it off the event loop
+                markdown_content, original_document = await asyncio.to_thread(
+                    doc_processor.read_and_process_document, temp_file_path
                 )
 
                 print("[Optimization] Single parsing completed successfully:")
@@ -53,6 +61,12 @@ def setup_document_routes(app, doc_processor, index):
                     pickle.dump(original_document, cache_file)
                 print("[Optimization] Original document cached for later use")
 
+                # 缓存 Markdown，确认入库时用于生成文档摘要
+                markdown_cache_path = (
+                    doc_processor.temp_dir / f"{file_hash}_markdown.md"
+                )
+                markdown_cache_path.write_text(markdown_content, encoding="utf-8")
+
                 # 使用 Markdown 内容进行文档类型识别
                 doc_type = doc_processor.identify_document_type(
                     file.filename, markdown_content
@@ -67,20 +81,24 @@ def setup_document_routes(app, doc_processor, index):
                     markdown_content, doc_type
                 )
                 print("[Optimization] Metadata extraction completed")
-            # ** CRITICAL CHECK **
-            # 如果元数据提取失败 (函数可能返回None或一个包含错误的字典)
-                if not metadata or not metadata.get("extracted_fields") or metadata.get("error"):
-                    error_message = metadata.get("error", "Unknown error during metadata extraction.")
+                # ** CRITICAL CHECK **
+                # 如果元数据提取失败 (函数可能返回None或一个包含错误的字典)
+                if (
+                    not metadata
+                    or not metadata.get("extracted_fields")
+                    or metadata.get("extraction_error")
+                ):
+                    error_message = metadata.get(
+                        "extraction_error", "Unknown error during metadata extraction."
+                    )
                     print(f"❌ Metadata extraction failed: {error_message}")
                     raise HTTPException(
                         status_code=503,  # Service Unavailable or 422 Unprocessable Entity
-                        detail=f"Metadata extraction failed: {error_message}. Please check the LLM API key and network connectivity."
+                        detail=f"Metadata extraction failed: {error_message}. Please check the LLM API key and network connectivity.",
                     )
 
                 print("[Optimization] Metadata extraction completed successfully.")
 
-
-
                 # Get schema for frontend validation
                 schema_info = doc_processor.get_document_schema(doc_type)
 
@@ -102,6 +120,9 @@ def setup_document_routes(app, doc_processor, index):
                 temp_file_path.unlink(missing_ok=True)
                 cache_file_path = doc_processor.temp_dir / f"{file_hash}_cached_doc.pkl"
                 cache_file_path.unlink(missing_ok=True)
+                (doc_processor.temp_dir / f"{file_hash}_markdown.md").unlink(
+                    missing_ok=True
+                )
                 # Clean up temp files
                 if temp_file_path.exists():
                     temp_file_path.unlink()
@@ -126,11 +147,17 @@ def setup_document_routes(app, doc_processor, index):
         if not index or not doc_processor:
             raise HTTPException(status_code=500, detail="System not initialized")
 
+        async with request_scheduler.slot(WorkloadClass.INGESTION):
+            return await _confirm_document(file_id, metadata, filename)
+
+    async def _confirm_document(file_id: str, metadata: str, filename: str):
         print(f"--- Entering confirm_document endpoint ---")
         try:
             # Parse confirmed metadata
             print(f"Received file_id: {file_id}, filename: {filename}")
-            print(f"Received metadata (raw): {metadata[:200]}...") # Print first 200 chars
+            print(
+                f"Received metadata (raw): {metadata[:200]}..."
+            )  # Print first 200 chars
             confirmed_metadata = json.loads(metadata)
             print(f"Parsed confirmed_metadata: {confirmed_metadata}")
 
@@ -181,6 +208,8 @@ def setup_document_routes(app, doc_processor, index):
                 "file_name": filename,
                 "upload_time": datetime.now().isoformat(),
                 "document_type": doc_type,
+                # Schema key; "document_type" may be overridden by the validated fields
+                "document_schema": doc_type,
                 **validated_dict,  # Add all validated metadata fields
             }
 
@@ -188,32 +217,39 @@ def setup_document_routes(app, doc_processor, index):
             print(
                 "[Storage] Processing cached document for storage with DoclingNodeParser..."
             )
-            nodes = doc_processor.process_document_for_storage(
-                original_document, storage_metadata
+            nodes = await asyncio.to_thread(
+                doc_processor.process_document_for_storage,
+                original_document,
+                storage_metadata,
             )
 
-            if not nodes:
+            # Add to existing index in fixed-size batches, then persist and reload
+            print("[Storage] Attempting to insert nodes into index...")
+            nodes_added = await asyncio.to_thread(ingestion_service.add_nodes, nodes)
+
+            if not nodes_added:
                 print("[Storage] No nodes generated from document.")
                 raise HTTPException(
                     status_code=400, detail="Could not process document into nodes"
                 )
+            print(f"[Storage] {nodes_added} nodes inserted successfully.")
+
+            # Document-level summary for two-stage retrieval, from the same
+            # Markdown the metadata was extracted from
+            markdown_cache_path = doc_processor.temp_dir / f"{file_id}_markdown.md"
+            markdown_content = (
+                markdown_cache_path.read_text(encoding="utf-8")
+                if markdown_cache_path.exists()
+                else ""
+            )
+            await asyncio.to_thread(
+                ingestion_service.add_document_summary,
+                original_document.doc_id,
+                storage_metadata,
+                markdown_content,
+            )
 
-            print(f"[Storage] Generated {len(nodes)} nodes for storage")
-
-            # Add to existing index
-            print("[Storage] Attempting to insert nodes into index...")
-            index.insert_nodes(nodes)
-            print("[Storage] Nodes inserted successfully.")
-
-            # Persist the updated index
-            print(f"[Storage] Attempting to persist index to {APIConfig.STORAGE_DIR}...")
-            index.storage_context.persist(APIConfig.STORAGE_DIR)
-            print("[Storage] Index persisted successfully.")
-
-            # --- CRITICAL STEP: Reload the agent to use the updated index ---
-            print("[Storage] Reloading agent...")
-            agent_service.reload_agent()
-            print("[Storage] Agent reloaded.")
+            await asyncio.to_thread(ingestion_service.commit)
 
             # Clean up temp files
             temp_file_path = doc_processor.temp_dir / f"{file_id}_{filename}"
@@ -223,10 +259,12 @@ def setup_document_routes(app, doc_processor, index):
             if cache_file_path.exists():
                 cache_file_path.unlink()
 
+            markdown_cache_path.unlink(missing_ok=True)
+
             return {
                 "status": "success",
                 "message": f"Document '{filename}' has been successfully added to the knowledge base",
-                "nodes_added": len(nodes),
+                "nodes_added": nodes_added,
                 "validated_metadata": validated_dict,
                 "document_type": doc_type,
             }
@@ -238,6 +276,32 @@ def setup_document_routes(app, doc_processor, index):
                 status_code=500, detail=f"Error adding document: {str(e)}"
             )
 
+    @app.get("/shards")
+    async def list_shards():
+        """Documents and nodes per knowledge base shard"""
+        if not isinstance(index, ShardedIndex):
+            raise HTTPException(status_code=404, detail="Knowledge base is not sharded")
+        return {"shard_field": index.shard_field, "shards": index.stats()}
+
+    @app.post("/shards/{shard_key}/rebuild")
+    async def rebuild_shard(shard_key: str):
+        """Rebuild one shard's vector store from its docstore; other shards keep serving"""
+        if not isinstance(index, ShardedIndex):
+            raise HTTPException(status_code=404, detail="Knowledge base is not sharded")
+        if shard_key not in index.shards:
+            raise HTTPException(status_code=404, detail=f"Unknown shard: {shard_key}")
+
+        async with request_scheduler.slot(WorkloadClass.INGESTION):
+            try:
+                nodes = await asyncio.to_thread(
+                    ingestion_service.rebuild_shard, shard_key
+                )
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500, detail=f"Error rebuilding shard: {str(e)}"
+                )
+        return {"status": "success", "shard": shard_key, "nodes": nodes}
+
     @app.get("/document_templates")
     async def get_document_templates():
         """Return available document templates with full schema information"""
@@ -265,7 +329,6 @@ def setup_document_routes(app, doc_processor, index):
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
 
-
     @app.post("/auto_fill_form")
     async def auto_fill_form(
         file: UploadFile = File(...),
@@ -279,13 +342,14 @@ def setup_document_routes(app, doc_processor, index):
         - data_file: 结构化数据文件（如csv、xlsx、json），可选
         - db_table/db_query: 数据库表名和查询条件，可选
         """
+        import json as pyjson
+        import os
+        import shutil
+        import sqlite3
         import tempfile
+
         import pandas as pd
         from docx import Document
-        import shutil
-        import sqlite3
-        import os
-        import json as pyjson
 
         # 1. 保存上传的Word表单
         with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp_docx:
@@ -301,7 +365,11 @@ def setup_document_routes(app, doc_processor, index):
                 shutil.copyfileobj(data_file.file, tmp_data)
                 data_path = tmp_data.name
             if ext in [".csv", ".xls", ".xlsx"]:
-                df = pd.read_csv(data_path) if ext == ".csv" else pd.read_excel(data_path)
+                df = (
+                    pd.read_csv(data_path)
+                    if ext == ".csv"
+                    else pd.read_excel(data_path)
+                )
                 data_dict = df.iloc[0].to_dict()
             elif ext == ".json":
                 with open(data_path, "r", encoding="utf-8") as f:
@@ -324,12 +392,14 @@ def setup_document_routes(app, doc_processor, index):
         # 这里直接复用你给的AdaptiveLLMFormFiller核心逻辑
         # 为了集成，建议将AdaptiveLLMFormFiller类单独放到backend/wenshu/utils/llm_form_filler.py
         from ..utils.llm_form_filler import AdaptiveLLMFormFiller
+
         API_KEY = os.getenv("OPENAI_API_KEY", "sk-xxx")
         filler = AdaptiveLLMFormFiller(API_KEY)
         filler.load_document(docx_path)
-        fill_result = filler.fill_from_dict(data_dict)
+        async with request_scheduler.slot(WorkloadClass.AUTOFILL):
+            fill_result = await asyncio.to_thread(filler.fill_from_dict, data_dict)
         # 4. 保存新文档
-        output_path = docx_path.replace('.docx', '_auto_filled.docx')
+        output_path = docx_path.replace(".docx", "_auto_filled.docx")
         filler.save_document(output_path)
         # 5. 返回结果
         with open(output_path, "rb") as f:
@@ -338,5 +408,5 @@ def setup_document_routes(app, doc_processor, index):
             "status": "success",
             "filled_items": fill_result,
             "file_name": os.path.basename(output_path),
-            "file_bytes": filled_bytes.hex()  # 前端可用hex转回bytes
+            "file_bytes": filled_bytes.hex(),  # 前端可用hex转回bytes
         }
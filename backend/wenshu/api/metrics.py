@@ -0,0 +1,39 @@
+from ..agents.budget import budget_guard
+from ..agents.events import event_bus
+from ..agents.prefetch import speculative_prefetcher
+from ..agents.router import query_router
+from ..retrieval.early_exit import early_exit_policy
+from ..retrieval.embedding_cache import query_embedding_cache
+from ..retrieval.result_cache import chunk_retrieval_cache, document_selection_cache
+from ..retrieval.sharding import shard_router
+from ..services.agent_service import agent_service
+from ..services.answer_cache import answer_cache
+from ..services.conversation_store import conversation_store
+from ..services.history_service import history_manager
+from ..services.scheduler import request_scheduler
+from ..utils.streaming import stream_stats
+
+
+def setup_metrics_routes(app):
+    """Setup runtime metrics API routes"""
+
+    @app.get("/metrics")
+    async def get_metrics():
+        """Admission metrics per workload and retrieval cache hit rates"""
+        return {
+            "scheduler": request_scheduler.metrics(),
+            "query_embedding_cache": query_embedding_cache.metrics(),
+            "document_selection_cache": document_selection_cache.metrics(),
+            "chunk_retrieval_cache": chunk_retrieval_cache.metrics(),
+            "shard_routing": shard_router.metrics(),
+            "early_exit": early_exit_policy.metrics(),
+            "prefetch": speculative_prefetcher.metrics(),
+            "event_bus": event_bus.metrics(),
+            "agent_pool": agent_service.metrics(),
+            "answer_cache": answer_cache.metrics(),
+            "chat_history": history_manager.metrics(),
+            "conversations": conversation_store.metrics(),
+            "streaming": stream_stats.metrics(),
+            "query_router": query_router.metrics(),
+            "budget": budget_guard.metrics(),
+        }
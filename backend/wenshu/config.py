@@ -1,10 +1,16 @@
 import os
+import shutil
 
 import dotenv
+from llama_index.core import (
+    Settings,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
 from llama_index.core.callbacks import CallbackManager
 from llama_index.embeddings.openai_like import OpenAILikeEmbedding
 from llama_index.llms.google_genai import GoogleGenAI
-from llama_index.core import Settings, StorageContext, load_index_from_storage, VectorStoreIndex
 
 
 def init_settings(callback_manager: CallbackManager):
@@ -27,6 +33,152 @@ def init_settings(callback_manager: CallbackManager):
     Settings.callback_manager = callback_manager
 
 
+class VectorStoreMismatchError(RuntimeError):
+    """The docstore holds nodes the configured vector store has no embeddings for"""
+
+
+def _backend_dirs() -> dict:
+    """Sub-directory of the storage dir holding each matrix-based backend's files"""
+    from .vector_stores.ivf import IVF_DIR_NAME
+    from .vector_stores.mmap_store import MMAP_DIR_NAME
+    from .vector_stores.quantized_store import QUANTIZED_DIR_NAME
+
+    return {"mmap": MMAP_DIR_NAME, "ivf": IVF_DIR_NAME, "quantized": QUANTIZED_DIR_NAME}
+
+
+def create_vector_store(persist_dir: str):
+    """
+    Create the vector store backend selected by VECTOR_STORE_BACKEND.
+    Returns None for the llama-index SimpleVectorStore ("simple").
+    """
+    backend = VectorStoreConfig.BACKEND
+    if backend == "simple":
+        return None
+    if backend == "mmap":
+        from .vector_stores.mmap_store import MmapVectorStore
+
+        vector_store = MmapVectorStore.from_persist_dir(
+            persist_dir, dtype=VectorStoreConfig.EMBEDDING_DTYPE
+        )
+    elif backend == "quantized":
+        from .vector_stores.quantized_store import QuantizedVectorStore
+
+        vector_store = QuantizedVectorStore.from_persist_dir(
+            persist_dir,
+            dtype=VectorStoreConfig.EMBEDDING_DTYPE,
+            scheme=VectorStoreConfig.QUANTIZATION,
+            pq_m=VectorStoreConfig.PQ_M,
+            rerank_candidates=VectorStoreConfig.QUANTIZED_RERANK_CANDIDATES,
+        )
+    elif backend == "ivf":
+        from .vector_stores.ivf import IVFVectorStore
+
+        vector_store = IVFVectorStore.from_persist_dir(
+            persist_dir,
+            dtype=VectorStoreConfig.EMBEDDING_DTYPE,
+            nlist=VectorStoreConfig.IVF_NLIST,
+            nprobe=VectorStoreConfig.IVF_NPROBE,
+            train_threshold=VectorStoreConfig.IVF_TRAIN_THRESHOLD,
+        )
+    else:
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {backend}")
+    _import_simple_vector_store(persist_dir, vector_store)
+    _import_previous_backend(persist_dir, vector_store, backend)
+    return vector_store
+
+
+def _import_simple_vector_store(persist_dir: str, vector_store) -> None:
+    """One-time migration of embeddings from an existing vector_store.json"""
+    json_path = os.path.join(persist_dir, "default__vector_store.json")
+    if vector_store.size or not os.path.exists(json_path):
+        return
+
+    from llama_index.core.vector_stores import SimpleVectorStore
+
+    print(f"[VectorStore] Importing embeddings from {json_path}...")
+    simple_store = SimpleVectorStore.from_persist_path(json_path)
+    vector_store.import_embeddings(
+        simple_store.data.embedding_dict, simple_store.data.text_id_to_ref_doc_id
+    )
+    vector_store.persist(json_path)
+    os.replace(json_path, json_path + ".migrated")
+
+
+def _import_previous_backend(persist_dir: str, vector_store, backend: str) -> None:
+    """
+    One-time migration of embeddings after VECTOR_STORE_BACKEND changed between
+    mmap, ivf and quantized: all of them keep the full vectors in an
+    EmbeddingMatrix, so the new backend imports the old one's rows. The old
+    files are renamed to <dir>.migrated afterwards, so switching back later
+    imports the then-current rows again instead of loading stale ones.
+    """
+    if vector_store.size:
+        return
+
+    from .vector_stores.matrix import EmbeddingMatrix
+
+    for previous, dir_name in _backend_dirs().items():
+        directory = os.path.join(persist_dir, dir_name)
+        if previous == backend or not os.path.isdir(directory):
+            continue
+        matrix = EmbeddingMatrix(directory).load()
+        if not matrix.size:
+            continue
+        print(
+            f"[VectorStore] Importing {matrix.size} embeddings from the "
+            f"'{previous}' backend in {directory}..."
+        )
+        rows = matrix.alive_rows()
+        node_ids = [matrix.node_ids[row] for row in rows]
+        ref_doc_ids = [matrix.ref_doc_ids[row] for row in rows]
+        vectors = matrix.get(node_ids)
+        vector_store.import_embeddings(
+            dict(zip(node_ids, vectors)), dict(zip(node_ids, ref_doc_ids))
+        )
+        vector_store.persist(persist_dir)
+        del matrix, vectors  # release the memory map before renaming its file
+        if os.path.isdir(directory + ".migrated"):
+            shutil.rmtree(directory + ".migrated")
+        os.replace(directory, directory + ".migrated")
+        return
+
+
+def _check_vector_store(storage_context: StorageContext, persist_dir: str) -> None:
+    """Refuses to serve an index whose nodes have no embeddings in the vector store"""
+    vector_store = storage_context.vector_store
+    stored = getattr(vector_store, "size", None)
+    if stored is None:
+        # SimpleVectorStore
+        stored = len(vector_store.data.embedding_dict)
+    indexed = sum(
+        len(getattr(struct, "nodes_dict", {}))
+        for struct in storage_context.index_store.index_structs()
+    )
+    if indexed and not stored:
+        raise VectorStoreMismatchError(
+            f"The index in '{persist_dir}' has {indexed} nodes but the "
+            f"'{VectorStoreConfig.BACKEND}' vector store has no embeddings for them. "
+            "VECTOR_STORE_BACKEND was probably changed without the previous "
+            "backend's files; set it back, restore those files, or rebuild the index."
+        )
+    if stored != indexed:
+        print(
+            f"⚠️ Vector store in '{persist_dir}' holds {stored} embeddings "
+            f"for {indexed} indexed nodes."
+        )
+
+
+def load_storage_context(persist_dir: str, fresh: bool = False) -> StorageContext:
+    """Build a StorageContext using the configured vector store backend"""
+    vector_store = create_vector_store(persist_dir)
+    if fresh:
+        return StorageContext.from_defaults(vector_store=vector_store)
+    storage_context = StorageContext.from_defaults(
+        persist_dir=persist_dir, vector_store=vector_store
+    )
+    _check_vector_store(storage_context, persist_dir)
+    return storage_context
+
 
 def load_vector_index(persist_dir: str | None = None):
     """
@@ -38,38 +190,64 @@ def load_vector_index(persist_dir: str | None = None):
 
     # 确保存储目录存在
     os.makedirs(persist_dir, exist_ok=True)
-    
+
     # 检查索引是否已存在 (通过检查关键文件)
     # LlamaIndex 默认会创建 docstore.json, vector_store.json 等文件
     if not os.path.exists(os.path.join(persist_dir, "docstore.json")):
         # 如果索引不存在，则创建一个新的空索引
         print(f"⚠️ Index not found in '{persist_dir}'. Creating a new empty index.")
-        
+
         # 创建一个空的文档列表
         documents = []
         # 从空文档创建一个新的索引
-        index = VectorStoreIndex.from_documents(documents)
+        index = VectorStoreIndex.from_documents(
+            documents, storage_context=load_storage_context(persist_dir, fresh=True)
+        )
         # 将这个新创建的空索引立即持久化，以便下次启动时可以加载
         index.storage_context.persist(persist_dir=persist_dir)
-        
+
         print("✅ New empty index created and persisted.")
         return index
     else:
         # 如果索引已存在，则加载它
         try:
             print(f"✅ Found existing index in '{persist_dir}'. Loading...")
-            storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+            storage_context = load_storage_context(persist_dir)
             index = load_index_from_storage(storage_context)
             print("✅ Index loaded successfully.")
             return index
+        except VectorStoreMismatchError:
+            # Replacing the index with an empty one would drop the docstore too
+            raise
         except Exception as e:
             # 如果加载失败（例如文件损坏），也创建一个新的
-            print(f"❌ Failed to load existing index: {e}. Creating a new empty index as a fallback.")
+            print(
+                f"❌ Failed to load existing index: {e}. Creating a new empty index as a fallback."
+            )
             documents = []
-            index = VectorStoreIndex.from_documents(documents)
+            index = VectorStoreIndex.from_documents(
+                documents, storage_context=load_storage_context(persist_dir, fresh=True)
+            )
             index.storage_context.persist(persist_dir=persist_dir)
             return index
 
+
+def load_knowledge_index(persist_dir: str | None = None):
+    """
+    Load the knowledge base: one index per SHARD_FIELD value under
+    <persist_dir>/shards, or a single index when SHARD_FIELD is empty.
+    """
+    if persist_dir is None:
+        persist_dir = os.getenv("STORAGE_DIR", "data/storage")
+    if not VectorStoreConfig.SHARD_FIELD:
+        return load_vector_index(persist_dir)
+
+    from .retrieval.sharding import ShardedIndex
+
+    os.makedirs(persist_dir, exist_ok=True)
+    return ShardedIndex.load(persist_dir, VectorStoreConfig.SHARD_FIELD)
+
+
 # API Configuration
 class APIConfig:
     TITLE = "中国人民大学信息学院「文枢」大模型"
@@ -87,5 +265,170 @@ class APIConfig:
     TEMP_UPLOAD_DIR = os.getenv("TEMP_UPLOAD_DIR", "data/temp_uploads")
     DOCUMENTS_DIR = os.getenv("DOCUMENTS_DIR", "data/documents")
     LOG_DIR = os.getenv("LOG_DIR", "data/logs")
+    CONVERSATIONS_DB = os.getenv("CONVERSATIONS_DB", "data/conversations.sqlite3")
+
+    # Background sync of DOCUMENTS_DIR into the knowledge base
+    DOCUMENTS_SYNC_ENABLED = (
+        os.getenv("DOCUMENTS_SYNC_ENABLED", "false").lower() == "true"
+    )
+    DOCUMENTS_SYNC_INTERVAL = float(os.getenv("DOCUMENTS_SYNC_INTERVAL", "300"))
+    DOCUMENTS_SYNC_MAX_FILES_PER_MINUTE = float(
+        os.getenv("DOCUMENTS_SYNC_MAX_FILES_PER_MINUTE", "6")
+    )
+
+
+# Vector store backend used by the knowledge base index
+class VectorStoreConfig:
+    # "mmap" (exact, memory-mapped binary matrix), "ivf" (approximate, on top
+    # of the same matrix), "quantized" (compact codes in RAM + exact re-score
+    # from the matrix) or "simple" (llama-index vector_store.json)
+    BACKEND = os.getenv("VECTOR_STORE_BACKEND", "mmap").lower()
+    # float16 halves disk / page-cache footprint at a negligible recall cost
+    EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32").lower()
+
+    IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = ~4 * sqrt(corpus size)
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+    IVF_TRAIN_THRESHOLD = int(os.getenv("IVF_TRAIN_THRESHOLD", "4096"))
+
+    # "int8" (4x smaller than float32) or "pq" (PQ_M bytes per vector)
+    QUANTIZATION = os.getenv("QUANTIZATION", "int8").lower()
+    PQ_M = int(os.getenv("PQ_M", "64"))  # must divide the embedding dim
+    QUANTIZED_RERANK_CANDIDATES = int(os.getenv("QUANTIZED_RERANK_CANDIDATES", "200"))
+
+    # Metadata field the knowledge base is sharded by (one index per value,
+    # persisted / rebuilt independently); empty = a single index
+    SHARD_FIELD = os.getenv("SHARD_FIELD", "document_schema")
+
+
+# Retrieval used by the researcher tool
+class RetrievalConfig:
+    SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "5"))
+
+    # Fuse dense results with a BM25 index over node text (reciprocal-rank fusion)
+    HYBRID_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+    HYBRID_CANDIDATE_TOP_K = int(os.getenv("HYBRID_CANDIDATE_TOP_K", "20"))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+
+    # Over-fetch candidates, collapse duplicates and pick a diverse top-k with
+    # MMR over the stored embeddings (no extra model calls)
+    DIVERSIFY_ENABLED = os.getenv("DIVERSIFY_ENABLED", "true").lower() == "true"
+    MMR_CANDIDATE_TOP_K = int(os.getenv("MMR_CANDIDATE_TOP_K", "20"))
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.97"))
+
+    # Token budget of the evaluation prompt's context: nodes longer than their
+    # share are cut down to their most query-relevant sentences
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+    CONTEXT_MIN_TOKENS_PER_NODE = int(os.getenv("CONTEXT_MIN_TOKENS_PER_NODE", "200"))
+
+    # Search only the shard an unfiltered query clearly targets ("论文" ->
+    # academic_paper) instead of fanning out to all of them
+    SHARD_ROUTING_ENABLED = os.getenv("SHARD_ROUTING_ENABLED", "true").lower() == "true"
+
+    # Skip the LLM sufficiency evaluation of a single-query step when the best
+    # node's cosine to the query and its margin over the next pass these
+    EARLY_EXIT_ENABLED = os.getenv("EARLY_EXIT_ENABLED", "true").lower() == "true"
+    EARLY_EXIT_MIN_SCORE = float(os.getenv("EARLY_EXIT_MIN_SCORE", "0.85"))
+    EARLY_EXIT_MIN_MARGIN = float(os.getenv("EARLY_EXIT_MIN_MARGIN", "0.05"))
+
+    # Two-stage retrieval: pick the best documents from the per-document
+    # summary index, then search chunks only inside them (corpora with at
+    # least HIERARCHICAL_MIN_DOCUMENTS candidate documents)
+    HIERARCHICAL_ENABLED = (
+        os.getenv("HIERARCHICAL_RETRIEVAL_ENABLED", "true").lower() == "true"
+    )
+    HIERARCHICAL_TOP_DOCUMENTS = int(os.getenv("HIERARCHICAL_TOP_DOCUMENTS", "200"))
+    HIERARCHICAL_MIN_DOCUMENTS = int(os.getenv("HIERARCHICAL_MIN_DOCUMENTS", "1000"))
+    SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "2000"))
+
+    # Cache of both retrieval stages, cleared whenever the index changes
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+    RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+
+    # Semantic cache of first-turn chat answers: a query whose embedding is
+    # this similar to a cached one (same numbers / filters, same index
+    # version) replays the cached answer instead of researching again
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+    # Retrieve an insufficient step's suggested next queries in the background
+    PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+    PREFETCH_MAX_QUERIES = int(os.getenv("PREFETCH_MAX_QUERIES", "3"))
+
+    # Context cap when one research step searches several queries at once
+    MULTI_QUERY_MAX_NODES = int(os.getenv("MULTI_QUERY_MAX_NODES", "10"))
+
+    # In-process LRU cache of query embeddings (skips the embedding server round trip)
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+    QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+
+
+# Admission control for the worker's LLM / CPU slots (see services/scheduler.py)
+class SchedulerConfig:
+    TOTAL_SLOTS = int(os.getenv("SCHEDULER_TOTAL_SLOTS", "8"))
+    CHAT_RESERVED_SLOTS = int(os.getenv("SCHEDULER_CHAT_RESERVED_SLOTS", "2"))
+
+    # Agent state and step events are per request, so a worker can serve
+    # several chats at once; the limit protects the LLM backend
+    CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "4"))
+    CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "16"))
+    CHAT_MAX_WAIT = float(os.getenv("CHAT_MAX_WAIT", "30"))
+    # Step events buffered per chat stream before the agent waits for the client
+    CHAT_EVENT_BUFFER = int(os.getenv("CHAT_EVENT_BUFFER", "64"))
+
+    AUTOFILL_MAX_CONCURRENCY = int(os.getenv("AUTOFILL_MAX_CONCURRENCY", "2"))
+    AUTOFILL_MAX_QUEUE = int(os.getenv("AUTOFILL_MAX_QUEUE", "8"))
+    AUTOFILL_MAX_WAIT = float(os.getenv("AUTOFILL_MAX_WAIT", "60"))
+
+    INGESTION_MAX_CONCURRENCY = int(os.getenv("INGESTION_MAX_CONCURRENCY", "2"))
+    INGESTION_MAX_QUEUE = int(os.getenv("INGESTION_MAX_QUEUE", "8"))
+    INGESTION_MAX_WAIT = float(os.getenv("INGESTION_MAX_WAIT", "120"))
+
+
+class ChatConfig:
+    # Chat history sent to the agent: the last HISTORY_KEEP_TURNS exchanges
+    # verbatim, older ones folded into a rolling summary. Verbatim turns
+    # beyond HISTORY_TOKEN_BUDGET are folded too
+    HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+    HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "400"))
+    HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))
+
+    # Server-side conversations kept in memory (the rest are read from SQLite)
+    CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "256"))
+    # Conversations unused for this many days are deleted (0 keeps them forever)
+    CONVERSATION_TTL_DAYS = float(os.getenv("CONVERSATION_TTL_DAYS", "30"))
+
+    # Query router: small talk is answered without retrieval, simple lookups
+    # with one retrieval and one answer call, the rest by the research loop.
+    # The embedding stage needs ROUTER_MIN_SIMILARITY to the nearest example
+    # and ROUTER_MIN_MARGIN over the other routes; a single-shot query whose
+    # best hit scores under ROUTER_SINGLE_SHOT_MIN_SCORE goes to research
+    ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+    ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.5"))
+    ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.02"))
+    ROUTER_MAX_SINGLE_SHOT_CHARS = int(os.getenv("ROUTER_MAX_SINGLE_SHOT_CHARS", "60"))
+    ROUTER_SINGLE_SHOT_MIN_SCORE = float(
+        os.getenv("ROUTER_SINGLE_SHOT_MIN_SCORE", "0.5")
+    )
+
+    # Per-request budgets (0 = no limit). Past any of them the researcher
+    # stops searching and the agent answers from the findings so far; an
+    # agent still reasoning REQUEST_SYNTHESIS_GRACE_SECONDS after the
+    # deadline is stopped and the answer is synthesized from the findings
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+    REQUEST_MAX_RESEARCH_STEPS = int(os.getenv("REQUEST_MAX_RESEARCH_STEPS", "4"))
+    REQUEST_MAX_PROMPT_TOKENS = int(os.getenv("REQUEST_MAX_PROMPT_TOKENS", "60000"))
+    REQUEST_SYNTHESIS_GRACE_SECONDS = float(
+        os.getenv("REQUEST_SYNTHESIS_GRACE_SECONDS", "30")
+    )
 
-#帮我解释一下现在ruc-rag这个文件夹里面的代码在干什么东西，详细说明
\ No newline at end of file
+    # SSE framing of the answer: after the first token, tokens are coalesced
+    # into one frame per STREAM_COALESCE_MS or STREAM_MAX_FRAME_BYTES. Idle
+    # streams get a heartbeat comment every STREAM_HEARTBEAT_SECONDS so
+    # proxies don't drop them during long research steps
+    STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "40"))
+    STREAM_MAX_FRAME_BYTES = int(os.getenv("STREAM_MAX_FRAME_BYTES", "1024"))
+    STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
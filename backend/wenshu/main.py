@@ -3,20 +3,24 @@ from fastapi.middleware.cors import CORSMiddleware
 from llama_index.core.callbacks import CallbackManager
 
 from .agents.callbacks import StreamingCallbackHandler
+from .api.autofill import setup_autofill_routes
 from .api.chat import setup_chat_routes
 from .api.documents import setup_document_routes
-from .api.autofill import setup_autofill_routes
+from .api.metrics import setup_metrics_routes
 
 # Import our modules
-from .config import APIConfig, init_settings, load_vector_index
+from .config import APIConfig, init_settings, load_knowledge_index
 from .processors.document_processor import DocumentProcessor
 from .services.agent_service import agent_service
+from .services.ingestion_service import ingestion_service
+from .services.sync_service import DocumentSyncService
 
 # Global variables for sharing between modules
 index = None
 callback_handler = None
 doc_processor = None
 search_tool = None
+sync_service = None
 
 
 def create_app() -> FastAPI:
@@ -47,7 +51,7 @@ def initialize_system() -> None:
     init_settings(callback_manager)
 
     # Load vector index
-    index = load_vector_index()
+    index = load_knowledge_index()
 
     # Initialize document processor
     from llama_index.core import Settings
@@ -57,6 +61,9 @@ def initialize_system() -> None:
     # Initialize the agent service with the index and callback manager
     agent_service.initialize(index, callback_manager)
 
+    # All writes to the index go through the ingestion service
+    ingestion_service.initialize(index)
+
     print("✅ System initialization completed!")
 
 
@@ -73,6 +80,7 @@ def main() -> FastAPI:
     setup_chat_routes(app, callback_handler)
     setup_document_routes(app, doc_processor, index)
     setup_autofill_routes(app)
+    setup_metrics_routes(app)
 
     # Health check endpoint
     @app.get("/health")
@@ -82,6 +90,7 @@ def main() -> FastAPI:
             "index_loaded": index is not None,
             "agent_service_ready": agent_service._index is not None,
             "doc_processor_ready": doc_processor is not None,
+            "documents_sync": sync_service.status() if sync_service else None,
         }
 
     return app
@@ -94,12 +103,20 @@ app = create_app()
 # Initialize on startup
 @app.on_event("startup")
 async def startup_event() -> None:
+    global sync_service
+
     initialize_system()
 
+    # Start polling DOCUMENTS_DIR in the background if enabled
+    if APIConfig.DOCUMENTS_SYNC_ENABLED and doc_processor:
+        sync_service = DocumentSyncService(doc_processor)
+        sync_service.start()
+
     # Setup routes after initialization
     setup_chat_routes(app, callback_handler)
     setup_document_routes(app, doc_processor, index)
     setup_autofill_routes(app)
+    setup_metrics_routes(app)
 
     @app.get("/health")
     async def health_check():
@@ -108,9 +125,16 @@ async def startup_event() -> None:
             "index_loaded": index is not None,
             "agent_service_ready": agent_service._index is not None,
             "doc_processor_ready": doc_processor is not None,
+            "documents_sync": sync_service.status() if sync_service else None,
         }
 
 
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    if sync_service:
+        await sync_service.stop()
+
+
 if __name__ == "__main__":
     import uvicorn
 
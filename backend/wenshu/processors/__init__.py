@@ -3,5 +3,6 @@ Document processors
 """
 
 from .document_processor import DocumentProcessor
+from .spreadsheet_processor import SpreadsheetProcessor
 
-__all__ = ["DocumentProcessor"]
+__all__ = ["DocumentProcessor", "SpreadsheetProcessor"]
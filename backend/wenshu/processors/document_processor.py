@@ -1,23 +1,36 @@
-from typing import List, Dict, Any, Tuple
+import json
+import os
 from datetime import datetime
 from pathlib import Path
-import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
+from docling_core.transforms.chunker.hybrid_chunker import HybridChunker
+from docling_core.types.doc.document import DoclingDocument
+from docx import Document
 from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.output_parsers import PydanticOutputParser
+from llama_index.core.program import LLMTextCompletionProgram
 from llama_index.core.readers.base import BaseReader
+from llama_index.core.schema import BaseNode
 from llama_index.node_parser.docling import DoclingNodeParser  # type: ignore
 from llama_index.readers.docling import DoclingReader  # type: ignore
-from llama_index.core.output_parsers import PydanticOutputParser
-from llama_index.core.program import LLMTextCompletionProgram
-from docling_core.transforms.chunker.hybrid_chunker import HybridChunker
-from docling_core.types.doc.document import DoclingDocument
 
-from ..models.document_schemas import DOCUMENT_TYPE_REGISTRY, get_model_for_type
 from ..config import APIConfig
+from ..models.document_schemas import DOCUMENT_TYPE_REGISTRY, get_model_for_type
+from .spreadsheet_processor import SPREADSHEET_SOURCE_KEY, SpreadsheetProcessor
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most batch_size items without materializing it"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-import os
-from typing import List, Dict
-from docx import Document
 
 class DocumentProcessor:
     """Handle document processing and metadata extraction using Pydantic models and Docling
@@ -39,7 +52,6 @@ class DocumentProcessor:
             ".docx": self.docling_reader,
             ".pptx": self.docling_reader,
             ".pdf": self.docling_reader,
-            ".xlsx": self.docling_reader,
             ".txt": None,  # Use default for text files
             ".md": None,  # Use default for markdown
         }
@@ -49,6 +61,9 @@ class DocumentProcessor:
             chunker=HybridChunker(tokenizer="Qwen/Qwen3-Embedding-4B", max_tokens=10240)
         )
 
+        # 电子表格走独立的流式读取路径，不经过 DoclingReader
+        self.spreadsheet_processor = SpreadsheetProcessor()
+
     def identify_document_type(self, filename: str, content: str) -> str:
         """Identify document type based on filename and content"""
         filename_lower = filename.lower()
@@ -97,6 +112,14 @@ class DocumentProcessor:
         """
         file_extension = file_path.suffix.lower()
 
+        if self.spreadsheet_processor.is_spreadsheet(file_path):
+            print("[Spreadsheet] Streaming workbook preview in read-only mode...")
+            markdown_content, spreadsheet_doc = (
+                self.spreadsheet_processor.read_document(file_path)
+            )
+            print(f"  - Preview Markdown length: {len(markdown_content)} characters")
+            return markdown_content, spreadsheet_doc
+
         try:
             if (
                 file_extension in self.file_extractor
@@ -229,11 +252,19 @@ class DocumentProcessor:
 
     def process_document_for_storage(
         self, original_document: Document, validated_metadata: Dict[str, Any]
-    ) -> List:
+    ) -> Iterable[BaseNode]:
         """Process document for final storage using DoclingNodeParser
 
-        使用原始的 DoclingDocument JSON 格式进行高质量的 chunking
+        使用原始的 DoclingDocument JSON 格式进行高质量的 chunking；
+        电子表格返回一个按行分组流式生成节点的迭代器
         """
+        spreadsheet_path = original_document.metadata.get(SPREADSHEET_SOURCE_KEY)
+        if spreadsheet_path:
+            print("[Storage] Streaming spreadsheet rows into nodes...")
+            return self.spreadsheet_processor.iter_nodes(
+                Path(spreadsheet_path), validated_metadata, original_document
+            )
+
         # Add validated metadata to document
         original_document.metadata.update(validated_metadata)
 
@@ -275,4 +306,5 @@ class DocumentProcessor:
             for doc_type in DOCUMENT_TYPE_REGISTRY.keys()
         }
 
-#
\ No newline at end of file
+
+#
@@ -0,0 +1,212 @@
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from llama_index.core import Document
+from llama_index.core.schema import NodeRelationship, TextNode
+
+# Document metadata key marking a Document produced by the spreadsheet path.
+# The text of such a Document is empty; rows are streamed from the file at storage time.
+SPREADSHEET_SOURCE_KEY = "spreadsheet_source_path"
+
+
+def _trim_trailing(cells: List[str]) -> List[str]:
+    """Cells without the empty ones at the end of the row"""
+    end = len(cells)
+    while end and not cells[end - 1]:
+        end -= 1
+    return cells[:end]
+
+
+def _format_cell(value: Any) -> str:
+    """Render a cell value as compact text"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+class SpreadsheetProcessor:
+    """Stream spreadsheet rows into header-aware nodes with bounded memory
+
+    与 DoclingReader 把整个工作簿当作一张大表不同，这里以只读模式逐行读取：
+    - 每个工作表都会处理，第一行非空行视为表头
+    - 连续的数据行按行数/字符数分组，每组生成一个节点，携带工作表名和行号范围
+    - 任意时刻只在内存中保留一个分组，耗时与行数成线性关系
+    """
+
+    SUPPORTED_EXTENSIONS = {".xlsx", ".xlsm", ".xls"}
+
+    def __init__(
+        self,
+        rows_per_node: int = 50,
+        max_chars_per_node: int = 4000,
+        preview_rows_per_sheet: int = 20,
+    ):
+        self.rows_per_node = rows_per_node
+        self.max_chars_per_node = max_chars_per_node
+        self.preview_rows_per_sheet = preview_rows_per_sheet
+
+    def is_spreadsheet(self, file_path: Path) -> bool:
+        return file_path.suffix.lower() in self.SUPPORTED_EXTENSIONS
+
+    def iter_sheet_rows(
+        self, file_path: Path
+    ) -> Iterator[Tuple[str, Iterator[Tuple[int, Sequence[Any]]]]]:
+        """Yield (sheet_name, rows) for every sheet, rows being (1-based row number, values)"""
+        if file_path.suffix.lower() == ".xls":
+            yield from self._iter_xls_rows(file_path)
+        else:
+            yield from self._iter_xlsx_rows(file_path)
+
+    def _iter_xlsx_rows(self, file_path: Path):
+        from openpyxl import load_workbook
+
+        # read_only 模式下 openpyxl 按需解析 XML，不会把整个工作表加载进内存
+        workbook = load_workbook(str(file_path), read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                rows = (
+                    (row_number, values)
+                    for row_number, values in enumerate(
+                        worksheet.iter_rows(values_only=True), start=1
+                    )
+                )
+                yield worksheet.title, rows
+        finally:
+            workbook.close()
+
+    def _iter_xls_rows(self, file_path: Path):
+        import xlrd
+
+        # on_demand 模式下每次只加载一个工作表，处理完立即释放
+        workbook = xlrd.open_workbook(str(file_path), on_demand=True)
+        try:
+            for sheet_index in range(workbook.nsheets):
+                sheet = workbook.sheet_by_index(sheet_index)
+                rows = (
+                    (row_number, [cell.value for cell in row])
+                    for row_number, row in enumerate(sheet.get_rows(), start=1)
+                )
+                yield sheet.name, rows
+                workbook.unload_sheet(sheet_index)
+        finally:
+            workbook.release_resources()
+
+    def _iter_row_groups(
+        self, rows: Iterator[Tuple[int, Sequence[Any]]]
+    ) -> Iterator[Tuple[List[str], int, int, List[str]]]:
+        """Group data rows under the sheet header
+
+        Yields (headers, row_start, row_end, rendered_rows).
+        """
+        headers: Optional[List[str]] = None
+        raw_header: List[str] = []
+        group: List[str] = []
+        group_chars = 0
+        row_start = row_end = 0
+
+        for row_number, values in rows:
+            cells = [_format_cell(value) for value in values]
+            if not any(cells):
+                continue
+
+            if headers is None:
+                raw_header = _trim_trailing(cells)
+                headers = [cell or f"列{i + 1}" for i, cell in enumerate(cells)]
+                continue
+
+            # 统计报表中常见的分页重复表头，直接跳过（与原始表头整行一致才算，含空单元格）
+            if _trim_trailing(cells) == raw_header:
+                continue
+
+            rendered = "; ".join(
+                f"{headers[i] if i < len(headers) else f'列{i + 1}'}: {cell}"
+                for i, cell in enumerate(cells)
+                if cell
+            )
+
+            if group and (
+                len(group) >= self.rows_per_node
+                or group_chars + len(rendered) > self.max_chars_per_node
+            ):
+                yield headers, row_start, row_end, group
+                group, group_chars = [], 0
+
+            if not group:
+                row_start = row_number
+            group.append(rendered)
+            group_chars += len(rendered)
+            row_end = row_number
+
+        if group and headers is not None:
+            yield headers, row_start, row_end, group
+
+    def iter_nodes(
+        self,
+        file_path: Path,
+        metadata: Dict[str, Any],
+        source_document: Optional[Document] = None,
+    ) -> Iterator[TextNode]:
+        """Stream TextNodes for every sheet of a workbook
+
+        source_document 用于建立 SOURCE 关系，使节点可以按 ref_doc_id 整体删除
+        """
+        relationships = (
+            {NodeRelationship.SOURCE: source_document.as_related_node_info()}
+            if source_document is not None
+            else {}
+        )
+        for sheet_name, rows in self.iter_sheet_rows(file_path):
+            for headers, row_start, row_end, group in self._iter_row_groups(rows):
+                text = (
+                    f"工作表: {sheet_name}（第 {row_start}-{row_end} 行）\n"
+                    f"表头: {' | '.join(headers)}\n" + "\n".join(group)
+                )
+                yield TextNode(
+                    text=text,
+                    metadata={
+                        **metadata,
+                        "sheet_name": sheet_name,
+                        "row_start": row_start,
+                        "row_end": row_end,
+                    },
+                    relationships=relationships,
+                )
+
+    def export_preview_markdown(self, file_path: Path) -> str:
+        """Export the header and first rows of every sheet as Markdown for metadata extraction"""
+        sections = []
+        for sheet_name, rows in self.iter_sheet_rows(file_path):
+            lines = [f"## {sheet_name}", ""]
+            header_written = False
+            data_rows = 0
+            for _, values in rows:
+                cells = [_format_cell(value).replace("|", "\\|") for value in values]
+                if not any(cells):
+                    continue
+                lines.append("| " + " | ".join(cells) + " |")
+                if not header_written:
+                    lines.append("|" + " --- |" * len(cells))
+                    header_written = True
+                    continue
+                data_rows += 1
+                if data_rows >= self.preview_rows_per_sheet:
+                    break
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+    def read_document(self, file_path: Path) -> Tuple[str, Document]:
+        """Return (markdown preview, placeholder Document) without loading the workbook
+
+        占位 Document 只记录源文件路径，真正的行数据在存储阶段由 iter_nodes 流式读取。
+        """
+        markdown_content = self.export_preview_markdown(file_path)
+        document = Document(
+            text="",
+            metadata={SPREADSHEET_SOURCE_KEY: str(file_path)},
+        )
+        return markdown_content, document
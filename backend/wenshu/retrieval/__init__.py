@@ -0,0 +1,39 @@
+"""
+Retrieval components used by the researcher
+"""
+
+from .context_packer import ContextPacker, PackedPassage
+from .diversify import collapse_duplicates, diversify, mmr_select, stored_embeddings
+from .early_exit import EarlyExitPolicy, early_exit_policy
+from .embedding_cache import QueryEmbeddingCache, query_embedding_cache
+from .hybrid import HybridRetriever, dense_retriever, reciprocal_rank_fusion
+from .metadata_index import DocumentFilter, MetadataIndex, metadata_index
+from .result_cache import RetrievalResultCache
+from .sparse_index import SparseIndex, sparse_index, tokenize
+from .summary_index import DocumentSummaryIndex, build_summary_text, summary_index
+
+__all__ = [
+    "ContextPacker",
+    "DocumentFilter",
+    "DocumentSummaryIndex",
+    "EarlyExitPolicy",
+    "HybridRetriever",
+    "MetadataIndex",
+    "PackedPassage",
+    "QueryEmbeddingCache",
+    "RetrievalResultCache",
+    "SparseIndex",
+    "build_summary_text",
+    "collapse_duplicates",
+    "dense_retriever",
+    "diversify",
+    "early_exit_policy",
+    "metadata_index",
+    "mmr_select",
+    "query_embedding_cache",
+    "reciprocal_rank_fusion",
+    "sparse_index",
+    "stored_embeddings",
+    "summary_index",
+    "tokenize",
+]
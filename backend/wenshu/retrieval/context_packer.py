@@ -0,0 +1,185 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.utils import get_tokenizer
+
+from .sparse_index import tokenize
+
+# Sentence ends: Chinese / English terminators, or line breaks
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;])|(?<=\.)\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def source_reference(node: NodeWithScore, position: int) -> str:
+    """'[1] 通知.pdf' plus the sheet / row range for spreadsheet chunks"""
+    metadata = node.node.metadata
+    reference = f"[{position}] {metadata.get('file_name', 'N/A')}"
+    if metadata.get("sheet_name"):
+        reference += (
+            f" · {metadata['sheet_name']}"
+            f" 行 {metadata.get('row_start')}-{metadata.get('row_end')}"
+        )
+    return reference
+
+
+@dataclass
+class PackedPassage:
+    node_id: str
+    reference: str
+    text: str
+    tokens: int
+    truncated: bool
+
+
+class ContextPacker:
+    """
+    Packs retrieved nodes into a prompt context of at most `token_budget` tokens.
+
+    Nodes are visited in relevance order (retrieval score blended with the
+    query / stored-embedding cosine). Each gets a share of the remaining
+    budget proportional to its relevance; a node longer than its share is cut
+    down to its most query-relevant sentences (query token overlap), kept in
+    document order with gaps marked by "…" (or, when no single sentence
+    fits, to the start of its best one). Every passage is prefixed with
+    its source reference so the evaluation can still cite documents.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        min_tokens_per_node: int = 200,
+        tokenizer: Optional[Callable[[str], List[int]]] = None,
+    ):
+        self.token_budget = token_budget
+        self.min_tokens_per_node = min_tokens_per_node
+        self._tokenizer = tokenizer or get_tokenizer()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._tokenizer(text))
+
+    @staticmethod
+    def _relevance(
+        nodes: Sequence[NodeWithScore],
+        embeddings: Optional[np.ndarray],
+        query_embedding: Optional[Sequence[float]],
+    ) -> np.ndarray:
+        scores = np.array([n.score or 0.0 for n in nodes], dtype=np.float32)
+        spread = scores.max() - scores.min()
+        relevance = (
+            (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        )
+        if embeddings is not None and query_embedding is not None:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            cosine = np.clip(embeddings @ query, 0.0, 1.0)
+            relevance = 0.5 * relevance + 0.5 * cosine
+        # Every node keeps a small weight so it is never starved completely
+        return relevance + 0.05
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """Longest prefix of the text that fits the budget with its "…" marker"""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle] + "…") <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low].rstrip() + "…" if low else ""
+
+    def _select_sentences(self, text: str, query_terms: set, budget: int) -> str:
+        sentences = split_sentences(text)
+        tokens = [self.count_tokens(s) for s in sentences]
+        scores = []
+        for i, sentence in enumerate(sentences):
+            terms = set(tokenize(sentence))
+            # Bigrams / whole words count double: they carry more of the query
+            overlap = sum(2 if len(t) > 1 else 1 for t in terms & query_terms)
+            score = overlap / np.sqrt(max(tokens[i], 1))
+            if i == 0:
+                score += 0.1  # Leading sentence usually carries the title
+            scores.append(score)
+
+        # Sentences sharing no query term only fill in when nothing matched,
+        # in which case the node's opening is the best summary we have
+        matched = [
+            i for i in np.argsort(-np.array(scores), kind="stable") if scores[i] > 0.1
+        ]
+        candidates = matched or range(len(sentences))
+        chosen, used = [], 0
+        for i in candidates:
+            if used + tokens[i] > budget:
+                continue
+            chosen.append(i)
+            used += tokens[i]
+        if not chosen and sentences:
+            # Not even one sentence fits (long unpunctuated chunks, table
+            # rows): keep the start of the best one rather than the node
+            return self._truncate(sentences[next(iter(candidates))], budget)
+        chosen.sort()
+
+        parts, previous = [], -1
+        for i in chosen:
+            if previous >= 0 and i != previous + 1:
+                parts.append("…")
+            parts.append(sentences[i])
+            previous = i
+        return " ".join(parts)
+
+    def pack(
+        self,
+        queries: Sequence[str],
+        nodes: Sequence[NodeWithScore],
+        embeddings: Optional[np.ndarray] = None,
+        query_embedding: Optional[Sequence[float]] = None,
+    ) -> List[PackedPassage]:
+        if not nodes:
+            return []
+        query_terms = set(tokenize(" ".join(queries)))
+        relevance = self._relevance(nodes, embeddings, query_embedding)
+        order = np.argsort(-relevance)
+
+        passages: List[Optional[PackedPassage]] = [None] * len(nodes)
+        remaining = self.token_budget
+        remaining_weight = float(relevance.sum())
+        for i in order:
+            node = nodes[i]
+            reference = source_reference(node, i + 1)
+            text = node.node.get_content()
+            header_tokens = self.count_tokens(reference) + 2
+            share = remaining * relevance[i] / remaining_weight
+            allotment = int(max(self.min_tokens_per_node, share)) - header_tokens
+            allotment = min(allotment, remaining - header_tokens)
+            remaining_weight -= float(relevance[i])
+            if allotment <= 0:
+                continue
+
+            tokens = self.count_tokens(text)
+            truncated = tokens > allotment
+            if truncated:
+                text = self._select_sentences(text, query_terms, allotment)
+                if not text:
+                    continue
+                tokens = self.count_tokens(text)
+
+            passages[i] = PackedPassage(
+                node_id=node.node.node_id,
+                reference=reference,
+                text=text,
+                tokens=tokens + header_tokens,
+                truncated=truncated,
+            )
+            remaining -= tokens + header_tokens
+
+        # Present passages in retrieval order, as before
+        return [p for p in passages if p is not None]
+
+    @staticmethod
+    def render(passages: Sequence[PackedPassage]) -> str:
+        return "\n\n".join(f"{p.reference}\n{p.text}" for p in passages)
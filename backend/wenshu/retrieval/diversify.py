@@ -0,0 +1,139 @@
+import hashlib
+import re
+from typing import List, Optional, Sequence, Set
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from ..vector_stores.matrix import normalize_rows
+
+# Whitespace and punctuation ignored when comparing chunk texts
+_NOISE = re.compile(r"[\s\W_]+")
+# Character shingle length for near-duplicate text detection
+_SHINGLE = 4
+
+
+def stored_embeddings(
+    index: VectorStoreIndex, node_ids: Sequence[str]
+) -> Optional[np.ndarray]:
+    """
+    Normalized embeddings of the given nodes as already held by the vector
+    store (no model call), or None if the store can't return them.
+    """
+    vector_store = index.vector_store
+    if hasattr(vector_store, "get_embeddings"):
+        return vector_store.get_embeddings(list(node_ids))
+    if isinstance(vector_store, SimpleVectorStore):
+        try:
+            return normalize_rows([vector_store.get(node_id) for node_id in node_ids])
+        except KeyError:
+            return None
+    return None
+
+
+def _fingerprint(text: str) -> str:
+    return _NOISE.sub("", text).lower()
+
+
+def _shingles(fingerprint: str) -> Set[int]:
+    if len(fingerprint) <= _SHINGLE:
+        return {hash(fingerprint)}
+    return {
+        hash(fingerprint[i : i + _SHINGLE])
+        for i in range(len(fingerprint) - _SHINGLE + 1)
+    }
+
+
+def collapse_duplicates(
+    nodes: List[NodeWithScore],
+    embeddings: Optional[np.ndarray] = None,
+    text_threshold: float = 0.8,
+    embedding_threshold: float = 0.97,
+) -> List[int]:
+    """
+    Positions of the nodes to keep (input assumed best-first): drops exact
+    text duplicates, chunks whose character shingles overlap a kept chunk by
+    text_threshold (Jaccard), and chunks whose embedding is within
+    embedding_threshold cosine of a kept chunk.
+    """
+    kept: List[int] = []
+    kept_hashes = set()
+    kept_shingles: List[Set[int]] = []
+    for i, node in enumerate(nodes):
+        fingerprint = _fingerprint(node.node.get_content())
+        digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+        if digest in kept_hashes:
+            continue
+
+        shingles = _shingles(fingerprint)
+        if any(
+            len(shingles & other) / len(shingles | other) >= text_threshold
+            for other in kept_shingles
+        ):
+            continue
+
+        if embeddings is not None and kept:
+            if np.max(embeddings[kept] @ embeddings[i]) >= embedding_threshold:
+                continue
+
+        kept.append(i)
+        kept_hashes.add(digest)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def mmr_select(
+    relevance: np.ndarray, embeddings: np.ndarray, top_k: int, mmr_lambda: float = 0.7
+) -> List[int]:
+    """
+    Greedy maximal-marginal-relevance selection:
+    argmax  lambda * relevance - (1 - lambda) * max similarity to the selected set.
+    """
+    n = len(relevance)
+    if n <= top_k:
+        return list(range(n))
+    similarity = embeddings @ embeddings.T
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+    for _ in range(top_k):
+        redundancy = np.where(np.isinf(max_similarity), 0.0, max_similarity)
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+
+def diversify(
+    index: VectorStoreIndex,
+    nodes: List[NodeWithScore],
+    top_k: int,
+    mmr_lambda: float = 0.7,
+    embedding_threshold: float = 0.97,
+) -> List[NodeWithScore]:
+    """
+    Post-retrieval stage over over-fetched, best-first candidates: collapse
+    exact / near duplicates, then pick top_k with MMR. Relevance is the
+    retrieval score (so hybrid BM25 evidence is kept); redundancy is the
+    cosine between stored embeddings. Costs no model calls.
+    """
+    if not nodes:
+        return nodes
+    embeddings = stored_embeddings(index, [n.node.node_id for n in nodes])
+    kept = collapse_duplicates(
+        nodes, embeddings, embedding_threshold=embedding_threshold
+    )
+    nodes = [nodes[i] for i in kept]
+    if embeddings is None or len(nodes) <= top_k:
+        return nodes[:top_k]
+
+    embeddings = embeddings[kept]
+    scores = np.array([n.score or 0.0 for n in nodes], dtype=np.float32)
+    spread = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    return [nodes[i] for i in mmr_select(relevance, embeddings, top_k, mmr_lambda)]
@@ -0,0 +1,98 @@
+from collections import deque
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import RetrievalConfig
+
+# Recent confidences kept for the percentiles reported on /metrics
+_SAMPLE_SIZE = 1000
+
+
+class EarlyExitPolicy:
+    """
+    Decides when a research step can skip the LLM sufficiency evaluation.
+
+    Confidence is measured on the dense side, independent of the (rank-based)
+    fused score: the best cosine between the query embedding and a retrieved
+    node's stored embedding, and its margin over the runner-up. A near-exact
+    hit that clearly stands out answers a simple lookup on its own.
+
+    The score / margin percentiles on /metrics are there to calibrate
+    EARLY_EXIT_MIN_SCORE and EARLY_EXIT_MIN_MARGIN on real traffic.
+    """
+
+    def __init__(
+        self, enabled: bool = True, min_score: float = 0.85, min_margin: float = 0.05
+    ):
+        self.enabled = enabled
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.evaluated = 0
+        self.early_exits = 0
+        self._scores = deque(maxlen=_SAMPLE_SIZE)
+        self._margins = deque(maxlen=_SAMPLE_SIZE)
+
+    @staticmethod
+    def confidence(
+        query_embedding: Sequence[float], embeddings: Optional[np.ndarray]
+    ) -> Optional[Tuple[float, Optional[float]]]:
+        """
+        (top cosine, margin over the second) or None without stored embeddings.
+        The margin is None for a single node: with no runner-up there is
+        nothing for the hit to stand out from.
+        """
+        if embeddings is None or not embeddings.size:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = np.sort(embeddings @ query)[::-1]
+        if len(scores) < 2:
+            return float(scores[0]), None
+        return float(scores[0]), float(scores[0] - scores[1])
+
+    def should_exit(
+        self, query_embedding: Sequence[float], embeddings: Optional[np.ndarray]
+    ) -> bool:
+        self.evaluated += 1
+        confidence = self.confidence(query_embedding, embeddings)
+        if confidence is None:
+            return False
+        score, margin = confidence
+        self._scores.append(score)
+        if margin is None:
+            # A lone hit, however close, fails the margin check
+            return False
+        self._margins.append(margin)
+        if self.enabled and score >= self.min_score and margin >= self.min_margin:
+            self.early_exits += 1
+            return True
+        return False
+
+    def metrics(self) -> Dict[str, float]:
+        def percentiles(values) -> Dict[str, float]:
+            if not values:
+                return {}
+            p50, p90 = np.percentile(np.fromiter(values, dtype=np.float32), [50, 90])
+            return {"p50": round(float(p50), 4), "p90": round(float(p90), 4)}
+
+        return {
+            "enabled": self.enabled,
+            "min_score": self.min_score,
+            "min_margin": self.min_margin,
+            "evaluated": self.evaluated,
+            "early_exits": self.early_exits,
+            "early_exit_rate": (
+                round(self.early_exits / self.evaluated, 4) if self.evaluated else 0.0
+            ),
+            "top_score": percentiles(self._scores),
+            "margin": percentiles(self._margins),
+        }
+
+
+# Create a single instance of the policy to be used across the application
+early_exit_policy = EarlyExitPolicy(
+    enabled=RetrievalConfig.EARLY_EXIT_ENABLED,
+    min_score=RetrievalConfig.EARLY_EXIT_MIN_SCORE,
+    min_margin=RetrievalConfig.EARLY_EXIT_MIN_MARGIN,
+)
@@ -0,0 +1,129 @@
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from ..config import RetrievalConfig
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """NFKC (full-width -> half-width), case-folded, whitespace-collapsed query text"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    Size-bounded LRU cache of query embeddings with a TTL, keyed by
+    (embedding model, normalized query).
+
+    Concurrent misses for the same key share one embedding request, so
+    parallel research steps never embed the same string twice.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(query: str, embed_model: BaseEmbedding) -> Tuple[str, str]:
+        return embed_model.model_name, normalize_query(query)
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, embedding = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return embedding
+
+    def put(
+        self, query: str, embed_model: BaseEmbedding, embedding: List[float]
+    ) -> None:
+        key = self._key(query, embed_model)
+        self._entries[key] = (time.monotonic(), embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def aget_query_embedding(
+        self, query: str, embed_model: BaseEmbedding
+    ) -> List[float]:
+        """Embedding of the query, from the cache or (once per key) from the model"""
+        key = self._key(query, embed_model)
+        embedding = self._lookup(key)
+        if embedding is not None:
+            self.hits += 1
+            return embedding
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            # Same query already being embedded by another research step
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            embedding = await embed_model.aget_query_embedding(query)
+            self.put(query, embed_model, embedding)
+            future.set_result(embedding)
+            return embedding
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited isn't logged
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            # Share of lookups that skipped the embedding round trip
+            "hit_rate": (
+                round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+            ),
+        }
+
+
+# Create a single instance of the cache to be used across the application
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=RetrievalConfig.QUERY_EMBEDDING_CACHE_SIZE,
+    ttl=RetrievalConfig.QUERY_EMBEDDING_CACHE_TTL,
+)
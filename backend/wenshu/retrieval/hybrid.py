@@ -0,0 +1,126 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from .sparse_index import SparseIndex
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[Sequence[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked id lists with RRF: score(d) = sum over lists of 1 / (k + rank).
+
+    Scores are scaled so that an id ranked first in every list scores 1.0.
+    """
+    fused: Dict[str, float] = {}
+    for ranked in ranked_lists:
+        for rank, node_id in enumerate(ranked, start=1):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+    best_possible = len(ranked_lists) / (k + 1)
+    return sorted(
+        ((node_id, score / best_possible) for node_id, score in fused.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+
+
+def dense_retriever(
+    index: VectorStoreIndex, similarity_top_k: int, doc_ids: Optional[List[str]] = None
+):
+    """Vector retriever over the index, restricted to the given ref doc ids if set"""
+    if doc_ids is not None and isinstance(index.vector_store, SimpleVectorStore):
+        # SimpleVectorStore ignores doc_ids; restrict by node ids instead
+        node_ids = []
+        for doc_id in doc_ids:
+            ref_doc_info = index.docstore.get_ref_doc_info(doc_id)
+            if ref_doc_info:
+                node_ids.extend(ref_doc_info.node_ids)
+        return index.as_retriever(similarity_top_k=similarity_top_k, node_ids=node_ids)
+    if isinstance(index, VectorStoreIndex):
+        # as_retriever() always passes every node id of the index, which the
+        # matrix-backed stores would intersect with doc_ids row by row; leave
+        # node_ids unset so they scan the matrix (or the doc_ids rows) directly
+        return VectorIndexRetriever(
+            index,
+            similarity_top_k=similarity_top_k,
+            doc_ids=doc_ids,
+            callback_manager=index._callback_manager,
+            object_map=index._object_map,
+        )
+    return index.as_retriever(similarity_top_k=similarity_top_k, doc_ids=doc_ids)
+
+
+class HybridRetriever:
+    """
+    Runs dense (vector) and sparse (BM25) retrieval concurrently and fuses
+    the two rankings with reciprocal-rank fusion.
+
+    Dense retrieval catches paraphrases; sparse retrieval catches exact
+    strings the embedding blurs, such as 文号, names and course codes.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        sparse_index: SparseIndex,
+        similarity_top_k: int = 5,
+        candidate_top_k: int = 20,
+        rrf_k: int = 60,
+    ):
+        self.index = index
+        self.sparse_index = sparse_index
+        self.similarity_top_k = similarity_top_k
+        self.candidate_top_k = candidate_top_k
+        self.rrf_k = rrf_k
+
+    async def _dense(
+        self, query: QueryBundle, doc_ids: Optional[List[str]]
+    ) -> List[NodeWithScore]:
+        retriever = dense_retriever(self.index, self.candidate_top_k, doc_ids)
+        return await retriever.aretrieve(query)
+
+    async def _sparse(
+        self, query: str, doc_ids: Optional[List[str]]
+    ) -> List[Tuple[str, float]]:
+        # BM25 scoring is CPU-bound NumPy work; keep it off the event loop
+        return await asyncio.to_thread(
+            self.sparse_index.search, query, self.candidate_top_k, doc_ids
+        )
+
+    async def aretrieve(
+        self, query: QueryBundle, doc_ids: Optional[List[str]] = None
+    ) -> List[NodeWithScore]:
+        """
+        Top nodes for the query, restricted to the given ref doc ids if set.
+        A precomputed query.embedding skips the embedding call.
+        """
+        dense_nodes, sparse_hits = await asyncio.gather(
+            self._dense(query, doc_ids), self._sparse(query.query_str, doc_ids)
+        )
+
+        nodes_by_id = {n.node.node_id: n.node for n in dense_nodes}
+        fused = reciprocal_rank_fusion(
+            [
+                [n.node.node_id for n in dense_nodes],
+                [node_id for node_id, _ in sparse_hits],
+            ],
+            k=self.rrf_k,
+        )
+
+        results = []
+        for node_id, score in fused:
+            node = nodes_by_id.get(node_id)
+            if node is None:
+                # Sparse-only hit: fetch the node text from the docstore
+                node = self.index.docstore.get_node(node_id, raise_error=False)
+                if node is None:
+                    continue
+            results.append(NodeWithScore(node=node, score=score))
+            if len(results) >= self.similarity_top_k:
+                break
+        return results
@@ -0,0 +1,315 @@
+import re
+import sqlite3
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from llama_index.core.schema import BaseNode
+
+from ..config import APIConfig
+from ..models.document_schemas import DOCUMENT_TYPE_REGISTRY
+
+# SQLite file in the storage dir holding the per-document metadata
+METADATA_DB_NAME = "metadata_index.sqlite3"
+
+# Date fields of the document schemas, in order of preference
+_DATE_FIELDS = ("issue_date", "publication_date", "meeting_date")
+# Person-list fields of the document schemas
+_PERSON_FIELDS = ("authors", "key_personnel", "participants")
+# Title-like fields of the document schemas
+_TITLE_FIELDS = ("title", "subject", "meeting_title")
+
+_DATE_PATTERN = re.compile(
+    r"((?:19|20)\d{2})\s*(?:[年./-]\s*(\d{1,2}))?(?:\s*[月./-]\s*(\d{1,2}))?"
+)
+# Only an explicit "2024年" is a year filter; bare numbers are just as often
+# part of a 文号 ("人大发〔2024〕12号") or a school year ("2023-2024 学年")
+_YEAR_IN_QUERY = re.compile(r"(?<!\d)((?:19|20)\d{2})\s*年")
+
+# Words in a query that select a document schema
+SCHEMA_KEYWORDS = {
+    "论文": "academic_paper",
+    "期刊": "academic_paper",
+    "会议纪要": "meeting_minutes",
+    "纪要": "meeting_minutes",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    ref_doc_id TEXT PRIMARY KEY,
+    document_schema TEXT,
+    document_type TEXT,
+    issuing_department TEXT,
+    document_number TEXT,
+    title TEXT,
+    date TEXT,
+    year INTEGER,
+    file_name TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_schema ON documents(document_schema);
+CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_department ON documents(issuing_department);
+CREATE INDEX IF NOT EXISTS idx_documents_year ON documents(year);
+CREATE TABLE IF NOT EXISTS people (
+    ref_doc_id TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_people_name ON people(name);
+CREATE INDEX IF NOT EXISTS idx_people_doc ON people(ref_doc_id);
+"""
+
+
+def normalize_date(value: Any) -> Optional[str]:
+    """'2024年3月5日' / '2024-03-05' / '2024.3' -> '2024-03-05' / '2024-03'"""
+    if not value:
+        return None
+    match = _DATE_PATTERN.search(str(value))
+    if not match:
+        return None
+    year, month, day = match.groups()
+    parts = [year] + [f"{int(p):02d}" for p in (month, day) if p]
+    return "-".join(parts)
+
+
+def infer_document_schema(metadata: Dict[str, Any]) -> Optional[str]:
+    """
+    Schema key of a document's metadata. Nodes stored before document_schema
+    was recorded only carry document_type (overwritten by the validated
+    文件类型 for administrative documents) and their validated fields, so
+    the schema whose fields they fill best is used.
+    """
+    if metadata.get("document_schema"):
+        return metadata["document_schema"]
+    if metadata.get("document_type") in DOCUMENT_TYPE_REGISTRY:
+        return metadata["document_type"]
+    best, best_fields = None, 0
+    for schema, model in DOCUMENT_TYPE_REGISTRY.items():
+        filled = sum(
+            1
+            for name in model.model_fields
+            if name != "document_type" and metadata.get(name)
+        )
+        if filled > best_fields:
+            best, best_fields = schema, filled
+    return best
+
+
+@dataclass
+class DocumentFilter:
+    """Restrictions on the documents a retrieval may return (all combined with AND)"""
+
+    document_schema: Optional[str] = None
+    document_type: Optional[str] = None
+    issuing_departments: List[str] = field(default_factory=list)
+    year: Optional[int] = None
+    person: Optional[str] = None
+    document_number: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return not any(asdict(self).values())
+
+    def describe(self) -> Dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if value}
+
+
+class MetadataIndex:
+    """
+    SQLite index of the validated document fields (type, department, date,
+    people, 文号), one row per source document.
+
+    The researcher turns explicit or parsed filters into the set of matching
+    ref doc ids, which then restricts vector and BM25 scoring to that subset.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._vocabulary: Optional[Dict[str, List[str]]] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            row = (
+                self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()
+            )
+            return row[0]
+
+    # ----- writes -----
+
+    def add_nodes(self, nodes: Iterable[BaseNode]) -> None:
+        """Index the metadata of every source document seen in these nodes"""
+        documents = {}
+        for node in nodes:
+            ref_doc_id = node.ref_doc_id
+            if ref_doc_id and ref_doc_id not in documents:
+                documents[ref_doc_id] = node.metadata
+        if not documents:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for ref_doc_id, metadata in documents.items():
+                    self._upsert(conn, ref_doc_id, metadata)
+            self._vocabulary = None
+
+    def _upsert(
+        self, conn: sqlite3.Connection, ref_doc_id: str, metadata: Dict[str, Any]
+    ) -> None:
+        date = next(
+            (d for d in (normalize_date(metadata.get(f)) for f in _DATE_FIELDS) if d),
+            None,
+        )
+        title = next((metadata[f] for f in _TITLE_FIELDS if metadata.get(f)), None)
+        conn.execute(
+            "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                ref_doc_id,
+                infer_document_schema(metadata),
+                metadata.get("document_type"),
+                metadata.get("issuing_department"),
+                metadata.get("document_number"),
+                title,
+                date,
+                int(date[:4]) if date else None,
+                metadata.get("file_name"),
+            ),
+        )
+        conn.execute("DELETE FROM people WHERE ref_doc_id = ?", (ref_doc_id,))
+        names = {
+            str(name).strip()
+            for f in _PERSON_FIELDS
+            for name in (metadata.get(f) or [])
+            if str(name).strip()
+        }
+        conn.executemany(
+            "INSERT INTO people VALUES (?, ?)", [(ref_doc_id, name) for name in names]
+        )
+
+    def documents_without_schema(self) -> List[str]:
+        """Ref doc ids indexed without a document schema (by an older version)"""
+        with self._lock:
+            return [
+                row[0]
+                for row in self._connection().execute(
+                    "SELECT ref_doc_id FROM documents WHERE document_schema IS NULL"
+                )
+            ]
+
+    def delete_document(self, ref_doc_id: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "DELETE FROM documents WHERE ref_doc_id = ?", (ref_doc_id,)
+                )
+                conn.execute("DELETE FROM people WHERE ref_doc_id = ?", (ref_doc_id,))
+            self._vocabulary = None
+
+    # ----- reads -----
+
+    def _known_values(self) -> Dict[str, List[str]]:
+        """Distinct departments / document types / people, for query parsing"""
+        if self._vocabulary is None:
+            conn = self._connection()
+            self._vocabulary = {
+                column: [
+                    row[0]
+                    for row in conn.execute(
+                        f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL"
+                    )
+                ]
+                for table, column in (
+                    ("documents", "issuing_department"),
+                    ("documents", "document_type"),
+                    ("people", "name"),
+                )
+            }
+        return self._vocabulary
+
+    def parse_filter(self, query: str) -> DocumentFilter:
+        """
+        Derive filters from a natural-language query, e.g.
+        "2024 年教务处的通知" -> year=2024, departments containing 教务处,
+        document_type=通知. Only values that exist in the index are used.
+        """
+        doc_filter = DocumentFilter()
+        year = _YEAR_IN_QUERY.search(query)
+        if year:
+            doc_filter.year = int(year.group(1))
+
+        for keyword, schema in SCHEMA_KEYWORDS.items():
+            if keyword in query:
+                doc_filter.document_schema = schema
+                break
+
+        with self._lock:
+            known = self._known_values()
+
+        # A department matches if the query names it, or names one of its
+        # trailing parts ("教务处" for "中国人民大学教务处")
+        for department in known["issuing_department"]:
+            if any(
+                department[start:] in query
+                for start in range(0, max(1, len(department) - 2))
+            ):
+                doc_filter.issuing_departments.append(department)
+
+        document_types = [
+            t for t in known["document_type"] if len(t) >= 2 and t in query
+        ]
+        if document_types:
+            doc_filter.document_type = max(document_types, key=len)
+
+        people = [name for name in known["name"] if len(name) >= 2 and name in query]
+        if people:
+            doc_filter.person = max(people, key=len)
+
+        return doc_filter
+
+    def candidate_doc_ids(self, doc_filter: DocumentFilter) -> List[str]:
+        """Ref doc ids of the documents matching every set filter"""
+        clauses, params = [], []
+        if doc_filter.document_schema:
+            clauses.append("d.document_schema = ?")
+            params.append(doc_filter.document_schema)
+        if doc_filter.document_type:
+            clauses.append("d.document_type = ?")
+            params.append(doc_filter.document_type)
+        if doc_filter.issuing_departments:
+            departments = " OR ".join(
+                "d.issuing_department LIKE ?" for _ in doc_filter.issuing_departments
+            )
+            clauses.append(f"({departments})")
+            params.extend(f"%{d}%" for d in doc_filter.issuing_departments)
+        if doc_filter.year:
+            # Documents without a known date stay candidates: the date fields
+            # are optional, so a missing one says nothing about the year
+            clauses.append("(d.year = ? OR d.year IS NULL)")
+            params.append(doc_filter.year)
+        if doc_filter.document_number:
+            clauses.append("d.document_number LIKE ?")
+            params.append(f"%{doc_filter.document_number}%")
+        if doc_filter.person:
+            clauses.append(
+                "d.ref_doc_id IN (SELECT ref_doc_id FROM people WHERE name = ?)"
+            )
+            params.append(doc_filter.person)
+
+        sql = "SELECT d.ref_doc_id FROM documents d"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            return [row[0] for row in self._connection().execute(sql, params)]
+
+
+# Create a single instance of the index to be used across the application
+metadata_index = MetadataIndex(Path(APIConfig.STORAGE_DIR) / METADATA_DB_NAME)
@@ -0,0 +1,77 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from ..config import RetrievalConfig
+
+
+def doc_ids_key(doc_ids: Optional[Iterable[str]]) -> Optional[str]:
+    """Order-independent cache key for a doc id restriction (None = whole corpus)"""
+    if doc_ids is None:
+        return None
+    digest = hashlib.sha1()
+    for doc_id in sorted(doc_ids):
+        digest.update(doc_id.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class RetrievalResultCache:
+    """
+    Size-bounded LRU cache of retrieval results with a TTL.
+
+    Results depend on the index contents: callers key them by the version
+    of the index snapshot they searched, and the ingestion service clears
+    every instance once a commit has swapped in the new index.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024, ttl: float = 600.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Create single instances of the caches to be used across the application:
+# stage one (query -> documents) and stage two / flat (query -> chunks)
+document_selection_cache = RetrievalResultCache(
+    "document_selection",
+    max_entries=RetrievalConfig.RETRIEVAL_CACHE_SIZE,
+    ttl=RetrievalConfig.RETRIEVAL_CACHE_TTL,
+)
+chunk_retrieval_cache = RetrievalResultCache(
+    "chunk_retrieval",
+    max_entries=RetrievalConfig.RETRIEVAL_CACHE_SIZE,
+    ttl=RetrievalConfig.RETRIEVAL_CACHE_TTL,
+)
@@ -0,0 +1,392 @@
+import asyncio
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+
+from ..config import VectorStoreConfig, load_vector_index
+from .diversify import stored_embeddings
+from .hybrid import dense_retriever
+from .metadata_index import SCHEMA_KEYWORDS, DocumentFilter
+
+# Sub-directory of the storage dir holding one index directory per shard
+SHARDS_DIR_NAME = "shards"
+# Shard of the nodes without a value for the shard field
+DEFAULT_SHARD = "default"
+
+# Characters not allowed in a shard directory name (CJK is fine)
+_UNSAFE_NAME = re.compile(r"[^\w\-]+")
+
+
+def shard_key(metadata: Dict[str, Any], shard_field: str) -> str:
+    """Shard a node belongs to: the value of its shard field, made path-safe"""
+    value = metadata.get(shard_field)
+    if not value:
+        return DEFAULT_SHARD
+    return _UNSAFE_NAME.sub("_", str(value)).strip("_") or DEFAULT_SHARD
+
+
+def _reuse_embeddings(source: VectorStoreIndex, nodes: List[BaseNode]) -> None:
+    """Set node.embedding from the source store, so inserting them skips the model"""
+    embeddings = stored_embeddings(source, [node.node_id for node in nodes])
+    if embeddings is None or not embeddings.shape[1]:
+        return
+    for node, embedding in zip(nodes, embeddings):
+        # Zero rows are ids the store doesn't know; those get re-embedded
+        if np.any(embedding):
+            node.embedding = embedding.tolist()
+
+
+class _ShardedDocStore:
+    """Read-only view over the docstores of every shard"""
+
+    def __init__(self, sharded: "ShardedIndex"):
+        self._sharded = sharded
+
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        docs = {}
+        for shard in list(self._sharded.shards.values()):
+            docs.update(shard.docstore.docs)
+        return docs
+
+    def get_node(self, node_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        for shard in list(self._sharded.shards.values()):
+            node = shard.docstore.get_node(node_id, raise_error=False)
+            if node is not None:
+                return node
+        if raise_error:
+            raise ValueError(f"node_id {node_id} not found.")
+        return None
+
+    def get_ref_doc_info(self, ref_doc_id: str):
+        key = self._sharded.shard_of(ref_doc_id)
+        if key is None:
+            return None
+        return self._sharded.shards[key].docstore.get_ref_doc_info(ref_doc_id)
+
+
+class _ShardedVectorStore:
+    """Embedding lookups across shards (for diversification / context packing)"""
+
+    def __init__(self, sharded: "ShardedIndex"):
+        self._sharded = sharded
+
+    def get_embeddings(self, node_ids: List[str]) -> np.ndarray:
+        """Normalized stored embeddings for the given node ids (unknown ids are zeros)"""
+        rows: Dict[int, np.ndarray] = {}
+        remaining = list(range(len(node_ids)))
+        for shard in list(self._sharded.shards.values()):
+            if not remaining:
+                break
+            here = [i for i in remaining if shard.docstore.document_exists(node_ids[i])]
+            if not here:
+                continue
+            embeddings = stored_embeddings(shard, [node_ids[i] for i in here])
+            if embeddings is None:
+                continue
+            rows.update(zip(here, embeddings))
+            remaining = [i for i in remaining if i not in rows]
+
+        if not rows:
+            return np.zeros((len(node_ids), 0), dtype=np.float32)
+        dim = len(next(iter(rows.values())))
+        result = np.zeros((len(node_ids), dim), dtype=np.float32)
+        for i, row in rows.items():
+            result[i] = row
+        return result
+
+
+class ShardRouter:
+    """
+    Picks the shards a query should search when it explicitly targets one of
+    them: a filter on the shard field, or a schema keyword ("论文" ->
+    academic_paper). Shard names merely appearing in the query don't count:
+    short common words would misroute queries and hide relevant documents.
+    Anything ambiguous searches every shard, and so does a routed query
+    whose shard returns nothing (see fell_back).
+    """
+
+    def __init__(self, shard_field: str):
+        self.shard_field = shard_field
+        self.routed = 0
+        self.fanned_out = 0
+        self.fallbacks = 0
+
+    def route(
+        self,
+        query: str,
+        shard_keys: Sequence[str],
+        doc_filter: Optional[DocumentFilter] = None,
+    ) -> Optional[List[str]]:
+        """Shard keys to search, or None for all of them"""
+        matches = set()
+        if doc_filter is not None:
+            value = getattr(doc_filter, self.shard_field, None)
+            if value:
+                matches.add(shard_key({self.shard_field: value}, self.shard_field))
+        if not matches and self.shard_field == "document_schema":
+            matches = {
+                schema
+                for keyword, schema in SCHEMA_KEYWORDS.items()
+                if keyword in query
+            }
+
+        if len(matches) == 1 and matches <= set(shard_keys):
+            self.routed += 1
+            return sorted(matches)
+        self.fanned_out += 1
+        return None
+
+    def fell_back(self) -> None:
+        """A routed query found nothing in its shard and searched them all."""
+        self.fallbacks += 1
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "routed": self.routed,
+            "fanned_out": self.fanned_out,
+            "fallbacks": self.fallbacks,
+        }
+
+
+class ShardedRetriever:
+    """Dense retrieval fanned out to several shards in parallel, merged by score"""
+
+    def __init__(
+        self,
+        sharded: "ShardedIndex",
+        similarity_top_k: int,
+        doc_ids: Optional[List[str]] = None,
+    ):
+        self.sharded = sharded
+        self.similarity_top_k = similarity_top_k
+        self.doc_ids = doc_ids
+
+    def _shard_plan(self) -> Dict[str, Optional[List[str]]]:
+        """Shard key -> ref doc ids to restrict it to (None = the whole shard)"""
+        if self.doc_ids is None:
+            return {key: None for key in list(self.sharded.shards)}
+        plan: Dict[str, List[str]] = {}
+        for doc_id in self.doc_ids:
+            key = self.sharded.shard_of(doc_id)
+            if key is not None:
+                plan.setdefault(key, []).append(doc_id)
+        # A shard selected as a whole is scanned without a row filter
+        return {
+            key: None if len(doc_ids) >= self.sharded.document_count(key) else doc_ids
+            for key, doc_ids in plan.items()
+        }
+
+    async def aretrieve(self, query: QueryBundle) -> List[NodeWithScore]:
+        plan = self._shard_plan()
+        results = await asyncio.gather(
+            *(
+                dense_retriever(
+                    self.sharded.shards[key], self.similarity_top_k, doc_ids
+                ).aretrieve(query)
+                for key, doc_ids in plan.items()
+            )
+        )
+        # All shards share the embedding model, so cosine scores are comparable
+        merged = sorted(
+            (node for nodes in results for node in nodes),
+            key=lambda n: n.score or 0.0,
+            reverse=True,
+        )
+        return merged[: self.similarity_top_k]
+
+
+class ShardedIndex:
+    """
+    The knowledge base split into one VectorStoreIndex per value of a
+    metadata field (document_schema by default), each persisted under
+    <storage dir>/shards/<key>/ and loaded, written and rebuilt on its own.
+
+    Exposes the parts of the VectorStoreIndex interface the rest of the
+    application uses (insert_nodes, delete_ref_doc, as_retriever, docstore,
+    vector_store.get_embeddings), so callers need not know about shards.
+    Node ids are kept unchanged, so the BM25 and metadata indexes stay global.
+    """
+
+    def __init__(
+        self,
+        storage_dir: str,
+        shard_field: str,
+        shards: Optional[Dict[str, VectorStoreIndex]] = None,
+    ):
+        self.storage_dir = Path(storage_dir)
+        self.shard_field = shard_field
+        self.shards: Dict[str, VectorStoreIndex] = {}
+        self._doc_shards: Dict[str, str] = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        for key, shard in (shards or {}).items():
+            self._attach(key, shard)
+        self.docstore = _ShardedDocStore(self)
+        self.vector_store = _ShardedVectorStore(self)
+
+    # ----- loading -----
+
+    @property
+    def shards_dir(self) -> Path:
+        return self.storage_dir / SHARDS_DIR_NAME
+
+    def shard_dir(self, key: str) -> str:
+        return str(self.shards_dir / key)
+
+    @classmethod
+    def load(cls, storage_dir: str, shard_field: str) -> "ShardedIndex":
+        """Load every shard; a legacy single index is split into shards once"""
+        sharded = cls(storage_dir, shard_field)
+        if not sharded.shards_dir.exists() and os.path.exists(
+            os.path.join(storage_dir, "docstore.json")
+        ):
+            sharded._migrate(load_vector_index(storage_dir))
+
+        sharded.shards_dir.mkdir(parents=True, exist_ok=True)
+        for shard_path in sorted(sharded.shards_dir.iterdir()):
+            if shard_path.is_dir() and shard_path.name not in sharded.shards:
+                sharded._attach(shard_path.name, load_vector_index(str(shard_path)))
+        print(
+            f"[Shards] Loaded {len(sharded.shards)} shards by '{shard_field}': "
+            f"{ {key: sharded.document_count(key) for key in sharded.shards} }"
+        )
+        return sharded
+
+    def reloaded(self, keys: Optional[Iterable[str]] = None) -> "ShardedIndex":
+        """A copy with the given shards (default: all on disk) re-read from storage"""
+        if keys is None:
+            keys = [path.name for path in self.shards_dir.iterdir() if path.is_dir()]
+        keys = set(keys)
+        shards = {key: shard for key, shard in self.shards.items() if key not in keys}
+        for key in sorted(keys):
+            if os.path.isdir(self.shard_dir(key)):
+                shards[key] = load_vector_index(self.shard_dir(key))
+        return ShardedIndex(str(self.storage_dir), self.shard_field, shards)
+
+    def _attach(self, key: str, shard: VectorStoreIndex) -> None:
+        self.shards[key] = shard
+        for ref_doc_id in shard.docstore.get_all_ref_doc_info() or {}:
+            self._doc_shards[ref_doc_id] = key
+
+    def _migrate(self, legacy: VectorStoreIndex) -> None:
+        """Split a single-index storage dir into shards, reusing its embeddings"""
+        nodes = list(legacy.docstore.docs.values())
+        print(
+            f"[Shards] Splitting {len(nodes)} nodes of the single index into shards..."
+        )
+        _reuse_embeddings(legacy, nodes)
+        self.insert_nodes(nodes)
+        self.persist()
+        print(
+            "[Shards] Migration complete; the old single-index files in "
+            f"{self.storage_dir} are no longer read and can be removed."
+        )
+
+    # ----- routing helpers -----
+
+    def shard_of(self, ref_doc_id: str) -> Optional[str]:
+        return self._doc_shards.get(ref_doc_id)
+
+    def document_count(self, key: str) -> int:
+        return sum(1 for shard in list(self._doc_shards.values()) if shard == key)
+
+    def doc_ids(self, keys: Iterable[str]) -> List[str]:
+        """Ref doc ids of every document in the given shards"""
+        keys = set(keys)
+        return [doc_id for doc_id, key in list(self._doc_shards.items()) if key in keys]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            key: {
+                "documents": self.document_count(key),
+                "nodes": len(shard.index_struct.nodes_dict),
+            }
+            for key, shard in self.shards.items()
+        }
+
+    # ----- VectorStoreIndex-compatible interface -----
+
+    def as_retriever(
+        self, similarity_top_k: int, doc_ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> ShardedRetriever:
+        return ShardedRetriever(self, similarity_top_k, doc_ids)
+
+    def _shard(self, key: str) -> VectorStoreIndex:
+        """The shard for key, created (empty, persisted) on first use"""
+        if key not in self.shards:
+            print(f"[Shards] Creating shard '{key}'")
+            self.shards[key] = load_vector_index(self.shard_dir(key))
+        return self.shards[key]
+
+    def insert_nodes(self, nodes: Sequence[BaseNode]) -> None:
+        groups: Dict[str, List[BaseNode]] = {}
+        for node in nodes:
+            groups.setdefault(shard_key(node.metadata, self.shard_field), []).append(
+                node
+            )
+        with self._lock:
+            for key, group in groups.items():
+                self._shard(key).insert_nodes(group)
+                for node in group:
+                    if node.ref_doc_id:
+                        self._doc_shards[node.ref_doc_id] = key
+                self._dirty.add(key)
+
+    def delete_ref_doc(
+        self, ref_doc_id: str, delete_from_docstore: bool = True
+    ) -> None:
+        with self._lock:
+            key = self._doc_shards.pop(ref_doc_id, None)
+            if key is None:
+                return
+            self.shards[key].delete_ref_doc(
+                ref_doc_id, delete_from_docstore=delete_from_docstore
+            )
+            self._dirty.add(key)
+
+    def persist(self, keys: Optional[Iterable[str]] = None) -> List[str]:
+        """Persist the given shards (default: those written since the last persist)"""
+        with self._lock:
+            keys = sorted(self._dirty if keys is None else keys)
+            for key in keys:
+                self.shards[key].storage_context.persist(self.shard_dir(key))
+                self._dirty.discard(key)
+            return keys
+
+    # ----- rebuild -----
+
+    def rebuild_shard(self, key: str) -> int:
+        """
+        Rebuild one shard's vector store from its docstore, e.g. after a
+        backend / dtype change or a corrupted matrix. Other shards keep
+        serving. Returns the number of nodes in the rebuilt shard.
+        """
+        with self._lock:
+            if key not in self.shards:
+                raise KeyError(f"Unknown shard: {key}")
+            old = self.shards.pop(key)
+            nodes = list(old.docstore.docs.values())
+            for doc_id in [d for d, k in self._doc_shards.items() if k == key]:
+                del self._doc_shards[doc_id]
+
+            print(f"[Shards] Rebuilding shard '{key}' ({len(nodes)} nodes)...")
+            _reuse_embeddings(old, nodes)
+            shutil.rmtree(self.shard_dir(key), ignore_errors=True)
+            self._shard(key)
+            # Nodes are re-grouped, so a changed shard field moves them as well
+            self.insert_nodes(nodes)
+            self.persist()
+            print(f"[Shards] Shard '{key}' rebuilt.")
+            return len(nodes)
+
+
+# Create a single instance of the router to be used across the application
+shard_router = ShardRouter(VectorStoreConfig.SHARD_FIELD)
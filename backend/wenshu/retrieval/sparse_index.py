@@ -0,0 +1,458 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from ..config import APIConfig
+
+# Sub-directory of the storage dir holding the inverted index segments
+SPARSE_DIR_NAME = "bm25_index"
+
+# Runs of CJK characters vs. runs of latin letters / digits
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD_RUN = re.compile(r"[0-9a-z]+(?:[._-][0-9a-z]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Chinese-aware tokenization without a segmenter: CJK runs become character
+    unigrams + bigrams, latin / digit runs stay whole words.
+
+    "人大发〔2024〕12号" -> 人 大 发 人大 大发 2024 12 号
+    """
+    text = text.lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD_RUN.findall(text))
+    return tokens
+
+
+class _Segment:
+    """
+    An immutable slice of the inverted index.
+
+    Postings of term i are doc numbers postings[offsets[i]:offsets[i + 1]]
+    (sorted) with term frequencies tfs[...]. On disk the doc numbers are
+    delta-encoded and the arrays zlib-compressed.
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        tfs: np.ndarray,
+        doc_lens: np.ndarray,
+        node_ids: List[str],
+        ref_doc_ids: List[str],
+        name: Optional[str] = None,
+    ):
+        self.terms = terms
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.node_ids = node_ids
+        self.ref_doc_ids = ref_doc_ids
+        self.alive = np.ones(len(node_ids), dtype=bool)
+        self.name = name  # None until written to disk
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.node_ids)
+
+    def postings_for(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self.term_index.get(term)
+        if i is None:
+            return self.postings[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.tfs[start:end]
+
+    @classmethod
+    def from_triples(
+        cls,
+        term_ids: np.ndarray,
+        doc_numbers: np.ndarray,
+        tfs: np.ndarray,
+        vocabulary: List[str],
+        doc_lens: np.ndarray,
+        node_ids: List[str],
+        ref_doc_ids: List[str],
+    ) -> "_Segment":
+        """Build postings from parallel (term id, doc number, tf) arrays"""
+        order = np.lexsort((doc_numbers, term_ids))
+        term_ids, doc_numbers, tfs = term_ids[order], doc_numbers[order], tfs[order]
+        used, starts = np.unique(term_ids, return_index=True)
+        offsets = np.append(starts, len(term_ids)).astype(np.int64)
+        return cls(
+            [vocabulary[i] for i in used],
+            offsets,
+            doc_numbers.astype(np.int32),
+            tfs.astype(np.uint16),
+            doc_lens.astype(np.int32),
+            node_ids,
+            ref_doc_ids,
+        )
+
+    @classmethod
+    def build(cls, docs: Sequence[Tuple[str, str, List[str]]]) -> "_Segment":
+        """Build a segment from (node_id, ref_doc_id, tokens) tuples"""
+        vocabulary: Dict[str, int] = {}
+        term_ids, doc_numbers, tfs = [], [], []
+        for doc_number, (_, _, tokens) in enumerate(docs):
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_numbers.append(doc_number)
+                tfs.append(min(tf, 65535))
+        return cls.from_triples(
+            np.array(term_ids, dtype=np.int64),
+            np.array(doc_numbers, dtype=np.int64),
+            np.array(tfs, dtype=np.int64),
+            list(vocabulary),
+            np.array([len(tokens) for _, _, tokens in docs]),
+            [node_id for node_id, _, _ in docs],
+            [ref_doc_id for _, ref_doc_id, _ in docs],
+        )
+
+    @classmethod
+    def merge(cls, segments: Sequence["_Segment"]) -> "_Segment":
+        """Merge segments into one, dropping deleted documents"""
+        vocabulary: Dict[str, int] = {}
+        term_parts, doc_parts, tf_parts = [], [], []
+        doc_lens, node_ids, ref_doc_ids = [], [], []
+        base = 0
+        for segment in segments:
+            # Renumber the surviving docs of this segment consecutively
+            renumber = np.full(segment.n_docs, -1, dtype=np.int64)
+            alive_docs = np.flatnonzero(segment.alive)
+            renumber[alive_docs] = base + np.arange(len(alive_docs))
+            base += len(alive_docs)
+
+            global_term = np.array(
+                [
+                    vocabulary.setdefault(term, len(vocabulary))
+                    for term in segment.terms
+                ],
+                dtype=np.int64,
+            )
+            lengths = np.diff(segment.offsets)
+            term_ids = np.repeat(global_term, lengths)
+            keep = segment.alive[segment.postings]
+            term_parts.append(term_ids[keep])
+            doc_parts.append(renumber[segment.postings[keep]])
+            tf_parts.append(segment.tfs[keep])
+
+            doc_lens.append(segment.doc_lens[alive_docs])
+            node_ids.extend(segment.node_ids[i] for i in alive_docs)
+            ref_doc_ids.extend(segment.ref_doc_ids[i] for i in alive_docs)
+
+        return cls.from_triples(
+            np.concatenate(term_parts) if term_parts else np.zeros(0, dtype=np.int64),
+            np.concatenate(doc_parts) if doc_parts else np.zeros(0, dtype=np.int64),
+            np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.int64),
+            list(vocabulary),
+            np.concatenate(doc_lens) if doc_lens else np.zeros(0, dtype=np.int64),
+            node_ids,
+            ref_doc_ids,
+        )
+
+    def save(self, directory: Path, name: str) -> None:
+        # Delta-encode doc numbers within each postings list; the first entry
+        # of every list stays absolute
+        deltas = np.diff(self.postings, prepend=0).astype(np.uint32)
+        starts = self.offsets[:-1][np.diff(self.offsets) > 0]
+        deltas[starts] = self.postings[starts]
+        np.savez_compressed(
+            directory / f"{name}.npz",
+            offsets=self.offsets,
+            deltas=deltas,
+            tfs=self.tfs,
+            doc_lens=self.doc_lens,
+        )
+        with open(directory / f"{name}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "terms": self.terms,
+                    "node_ids": self.node_ids,
+                    "ref_doc_ids": self.ref_doc_ids,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        self.name = name
+
+    @classmethod
+    def load(cls, directory: Path, name: str) -> "_Segment":
+        with np.load(directory / f"{name}.npz") as arrays:
+            offsets = arrays["offsets"]
+            deltas = arrays["deltas"].astype(np.int64)
+            tfs = arrays["tfs"]
+            doc_lens = arrays["doc_lens"]
+        with open(directory / f"{name}.json", "r", encoding="utf-8") as f:
+            ids = json.load(f)
+
+        # Undo the delta encoding: running sum, restarted at every list start
+        running = np.cumsum(deltas)
+        lengths = np.diff(offsets)
+        list_starts = offsets[:-1]
+        before = np.where(list_starts > 0, running[np.maximum(list_starts - 1, 0)], 0)
+        postings = (running - np.repeat(before, lengths)).astype(np.int32)
+
+        return cls(
+            ids["terms"],
+            offsets,
+            postings,
+            tfs,
+            doc_lens,
+            ids["node_ids"],
+            ids["ref_doc_ids"],
+            name=name,
+        )
+
+
+class SparseIndex:
+    """
+    Persistent BM25 inverted index over node text, updated incrementally.
+
+    Every insert batch becomes a small in-memory segment; persist() writes new
+    segments and merges small ones once there are more than `max_segments`
+    (log-structured, so inserts never rewrite the whole index). Deletes are
+    tombstones, physically removed when their segment is merged.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_segments: int = 8,
+    ):
+        self.directory = Path(directory)
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self._segments: List[_Segment] = []
+        self._location: Dict[str, Tuple[_Segment, int]] = {}
+        self._nodes_of_doc: Dict[str, Set[str]] = {}
+        self._total_len = 0
+        self._n_alive = 0
+        self._next_segment = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        return self._n_alive
+
+    # ----- bookkeeping -----
+
+    def _register(self, segment: _Segment) -> None:
+        for doc_number, (node_id, ref_doc_id) in enumerate(
+            zip(segment.node_ids, segment.ref_doc_ids)
+        ):
+            if not segment.alive[doc_number]:
+                continue
+            self._remove_node(node_id)
+            self._location[node_id] = (segment, doc_number)
+            self._nodes_of_doc.setdefault(ref_doc_id, set()).add(node_id)
+            self._total_len += int(segment.doc_lens[doc_number])
+            self._n_alive += 1
+
+    def _remove_node(self, node_id: str) -> bool:
+        location = self._location.pop(node_id, None)
+        if location is None:
+            return False
+        segment, doc_number = location
+        segment.alive[doc_number] = False
+        ref_doc_id = segment.ref_doc_ids[doc_number]
+        doc_nodes = self._nodes_of_doc.get(ref_doc_id)
+        if doc_nodes:
+            doc_nodes.discard(node_id)
+            if not doc_nodes:
+                del self._nodes_of_doc[ref_doc_id]
+        self._total_len -= int(segment.doc_lens[doc_number])
+        self._n_alive -= 1
+        self._dirty = True
+        return True
+
+    # ----- writes -----
+
+    def add(self, nodes: Iterable[BaseNode]) -> None:
+        docs = [
+            (
+                node.node_id,
+                node.ref_doc_id or "None",
+                tokenize(node.get_content(metadata_mode=MetadataMode.EMBED)),
+            )
+            for node in nodes
+        ]
+        if not docs:
+            return
+        segment = _Segment.build(docs)
+        with self._lock:
+            self._segments.append(segment)
+            self._register(segment)
+            self._dirty = True
+
+    def delete(self, key: str) -> None:
+        """Remove every node of a ref doc id, or a single node id"""
+        with self._lock:
+            for node_id in list(self._nodes_of_doc.get(key, ())):
+                self._remove_node(node_id)
+            self._remove_node(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._segments = []
+            self._location, self._nodes_of_doc = {}, {}
+            self._total_len = self._n_alive = 0
+            self._dirty = True
+
+    # ----- reads -----
+
+    def _allowed_masks(self, doc_ids: Iterable[str]) -> Dict[int, np.ndarray]:
+        """Per-segment masks of the live nodes belonging to the given ref doc ids"""
+        masks: Dict[int, np.ndarray] = {}
+        for doc_id in doc_ids:
+            for node_id in self._nodes_of_doc.get(doc_id, ()):
+                segment, doc_number = self._location[node_id]
+                mask = masks.get(id(segment))
+                if mask is None:
+                    mask = masks[id(segment)] = np.zeros(segment.n_docs, dtype=bool)
+                mask[doc_number] = True
+        return masks
+
+    def search(
+        self, query: str, top_k: int, doc_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """BM25 top_k as (node_id, score), best first, optionally within some ref docs"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms or not self._n_alive:
+                return []
+            allowed = None if doc_ids is None else self._allowed_masks(doc_ids)
+            segments = [
+                segment
+                for segment in self._segments
+                if allowed is None or id(segment) in allowed
+            ]
+            n_docs = self._n_alive
+            avg_len = self._total_len / n_docs
+
+            postings = {
+                term: [segment.postings_for(term) for segment in segments]
+                for term in terms
+            }
+            # Document frequencies across segments (tombstones count until merged)
+            idf = {}
+            for term in terms:
+                df = sum(len(doc_numbers) for doc_numbers, _ in postings[term])
+                idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+            results: List[Tuple[float, str]] = []
+            for s, segment in enumerate(segments):
+                scores = None
+                for term in terms:
+                    doc_numbers, tfs = postings[term][s]
+                    if not len(doc_numbers):
+                        continue
+                    tf = tfs.astype(np.float32)
+                    norm = self.k1 * (
+                        1 - self.b + self.b * segment.doc_lens[doc_numbers] / avg_len
+                    )
+                    if scores is None:
+                        scores = np.zeros(segment.n_docs, dtype=np.float32)
+                    scores[doc_numbers] += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+                if scores is None:
+                    continue
+                scores[~segment.alive] = 0.0
+                if allowed is not None:
+                    scores[~allowed[id(segment)]] = 0.0
+                hits = np.flatnonzero(scores > 0)
+                if len(hits) > top_k:
+                    hits = hits[np.argpartition(-scores[hits], top_k)[:top_k]]
+                results.extend((float(scores[i]), segment.node_ids[i]) for i in hits)
+
+        results.sort(reverse=True)
+        return [(node_id, score) for score, node_id in results[:top_k]]
+
+    # ----- persistence -----
+
+    def _maybe_merge(self) -> None:
+        """Merge the newest (smallest) segments, or everything if they outgrow the oldest"""
+        if len(self._segments) <= self.max_segments:
+            return
+        oldest, rest = self._segments[0], self._segments[1:]
+        rest_docs = sum(segment.n_docs for segment in rest)
+        to_merge = self._segments if rest_docs >= oldest.n_docs else rest
+        merged = _Segment.merge(to_merge)
+        self._segments = [s for s in self._segments if s not in to_merge] + [merged]
+        self._location, self._nodes_of_doc = {}, {}
+        self._total_len = self._n_alive = 0
+        for segment in self._segments:
+            self._register(segment)
+
+    def persist(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self._maybe_merge()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for segment in self._segments:
+                if segment.name is None:
+                    segment.save(self.directory, f"seg_{self._next_segment:06d}")
+                    self._next_segment += 1
+
+            manifest = {
+                "next_segment": self._next_segment,
+                "segments": [
+                    {
+                        "name": segment.name,
+                        "deleted": np.flatnonzero(~segment.alive).tolist(),
+                    }
+                    for segment in self._segments
+                ],
+            }
+            tmp_path = self.directory / "manifest.json.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.directory / "manifest.json")
+
+            # Drop files of merged-away segments
+            live = {segment.name for segment in self._segments}
+            for path in self.directory.glob("seg_*"):
+                if path.stem not in live:
+                    os.remove(path)
+            self._dirty = False
+
+    def load(self) -> "SparseIndex":
+        manifest_path = self.directory / "manifest.json"
+        if not manifest_path.exists():
+            return self
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with self._lock:
+            self.clear()
+            self._next_segment = manifest["next_segment"]
+            for entry in manifest["segments"]:
+                segment = _Segment.load(self.directory, entry["name"])
+                segment.alive[entry["deleted"]] = False
+                self._segments.append(segment)
+                self._register(segment)
+            self._dirty = False
+        print(f"[BM25] Loaded {self._n_alive} nodes in {len(self._segments)} segments")
+        return self
+
+
+# Create a single instance of the index to be used across the application
+sparse_index = SparseIndex(Path(APIConfig.STORAGE_DIR) / SPARSE_DIR_NAME)
@@ -0,0 +1,202 @@
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import APIConfig, VectorStoreConfig
+from ..models.document_schemas import DOCUMENT_TYPE_REGISTRY
+from ..vector_stores.matrix import EmbeddingMatrix, normalize_rows, top_k_indices
+
+# Sub-directory of the storage dir holding the document summary index
+SUMMARY_DIR_NAME = "summary_index"
+
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$")
+_WHITESPACE = re.compile(r"\s+")
+# Headings listed in the outline part of a summary
+_MAX_HEADINGS = 20
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return "、".join(str(v) for v in value if v)
+    return str(value)
+
+
+def build_summary_text(
+    metadata: Dict[str, Any], content: str = "", max_chars: int = 2000
+) -> str:
+    """
+    Document-level summary used for the first retrieval stage: the validated
+    schema fields (labelled with their Chinese descriptions), the Markdown
+    outline and the opening of the body.
+
+    content is the Markdown exported for metadata extraction, or the leading
+    chunk text when rebuilding from the docstore.
+    """
+    schema = metadata.get("document_schema") or metadata.get("document_type")
+    lines = [f"文件: {metadata.get('file_name', '')}"]
+    document_type = metadata.get("document_type")
+    lines.append(
+        f"类型: {schema} / {document_type}"
+        if document_type and document_type != schema
+        else f"类型: {schema}"
+    )
+
+    model = DOCUMENT_TYPE_REGISTRY.get(schema)
+    if model is not None:
+        for name, field in model.model_fields.items():
+            value = metadata.get(name)
+            if value and name != "document_type":
+                lines.append(f"{field.description or name}: {_format_value(value)}")
+
+    headings, body = [], []
+    for line in content.splitlines():
+        match = _HEADING.match(line)
+        if match:
+            if len(headings) < _MAX_HEADINGS:
+                headings.append(match.group(1))
+        else:
+            body.append(line)
+    if headings:
+        lines.append("大纲: " + " / ".join(headings))
+
+    summary = "\n".join(lines)
+    remaining = max_chars - len(summary) - len("\n正文: ")
+    if remaining > 0:
+        opening = _WHITESPACE.sub(" ", " ".join(body)).strip()[:remaining]
+        if opening:
+            summary += f"\n正文: {opening}"
+    return summary[:max_chars]
+
+
+class DocumentSummaryIndex:
+    """
+    One summary embedding per source document, in its own small
+    memory-mapped matrix (row id = ref doc id), with the summary texts in
+    SQLite so they can be inspected or re-embedded.
+
+    Two-stage retrieval scores the query against these N document vectors
+    first and then searches chunks only inside the best documents, instead
+    of scoring every chunk of the corpus.
+    """
+
+    def __init__(self, directory: Path, dtype: str = "float32"):
+        self.directory = Path(directory)
+        self._matrix = EmbeddingMatrix(self.directory, dtype)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.directory / "summaries.sqlite3", check_same_thread=False
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries (ref_doc_id TEXT PRIMARY KEY, text TEXT)"
+            )
+        return self._conn
+
+    def load(self) -> "DocumentSummaryIndex":
+        with self._lock:
+            if not self._loaded:
+                self._matrix.load()
+                self._loaded = True
+                print(f"[Summary] Loaded {self.size} document summaries.")
+        return self
+
+    @property
+    def size(self) -> int:
+        return self._matrix.size
+
+    def document_ids(self) -> set:
+        with self._lock:
+            return set(self._matrix.row_of)
+
+    # ----- writes -----
+
+    def add(self, items: Sequence[Tuple[str, str, List[float]]]) -> None:
+        """Add or replace (ref_doc_id, summary text, embedding) entries"""
+        if not items:
+            return
+        with self._lock:
+            self.load()
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO summaries VALUES (?, ?)",
+                    [(doc_id, text) for doc_id, text, _ in items],
+                )
+            doc_ids = [doc_id for doc_id, _, _ in items]
+            self._matrix.append(
+                doc_ids, doc_ids, normalize_rows([e for _, _, e in items])
+            )
+
+    def delete(self, ref_doc_id: str) -> None:
+        with self._lock:
+            self.load()
+            self._matrix.delete(ref_doc_id)
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "DELETE FROM summaries WHERE ref_doc_id = ?", (ref_doc_id,)
+                )
+
+    def persist(self) -> None:
+        with self._lock:
+            self._matrix.flush()
+
+    # ----- reads -----
+
+    def get_summaries(self, ref_doc_ids: Iterable[str]) -> Dict[str, str]:
+        ref_doc_ids = list(ref_doc_ids)
+        if not ref_doc_ids:
+            return {}
+        with self._lock:
+            placeholders = ",".join("?" for _ in ref_doc_ids)
+            rows = self._connection().execute(
+                f"SELECT ref_doc_id, text FROM summaries WHERE ref_doc_id IN ({placeholders})",
+                ref_doc_ids,
+            )
+            return dict(rows.fetchall())
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int,
+        doc_ids: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Best (ref_doc_id, cosine) pairs, within doc_ids if set"""
+        self.load()
+        query = normalize_rows(np.asarray(query_embedding))
+        # add() and delete() change the matrix and its id maps in place
+        with self._lock:
+            matrix = self._matrix
+            if not matrix.size:
+                return []
+            if doc_ids is not None:
+                rows = matrix.rows_for(node_ids=doc_ids)
+                scores = matrix.score(query, rows)
+            else:
+                rows = None
+                scores = matrix.score(query)
+                scores[~matrix.alive] = -np.inf
+            if not len(scores):
+                return []
+            best = top_k_indices(scores, min(top_k, len(scores)))
+            best_rows = best if rows is None else rows[best]
+            return [
+                (matrix.node_ids[row], float(scores[i]))
+                for i, row in zip(best, best_rows)
+                if np.isfinite(scores[i])
+            ]
+
+
+# Create a single instance of the index to be used across the application
+summary_index = DocumentSummaryIndex(
+    Path(APIConfig.STORAGE_DIR) / SUMMARY_DIR_NAME, VectorStoreConfig.EMBEDDING_DTYPE
+)
@@ -1,19 +1,26 @@
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import HTTPException
-from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core import load_index_from_storage
 from llama_index.core.agent import ReActAgent
 from llama_index.core.callbacks import CallbackManager
 
-from ..agents.tools import create_agent, clear_state_cache
-from ..config import APIConfig
+from ..agents.context import RequestContext
+from ..agents.pool import AgentPool
+from ..agents.prefetch import speculative_prefetcher
+from ..agents.tools import create_agent, create_researcher_tool
+from ..config import APIConfig, SchedulerConfig, load_storage_context
+from ..retrieval.sharding import ShardedIndex
 
 
 class AgentService:
     """A singleton service to manage the lifecycle of the ReActAgent."""
 
     _index = None
+    # Bumped whenever the index is swapped for a reloaded one
+    index_version = 0
     _callback_manager: Optional[CallbackManager] = None
+    _pool: Optional[AgentPool] = None
 
     @classmethod
     def initialize(cls, index, callback_manager: CallbackManager):
@@ -21,43 +28,80 @@ class AgentService:
         print("Initializing AgentService...")
         cls._index = index
         cls._callback_manager = callback_manager
+
+        # Agents only differ by their memory, so they are pooled and share
+        # one set of tools; each request passes its index in its context
+        tools = create_researcher_tool()
+        cls._pool = AgentPool(
+            lambda: create_agent(None, callback_manager, tools),
+            max_idle=SchedulerConfig.CHAT_MAX_CONCURRENCY,
+        )
+        cls._pool.warm_up(SchedulerConfig.CHAT_MAX_CONCURRENCY)
         print("AgentService initialized successfully.")
 
     @classmethod
-    def get_agent_for_query(cls, user_query: str) -> Optional[ReActAgent]:
+    def get_agent_for_query(
+        cls, user_query: str, context: Optional[RequestContext] = None
+    ) -> Optional[ReActAgent]:
         """
-        Creates a new agent instance for a specific user query.
-        This ensures that each research process has its own context.
+        Takes a reset agent from the pool for a specific user query.
+        The request context carries the query and the current index, which
+        ensures that each research process has its own context.
         """
-        if cls._index is None or cls._callback_manager is None:
+        if cls._index is None or cls._pool is None:
             print("Error: AgentService not initialized. Call initialize() first.")
             return None
 
-        print(f"Creating a new agent instance for query: '{user_query}'")
-        agent = create_agent(
-            index=cls._index,
-            callback_manager=cls._callback_manager,
-            user_query=user_query,
-        )
-        if agent:
-            print("Agent instance created successfully.")
-        else:
+        if context is not None and context.index is None:
+            cls.bind_index(context)
+        print(f"Acquiring an agent instance for query: '{user_query}'")
+        agent = cls._pool.acquire()
+        if not agent:
             print("Agent instance creation failed.")
         return agent
 
     @classmethod
-    def cleanup_after_request(cls):
-        """Cleans up any state after a request is completed."""
-        print("Cleaning up state cache after request.")
-        clear_state_cache()
+    def bind_index(cls, context: RequestContext) -> bool:
+        """Gives the request the current index snapshot; False before initialization."""
+        if cls._index is None:
+            return False
+        # Version first: a reload in between leaves the snapshot newer than
+        # its version, never older, so no stale results are cached as current
+        context.index_version = cls.index_version
+        context.index = cls._index
+        return True
+
+    @classmethod
+    def cleanup_after_request(
+        cls,
+        context: Optional[RequestContext] = None,
+        agent: Optional[ReActAgent] = None,
+    ):
+        """Cleans up the request's state and returns its agent to the pool."""
+        if cls._pool is not None:
+            cls._pool.release(agent)
+        if context is None:
+            return
+        speculative_prefetcher.cancel(context)
+        print(
+            f"Cleaning up request {context.request_id} "
+            f"({context.research_steps} research steps, {context.context_tokens} context tokens, "
+            f"{context.prompt_tokens} prompt tokens)."
+        )
+        context.close()
+
+    @classmethod
+    def metrics(cls) -> dict:
+        return cls._pool.metrics() if cls._pool is not None else {}
 
     @classmethod
-    def reload_agent(cls):
+    def reload_agent(cls, shard_keys: Optional[List[str]] = None):
         """
         Reloads the index from the persisted storage.
 
         This is a critical step after adding new documents. It ensures
         that any new agent created will have access to the latest data.
+        For a sharded index only the given shards (default: all) are re-read.
         """
         if cls._callback_manager is None:
             # This check ensures the service was initialized before trying to reload.
@@ -68,10 +112,16 @@ class AgentService:
 
         print("--- Reloading AgentService with updated index from storage ---")
         try:
+            if isinstance(cls._index, ShardedIndex):
+                cls._index = cls._index.reloaded(shard_keys)
+                cls.index_version += 1
+                print(
+                    "AgentService reloaded successfully. It will now use the updated index."
+                )
+                return
+
             # 1. Point to the directory where the index was persisted.
-            storage_context = StorageContext.from_defaults(
-                persist_dir=APIConfig.STORAGE_DIR
-            )
+            storage_context = load_storage_context(APIConfig.STORAGE_DIR)
 
             # 2. Load the index from the storage context.
             # This loads the entire index, including the newly added documents.
@@ -79,6 +129,7 @@ class AgentService:
 
             # 3. Replace the service's old index with the newly reloaded one.
             cls._index = reloaded_index
+            cls.index_version += 1
             print(
                 "AgentService reloaded successfully. It will now use the updated index."
             )
@@ -0,0 +1,162 @@
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import RetrievalConfig
+from ..retrieval.embedding_cache import normalize_query
+from ..retrieval.metadata_index import metadata_index
+
+_NUMBER = re.compile(r"\d+")
+
+
+def query_signature(query: str) -> Tuple:
+    """
+    Parts of a query that must match exactly for a cached answer to apply.
+
+    Embeddings of "2023 年的招生通知" and "2024 年的招生通知" are nearly
+    identical, but the answers are not: the numbers in the query and the
+    metadata filters parsed from it have to be equal too.
+    """
+    normalized = normalize_query(query)
+    parsed = (
+        metadata_index.parse_filter(normalized).describe()
+        if metadata_index.size
+        else {}
+    )
+    return (
+        tuple(_NUMBER.findall(normalized)),
+        tuple(sorted((key, str(value)) for key, value in parsed.items())),
+    )
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    signature: Tuple
+    index_version: int
+    # SSE payloads of the original run (steps, documents, answer tokens)
+    events: List[dict]
+    created_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class SemanticAnswerCache:
+    """
+    Final answers of first-turn chats, with their research traces, looked up
+    by query embedding similarity.
+
+    A hit needs a cosine of at least `threshold` with a cached query, the
+    same query signature (numbers, parsed filters) and the current index
+    version; the ingestion service drops every entry of older versions when
+    it commits a write. Entries expire after `ttl` seconds and the oldest go
+    first when `max_entries` is reached.
+    """
+
+    def __init__(
+        self, threshold: float = 0.95, max_entries: int = 512, ttl: float = 86400.0
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: List[CachedAnswer] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(
+        self, query: str, embedding: Sequence[float], index_version: int
+    ) -> Optional[Tuple[CachedAnswer, float]]:
+        """Best cached answer for the query and its similarity, or None"""
+        vector = self._normalize(embedding)
+        signature = query_signature(query)
+        now = time.monotonic()
+        with self._lock:
+            if self._entries and self._matrix.shape[1] == len(vector):
+                scores = self._matrix @ vector
+                for row in np.argsort(-scores):
+                    if scores[row] < self.threshold:
+                        break
+                    entry = self._entries[row]
+                    if (
+                        entry.index_version == index_version
+                        and entry.signature == signature
+                        and now - entry.created_at <= self.ttl
+                    ):
+                        entry.hits += 1
+                        self.hits += 1
+                        return entry, float(scores[row])
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        query: str,
+        embedding: Sequence[float],
+        index_version: int,
+        events: List[dict],
+    ) -> None:
+        entry = CachedAnswer(
+            query=query,
+            signature=query_signature(query),
+            index_version=index_version,
+            events=events,
+        )
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._matrix.shape[1] not in (0, len(vector)):
+                # Embedding model changed: nothing cached is comparable
+                self._entries, self._matrix = [], np.zeros((0, 0), dtype=np.float32)
+            self._entries.append(entry)
+            rows = [self._matrix] if len(self._matrix) else []
+            self._matrix = np.vstack(rows + [vector[None, :]])
+            if len(self._entries) > self.max_entries:
+                excess = len(self._entries) - self.max_entries
+                self._entries = self._entries[excess:]
+                self._matrix = self._matrix[excess:]
+            self.stores += 1
+
+    def invalidate(self, index_version: int) -> None:
+        """Drops the answers computed against any other index version."""
+        with self._lock:
+            keep = [
+                i
+                for i, e in enumerate(self._entries)
+                if e.index_version == index_version
+            ]
+            self.invalidations += len(self._entries) - len(keep)
+            self._entries = [self._entries[i] for i in keep]
+            self._matrix = (
+                self._matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+            )
+
+    def metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidated": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Create a single instance of the cache to be used across the application
+answer_cache = SemanticAnswerCache(
+    threshold=RetrievalConfig.ANSWER_CACHE_THRESHOLD,
+    max_entries=RetrievalConfig.ANSWER_CACHE_SIZE,
+    ttl=RetrievalConfig.ANSWER_CACHE_TTL,
+)
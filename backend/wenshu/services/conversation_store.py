@@ -0,0 +1,197 @@
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from ..config import APIConfig, ChatConfig
+
+
+class ConversationStore:
+    """
+    Server-side chat conversations: an append-only message log per
+    conversation id in SQLite, with the most recently used conversations
+    kept in memory as ready-made ChatMessage lists.
+
+    The client only sends the new message; the history comes from here.
+    Conversations unused for `ttl_seconds` are pruned (checked at most once
+    per `prune_interval` seconds, when a conversation is created).
+    The methods block on SQLite: call them from a worker thread.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_cached: int = 256,
+        ttl_seconds: float = 0.0,
+        prune_interval: float = 3600.0,
+    ):
+        self.db_path = Path(db_path)
+        self.max_cached = max_cached
+        self.ttl_seconds = ttl_seconds
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self.pruned = 0
+        self._cache: "OrderedDict[str, List[ChatMessage]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.loads = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_conversations_updated
+                    ON conversations(updated_at);
+                CREATE TABLE IF NOT EXISTS messages (
+                    conversation_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (conversation_id, seq)
+                );
+                """)
+        return self._conn
+
+    def _remember(self, conversation_id: str, messages: List[ChatMessage]) -> None:
+        self._cache[conversation_id] = messages
+        self._cache.move_to_end(conversation_id)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def create(self, messages: Optional[List[ChatMessage]] = None) -> str:
+        """New conversation, optionally seeded with an existing history"""
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            if self.ttl_seconds > 0 and now - self._last_prune >= self.prune_interval:
+                self.prune()
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT INTO conversations VALUES (?, ?, ?)",
+                    (conversation_id, now, now),
+                )
+            self._remember(conversation_id, [])
+            for message in messages or []:
+                self.append(conversation_id, message.role, message.content or "")
+        return conversation_id
+
+    def get_messages(self, conversation_id: str) -> Optional[List[ChatMessage]]:
+        """The conversation's messages (a copy), or None for an unknown id"""
+        with self._lock:
+            messages = self._cache.get(conversation_id)
+            if messages is not None:
+                self._cache.move_to_end(conversation_id)
+                self.hits += 1
+                return list(messages)
+
+            conn = self._connection()
+            if not conn.execute(
+                "SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone():
+                return None
+            rows = conn.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,),
+            ).fetchall()
+            messages = [
+                ChatMessage(role=MessageRole(role), content=content)
+                for role, content in rows
+            ]
+            self.loads += 1
+            self._remember(conversation_id, messages)
+            return list(messages)
+
+    def append(self, conversation_id: str, role: MessageRole, content: str) -> None:
+        with self._lock:
+            messages = self.get_messages(conversation_id)
+            if messages is None:
+                raise KeyError(conversation_id)
+            conn = self._connection()
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                    (conversation_id, len(messages), role.value, content, now),
+                )
+                conn.execute(
+                    "UPDATE conversations SET updated_at = ? WHERE id = ?",
+                    (now, conversation_id),
+                )
+            self._cache[conversation_id].append(ChatMessage(role=role, content=content))
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)
+                )
+                deleted = conn.execute(
+                    "DELETE FROM conversations WHERE id = ?", (conversation_id,)
+                ).rowcount
+            return bool(deleted)
+
+    def prune(self, max_age_seconds: Optional[float] = None) -> int:
+        """Deletes the conversations not used for max_age_seconds (default: the TTL)"""
+        max_age = self.ttl_seconds if max_age_seconds is None else max_age_seconds
+        if max_age <= 0:
+            return 0
+        with self._lock:
+            now = time.time()
+            self._last_prune = now
+            conn = self._connection()
+            expired = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM conversations WHERE updated_at < ?",
+                    (now - max_age,),
+                )
+            ]
+            with conn:
+                conn.executemany(
+                    "DELETE FROM messages WHERE conversation_id = ?",
+                    [(c,) for c in expired],
+                )
+                conn.executemany(
+                    "DELETE FROM conversations WHERE id = ?", [(c,) for c in expired]
+                )
+            for conversation_id in expired:
+                self._cache.pop(conversation_id, None)
+            self.pruned += len(expired)
+        if expired:
+            print(
+                f"🧹 Pruned {len(expired)} conversation(s) unused for {max_age / 86400:g} day(s)"
+            )
+        return len(expired)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "cached": len(self._cache),
+            "cache_hits": self.hits,
+            "loads": self.loads,
+            "pruned": self.pruned,
+        }
+
+
+# Create a single instance of the store to be used across the application
+conversation_store = ConversationStore(
+    APIConfig.CONVERSATIONS_DB,
+    max_cached=ChatConfig.CONVERSATION_CACHE_SIZE,
+    ttl_seconds=ChatConfig.CONVERSATION_TTL_DAYS * 86400,
+)
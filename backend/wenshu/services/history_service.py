@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.utils import get_tokenizer
+
+from ..config import ChatConfig
+
+SUMMARY_PROMPT_TEMPLATE = """
+You maintain a running summary of a conversation between a user and a research assistant that answers questions from a document knowledge base.
+
+**Summary so far:**
+{summary}
+
+**New messages to fold in:**
+---------------------
+{messages}
+---------------------
+
+Write the updated summary in the language of the conversation, in at most {max_words} words. Keep the user's goals and constraints, the questions already answered with their key facts, figures, dates and document names, and anything the user asked to remember. Drop pleasantries and reasoning. Output only the summary.
+"""
+
+SUMMARY_MESSAGE_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def _prefix_hashes(messages: List[ChatMessage]) -> List[str]:
+    """hashes[i] identifies messages[:i]; the chain makes it specific to one conversation"""
+    hashes = [""]
+    for message in messages:
+        digest = hashlib.sha1(hashes[-1].encode("utf-8"))
+        digest.update(
+            f"{message.role.value}\0{message.content or ''}\0".encode("utf-8")
+        )
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def _render(messages: List[ChatMessage]) -> str:
+    return "\n".join(
+        f"{'User' if m.role == MessageRole.USER else 'Assistant'}: {m.content or ''}"
+        for m in messages
+    )
+
+
+class ChatHistoryManager:
+    """
+    Keeps the chat history sent to the agent bounded.
+
+    The last `keep_turns` exchanges stay verbatim (fewer if they alone exceed
+    the token budget); everything before is replaced by one summary message.
+    Summaries are cached by the hash of the history prefix they cover, so
+    each turn only folds the messages that left the verbatim window into
+    the previous summary instead of summarizing the whole conversation again.
+    While the unsummarized messages still fit the budget, folding runs in the
+    background and the current turn uses the last summary plus those messages.
+    """
+
+    def __init__(
+        self,
+        keep_turns: int = 3,
+        token_budget: int = 3000,
+        summary_tokens: int = 400,
+        max_summaries: int = 1024,
+        tokenizer: Optional[Callable[[str], List[int]]] = None,
+    ):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.max_summaries = max_summaries
+        self._tokenizer = tokenizer or get_tokenizer()
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # The event loop keeps only weak references to tasks: hold the
+        # background summaries until they finish
+        self._background: Set[asyncio.Task] = set()
+        self.compactions = 0
+        self.summaries_built = 0
+        self.summaries_reused = 0
+        self.failures = 0
+
+    def count_tokens(self, messages: List[ChatMessage]) -> int:
+        return sum(len(self._tokenizer(m.content or "")) for m in messages)
+
+    def _verbatim_start(self, messages: List[ChatMessage]) -> int:
+        """Index of the first message kept verbatim"""
+        user_turns = [i for i, m in enumerate(messages) if m.role == MessageRole.USER]
+        if len(user_turns) <= self.keep_turns:
+            start = 0
+        else:
+            start = user_turns[-self.keep_turns]
+        budget = self.token_budget - self.summary_tokens
+        while (
+            start < len(messages) - 1 and self.count_tokens(messages[start:]) > budget
+        ):
+            later = [i for i in user_turns if i > start]
+            start = later[0] if later else start + 1
+        return start
+
+    def _cached_summary(self, hashes: List[str], end: int) -> Tuple[int, str]:
+        """Longest prefix of messages[:end] with a summary: (its length, summary)"""
+        for i in range(end, 0, -1):
+            summary = self._summaries.get(hashes[i])
+            if summary is not None:
+                self._summaries.move_to_end(hashes[i])
+                return i, summary
+        return 0, ""
+
+    def _store(self, key: str, summary: str) -> None:
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_summaries:
+            self._summaries.popitem(last=False)
+
+    async def _fold(self, summary: str, messages: List[ChatMessage]) -> str:
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(
+            summary=summary or "(empty)",
+            messages=_render(messages),
+            max_words=max(50, self.summary_tokens // 2),
+        )
+        text = (await Settings.llm.acomplete(prompt)).text.strip()
+        tokens = len(self._tokenizer(text))
+        if tokens > self.summary_tokens:
+            text = text[: len(text) * self.summary_tokens // tokens]
+        return text
+
+    async def _summarize(
+        self, messages: List[ChatMessage], hashes: List[str], end: int
+    ) -> str:
+        """Summary of messages[:end], folding only what the cached summaries miss"""
+        key = hashes[end]
+        if key in self._summaries:
+            return self._summaries[key]
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        async def build() -> str:
+            start, summary = self._cached_summary(hashes, end)
+            summary = await self._fold(summary, messages[start:end])
+            self._store(key, summary)
+            self.summaries_built += 1
+            return summary
+
+        task = asyncio.create_task(build())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _summarize_in_background(
+        self, messages: List[ChatMessage], hashes: List[str], end: int
+    ) -> None:
+        task = asyncio.create_task(self._summarize(messages, hashes, end))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.failures += 1
+            print(f"Warning: background history summary failed: {error}")
+
+    async def compact(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        """The history to send to the agent: a summary message plus the recent turns"""
+        start = self._verbatim_start(messages)
+        if start == 0:
+            return messages
+
+        self.compactions += 1
+        recent = messages[start:]
+        hashes = _prefix_hashes(messages[:start])
+        covered, summary = self._cached_summary(hashes, start)
+        if covered == start:
+            self.summaries_reused += 1
+        else:
+            unsummarized = messages[covered:start]
+            if (
+                self.count_tokens(unsummarized + recent) + len(self._tokenizer(summary))
+                <= self.token_budget
+            ):
+                # Still fits: fold for the next turn without delaying this one
+                self._summarize_in_background(messages[:start], hashes, start)
+                recent = unsummarized + recent
+            else:
+                try:
+                    summary = await self._summarize(messages[:start], hashes, start)
+                except Exception as e:
+                    # Bounded anyway: lose the old turns rather than the request
+                    self.failures += 1
+                    print(f"Warning: history summary failed, dropping old turns: {e}")
+
+        if not summary:
+            return recent
+        return [
+            ChatMessage(
+                role=MessageRole.ASSISTANT, content=SUMMARY_MESSAGE_PREFIX + summary
+            )
+        ] + recent
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "cached_summaries": len(self._summaries),
+            "compactions": self.compactions,
+            "summaries_built": self.summaries_built,
+            "summaries_reused": self.summaries_reused,
+            "failures": self.failures,
+        }
+
+
+# Create a single instance of the manager to be used across the application
+history_manager = ChatHistoryManager(
+    keep_turns=ChatConfig.HISTORY_KEEP_TURNS,
+    token_budget=ChatConfig.HISTORY_TOKEN_BUDGET,
+    summary_tokens=ChatConfig.HISTORY_SUMMARY_TOKENS,
+    max_summaries=ChatConfig.HISTORY_SUMMARY_CACHE_SIZE,
+)
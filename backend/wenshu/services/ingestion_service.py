@@ -0,0 +1,237 @@
+import threading
+from typing import Any, Dict, Iterable, List
+
+from llama_index.core import Settings
+from llama_index.core.schema import BaseNode
+
+from ..config import APIConfig, RetrievalConfig
+from ..processors.document_processor import iter_batches
+from ..retrieval.metadata_index import metadata_index
+from ..retrieval.result_cache import chunk_retrieval_cache, document_selection_cache
+from ..retrieval.sharding import ShardedIndex
+from ..retrieval.sparse_index import sparse_index
+from ..retrieval.summary_index import build_summary_text, summary_index
+from .agent_service import agent_service
+from .answer_cache import answer_cache
+
+# Number of nodes embedded and inserted per index.insert_nodes call
+INSERT_BATCH_SIZE = 256
+# Number of document summaries embedded per call when backfilling
+SUMMARY_BATCH_SIZE = 32
+
+
+class IngestionService:
+    """A singleton service that owns every write to the knowledge base index.
+
+    Both the interactive upload flow and the background directory sync go
+    through this service, so writes are serialized and always followed by
+    a persist + agent reload. It also keeps the BM25, metadata and
+    document summary indexes in step with the vector index.
+    """
+
+    _index = None
+    _write_lock = threading.RLock()
+    # Bumped on every committed write; cached answers are tagged with it
+    index_version = 0
+
+    @classmethod
+    def initialize(cls, index):
+        """Initializes the service with the writable index at startup."""
+        cls._index = index
+        if RetrievalConfig.HYBRID_ENABLED:
+            cls._load_sparse_index()
+        if not metadata_index.size and cls._index.docstore.docs:
+            print("[Storage] Building metadata index from the existing docstore...")
+            metadata_index.add_nodes(cls._index.docstore.docs.values())
+            print(
+                f"[Storage] Metadata index built over {metadata_index.size} documents."
+            )
+        else:
+            cls._backfill_document_schemas()
+        if RetrievalConfig.HIERARCHICAL_ENABLED:
+            summary_index.load()
+            # Embedding every missing summary takes a while; retrieval stays
+            # flat until the summaries cover the corpus
+            threading.Thread(
+                target=cls._backfill_summaries, name="summary-backfill", daemon=True
+            ).start()
+
+    @classmethod
+    def _backfill_document_schemas(cls):
+        """Re-indexes documents whose metadata rows predate document_schema."""
+        missing = set(metadata_index.documents_without_schema())
+        if not missing:
+            return
+        metadata_index.add_nodes(
+            node
+            for node in cls._index.docstore.docs.values()
+            if node.ref_doc_id in missing
+        )
+        remaining = len(metadata_index.documents_without_schema())
+        print(
+            f"[Storage] Derived the schema of {len(missing) - remaining} "
+            f"legacy documents in the metadata index."
+        )
+
+    @classmethod
+    def _backfill_summaries(cls):
+        """Builds summaries of documents ingested before the summary index existed."""
+        try:
+            nodes_by_doc: Dict[str, List[BaseNode]] = {}
+            known = summary_index.document_ids()
+            for node in cls._index.docstore.docs.values():
+                if node.ref_doc_id and node.ref_doc_id not in known:
+                    nodes_by_doc.setdefault(node.ref_doc_id, []).append(node)
+            if not nodes_by_doc:
+                return
+
+            print(f"[Storage] Building summaries of {len(nodes_by_doc)} documents...")
+            for batch in iter_batches(nodes_by_doc.items(), SUMMARY_BATCH_SIZE):
+                items = [
+                    (
+                        ref_doc_id,
+                        build_summary_text(
+                            nodes[0].metadata,
+                            # No Markdown kept for old documents: use their leading chunks
+                            "\n".join(node.get_content() for node in nodes[:3]),
+                            RetrievalConfig.SUMMARY_MAX_CHARS,
+                        ),
+                    )
+                    for ref_doc_id, nodes in batch
+                ]
+                embeddings = Settings.embed_model.get_text_embedding_batch(
+                    [text for _, text in items]
+                )
+                with cls._write_lock:
+                    # The snapshot predates the lock: skip documents deleted since,
+                    # and ones whose upload added a fresher summary meanwhile
+                    known = summary_index.document_ids()
+                    summary_index.add(
+                        [
+                            (doc_id, text, e)
+                            for (doc_id, text), e in zip(items, embeddings)
+                            if doc_id not in known
+                            and cls._index.docstore.get_ref_doc_info(doc_id) is not None
+                        ]
+                    )
+            with cls._write_lock:
+                summary_index.persist()
+            print(f"[Storage] Summary index built over {summary_index.size} documents.")
+        except Exception as e:
+            print(f"[Storage] Summary backfill failed, retrieval stays flat: {e}")
+
+    @classmethod
+    def _load_sparse_index(cls):
+        """Loads the BM25 index, building it from the docstore the first time."""
+        sparse_index.load()
+        if sparse_index.size or not cls._index.docstore.docs:
+            return
+        print("[Storage] Building BM25 index from the existing docstore...")
+        for batch in iter_batches(cls._index.docstore.docs.values(), INSERT_BATCH_SIZE):
+            sparse_index.add(batch)
+        sparse_index.persist()
+        print(f"[Storage] BM25 index built over {sparse_index.size} nodes.")
+
+    @classmethod
+    def add_nodes(cls, nodes: Iterable[BaseNode]) -> int:
+        """
+        Inserts nodes into the index in fixed-size batches.
+
+        Large (streamed) documents never materialize all of their nodes at once.
+        Returns the number of nodes inserted.
+        """
+        if cls._index is None:
+            raise RuntimeError("IngestionService not initialized.")
+
+        nodes_added = 0
+        with cls._write_lock:
+            for batch in iter_batches(nodes, INSERT_BATCH_SIZE):
+                cls._index.insert_nodes(batch)
+                if RetrievalConfig.HYBRID_ENABLED:
+                    sparse_index.add(batch)
+                metadata_index.add_nodes(batch)
+                nodes_added += len(batch)
+        return nodes_added
+
+    @classmethod
+    def add_document_summary(
+        cls, ref_doc_id: str, metadata: Dict[str, Any], markdown_content: str
+    ) -> None:
+        """
+        Embeds the document-level summary (validated fields + the Markdown
+        used for metadata extraction) into the summary index.
+        """
+        if not RetrievalConfig.HIERARCHICAL_ENABLED:
+            return
+        text = build_summary_text(
+            metadata, markdown_content, RetrievalConfig.SUMMARY_MAX_CHARS
+        )
+        embedding = Settings.embed_model.get_text_embedding(text)
+        with cls._write_lock:
+            summary_index.add([(ref_doc_id, text, embedding)])
+
+    @classmethod
+    def delete_document(cls, ref_doc_id: str) -> None:
+        """Removes every node that was produced from the given source document."""
+        if cls._index is None:
+            raise RuntimeError("IngestionService not initialized.")
+
+        with cls._write_lock:
+            cls._index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            if RetrievalConfig.HYBRID_ENABLED:
+                sparse_index.delete(ref_doc_id)
+            metadata_index.delete_document(ref_doc_id)
+            if RetrievalConfig.HIERARCHICAL_ENABLED:
+                summary_index.delete(ref_doc_id)
+
+    @classmethod
+    def commit(cls) -> None:
+        """Persists the index and reloads the agent so new chats see the changes."""
+        changed_shards = None
+        with cls._write_lock:
+            print(f"[Storage] Persisting index to {APIConfig.STORAGE_DIR}...")
+            if isinstance(cls._index, ShardedIndex):
+                # Only the shards written since the last commit
+                changed_shards = cls._index.persist()
+                print(f"[Storage] Persisted shards: {changed_shards}")
+            else:
+                cls._index.storage_context.persist(APIConfig.STORAGE_DIR)
+            if RetrievalConfig.HYBRID_ENABLED:
+                sparse_index.persist()
+            if RetrievalConfig.HIERARCHICAL_ENABLED:
+                summary_index.persist()
+            print("[Storage] Index persisted successfully.")
+
+        print("[Storage] Reloading agent...")
+        agent_service.reload_agent(changed_shards)
+        print("[Storage] Agent reloaded.")
+
+        # Only now do new chats see the new index: answers from older
+        # versions are stale
+        cls.index_version += 1
+        answer_cache.invalidate(cls.index_version)
+        # Cached retrieval results are keyed by the agent's index version, so
+        # results from the old snapshot are unreachable now; free them
+        document_selection_cache.clear()
+        chunk_retrieval_cache.clear()
+
+    @classmethod
+    def rebuild_shard(cls, shard_key: str) -> int:
+        """
+        Rebuilds one shard's vector store from its docstore while the other
+        shards keep serving. Returns the number of nodes in the shard.
+        """
+        if not isinstance(cls._index, ShardedIndex):
+            raise RuntimeError(
+                "The knowledge base is not sharded (SHARD_FIELD is empty)."
+            )
+
+        with cls._write_lock:
+            nodes = cls._index.rebuild_shard(shard_key)
+        # Re-read every shard: a changed SHARD_FIELD may have moved nodes out
+        agent_service.reload_agent()
+        return nodes
+
+
+# Create a single instance of the service to be used across the application
+ingestion_service = IngestionService()
@@ -0,0 +1,279 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import AsyncIterator, Deque, Dict
+
+from fastapi import HTTPException
+
+from ..config import SchedulerConfig
+
+
+class WorkloadClass(str, Enum):
+    """Workload classes competing for the worker's LLM / CPU slots."""
+
+    CHAT = "chat"
+    AUTOFILL = "autofill"
+    INGESTION = "ingestion"
+
+
+@dataclass
+class WorkloadLimits:
+    """Admission limits for one workload class. Lower priority value wins."""
+
+    priority: int
+    max_concurrency: int
+    max_queue: int
+    max_wait: float
+
+
+@dataclass
+class WorkloadStats:
+    admitted: int = 0
+    rejected: int = 0
+    completed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    total_hold: float = 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_wait_ms": (
+                round(1000 * self.total_wait / self.admitted, 2)
+                if self.admitted
+                else 0.0
+            ),
+            "max_wait_ms": round(1000 * self.max_wait, 2),
+            "avg_hold_ms": (
+                round(1000 * self.total_hold / self.completed, 2)
+                if self.completed
+                else 0.0
+            ),
+        }
+
+
+class SlotLease:
+    """
+    A slot acquired by an endpoint whose work outlives the handler (a
+    streaming body). release() is idempotent, so every exit path may call it.
+    """
+
+    def __init__(self, scheduler: "RequestScheduler", workload: WorkloadClass):
+        self._scheduler = scheduler
+        self.workload = workload
+        self._started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self._scheduler.release(self.workload, time.monotonic() - self._started)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class RequestScheduler:
+    """
+    Priority-aware admission control for the shared LLM / CPU slots of a worker.
+
+    - Every workload class has its own concurrency limit and queue depth.
+    - A pool of `total_slots` is shared by all classes; when a slot frees up it
+      goes to the highest-priority class with a waiter (chat first).
+    - `chat_reserved_slots` slots can only ever be taken by chat, so a burst
+      of uploads can't occupy every slot and delay chat time-to-first-token.
+    - When a class's queue is full, or a waiter exceeds its max wait, the
+      request is shed with 429 and a Retry-After estimate.
+    """
+
+    def __init__(
+        self,
+        total_slots: int,
+        chat_reserved_slots: int,
+        limits: Dict[WorkloadClass, WorkloadLimits],
+    ):
+        self.total_slots = total_slots
+        self.chat_reserved_slots = min(chat_reserved_slots, total_slots)
+        self.limits = limits
+        self._in_use = 0
+        self._running: Dict[WorkloadClass, int] = {c: 0 for c in limits}
+        self._waiters: Dict[WorkloadClass, Deque[_Waiter]] = {
+            c: deque() for c in limits
+        }
+        self._stats: Dict[WorkloadClass, WorkloadStats] = {
+            c: WorkloadStats() for c in limits
+        }
+        self._by_priority = sorted(limits, key=lambda c: limits[c].priority)
+
+    def _can_start(self, workload: WorkloadClass) -> bool:
+        if self._running[workload] >= self.limits[workload].max_concurrency:
+            return False
+        free_slots = self.total_slots - self._in_use
+        if workload == WorkloadClass.CHAT:
+            return free_slots > 0
+        return free_slots > self.chat_reserved_slots
+
+    def _grant(self, workload: WorkloadClass, waited: float) -> None:
+        self._in_use += 1
+        self._running[workload] += 1
+        stats = self._stats[workload]
+        stats.admitted += 1
+        stats.total_wait += waited
+        stats.max_wait = max(stats.max_wait, waited)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters in priority order."""
+        for workload in self._by_priority:
+            waiters = self._waiters[workload]
+            while waiters and self._can_start(workload):
+                waiter = waiters.popleft()
+                if waiter.future.done():
+                    continue
+                self._grant(workload, time.monotonic() - waiter.enqueued_at)
+                waiter.future.set_result(None)
+
+    def _higher_priority_waiting(self, workload: WorkloadClass) -> bool:
+        priority = self.limits[workload].priority
+        return any(
+            self._waiters[c]
+            for c in self._by_priority
+            if self.limits[c].priority <= priority
+        )
+
+    def retry_after(self, workload: WorkloadClass) -> int:
+        """Rough seconds until a slot frees up for this class."""
+        stats = self._stats[workload]
+        avg_hold = stats.total_hold / stats.completed if stats.completed else 1.0
+        queued = len(self._waiters[workload]) + 1
+        # A class limited to 0 concurrent requests never frees a slot of its own
+        concurrency = max(1, self.limits[workload].max_concurrency)
+        return max(1, math.ceil(avg_hold * queued / concurrency))
+
+    def _reject(self, workload: WorkloadClass, reason: str) -> HTTPException:
+        self._stats[workload].rejected += 1
+        retry_after = self.retry_after(workload)
+        print(f"[Scheduler] Shedding {workload.value} request: {reason}")
+        return HTTPException(
+            status_code=429,
+            detail=f"Server busy ({workload.value}): {reason}. Please retry later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def acquire(self, workload: WorkloadClass, shed: bool = True) -> None:
+        """
+        Waits for a slot for the given workload class.
+
+        With shed=False (background work) the call queues without a depth or
+        wait limit instead of raising 429.
+        """
+        if not self._higher_priority_waiting(workload) and self._can_start(workload):
+            self._grant(workload, 0.0)
+            return
+
+        limits = self.limits[workload]
+        waiters = self._waiters[workload]
+        if shed and len(waiters) >= limits.max_queue:
+            raise self._reject(workload, "queue is full")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future())
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(waiter.future), limits.max_wait if shed else None
+            )
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                return  # granted right at the deadline
+            waiter.future.cancel()
+            waiters.remove(waiter)
+            raise self._reject(workload, "timed out waiting in queue")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(workload)
+            else:
+                waiter.future.cancel()
+                if waiter in waiters:
+                    waiters.remove(waiter)
+            raise
+
+    def release(self, workload: WorkloadClass, held: float = 0.0) -> None:
+        self._in_use -= 1
+        self._running[workload] -= 1
+        stats = self._stats[workload]
+        stats.completed += 1
+        stats.total_hold += held
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self, workload: WorkloadClass, shed: bool = True
+    ) -> AsyncIterator[None]:
+        """Holds a slot for the duration of the block."""
+        await self.acquire(workload, shed=shed)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(workload, time.monotonic() - started)
+
+    async def lease(self, workload: WorkloadClass, shed: bool = True) -> SlotLease:
+        """
+        Acquires a slot that the caller releases itself, for work that
+        continues after the endpoint returns (see ReleasingStreamingResponse).
+        """
+        await self.acquire(workload, shed=shed)
+        return SlotLease(self, workload)
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "total_slots": self.total_slots,
+            "slots_in_use": self._in_use,
+            "chat_reserved_slots": self.chat_reserved_slots,
+            "classes": {
+                workload.value: {
+                    "running": self._running[workload],
+                    "queue_depth": len(self._waiters[workload]),
+                    "max_concurrency": self.limits[workload].max_concurrency,
+                    "max_queue": self.limits[workload].max_queue,
+                    **self._stats[workload].to_dict(),
+                }
+                for workload in self._by_priority
+            },
+        }
+
+
+# Create a single instance of the scheduler to be used across the application
+request_scheduler = RequestScheduler(
+    total_slots=SchedulerConfig.TOTAL_SLOTS,
+    chat_reserved_slots=SchedulerConfig.CHAT_RESERVED_SLOTS,
+    limits={
+        WorkloadClass.CHAT: WorkloadLimits(
+            priority=0,
+            max_concurrency=SchedulerConfig.CHAT_MAX_CONCURRENCY,
+            max_queue=SchedulerConfig.CHAT_MAX_QUEUE,
+            max_wait=SchedulerConfig.CHAT_MAX_WAIT,
+        ),
+        WorkloadClass.AUTOFILL: WorkloadLimits(
+            priority=1,
+            max_concurrency=SchedulerConfig.AUTOFILL_MAX_CONCURRENCY,
+            max_queue=SchedulerConfig.AUTOFILL_MAX_QUEUE,
+            max_wait=SchedulerConfig.AUTOFILL_MAX_WAIT,
+        ),
+        WorkloadClass.INGESTION: WorkloadLimits(
+            priority=2,
+            max_concurrency=SchedulerConfig.INGESTION_MAX_CONCURRENCY,
+            max_queue=SchedulerConfig.INGESTION_MAX_QUEUE,
+            max_wait=SchedulerConfig.INGESTION_MAX_WAIT,
+        ),
+    },
+)
@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..config import APIConfig
+from ..models.document_schemas import get_model_for_type
+from .ingestion_service import ingestion_service
+from .scheduler import WorkloadClass, request_scheduler
+
+# Name of the manifest recording the state of DOCUMENTS_DIR after the last sync
+SYNC_MANIFEST_NAME = "documents_sync_manifest.json"
+
+
+def _file_sha256(file_path: Path, chunk_size: int = 1 << 20) -> str:
+    """Hash a file in fixed-size chunks so large files don't load into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sync_doc_id(relative_path: str) -> str:
+    """Stable ref_doc_id for a file under DOCUMENTS_DIR"""
+    return f"sync:{relative_path}"
+
+
+@dataclass
+class SyncChanges:
+    """Changes in DOCUMENTS_DIR since the last sync, as relative paths."""
+
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.modified or self.deleted)
+
+
+class RateLimiter:
+    """Spaces out ingestion work to at most `max_per_minute` items."""
+
+    def __init__(self, max_per_minute: float):
+        self.min_interval = 60.0 / max_per_minute if max_per_minute > 0 else 0.0
+        self._next_allowed = 0.0
+
+    async def wait(self) -> None:
+        now = time.monotonic()
+        if now < self._next_allowed:
+            await asyncio.sleep(self._next_allowed - now)
+        self._next_allowed = max(now, self._next_allowed) + self.min_interval
+
+
+class DocumentSyncService:
+    """
+    Keeps DOCUMENTS_DIR and the knowledge base in sync by polling.
+
+    Each run compares (mtime, size) of every supported file against the
+    manifest written by the previous run; only files whose stat changed are
+    re-hashed, and only files whose content hash changed are re-ingested.
+    Deleted files have their nodes removed from the index.
+    """
+
+    def __init__(
+        self,
+        doc_processor,
+        documents_dir: str = APIConfig.DOCUMENTS_DIR,
+        poll_interval: float = APIConfig.DOCUMENTS_SYNC_INTERVAL,
+        max_files_per_minute: float = APIConfig.DOCUMENTS_SYNC_MAX_FILES_PER_MINUTE,
+    ):
+        self.doc_processor = doc_processor
+        self.documents_dir = Path(documents_dir)
+        self.poll_interval = poll_interval
+        self.rate_limiter = RateLimiter(max_files_per_minute)
+        self.manifest_path = Path(APIConfig.STORAGE_DIR) / SYNC_MANIFEST_NAME
+        self.manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self.supported_extensions = set(doc_processor.file_extractor) | set(
+            doc_processor.spreadsheet_processor.SUPPORTED_EXTENSIONS
+        )
+
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[str] = None
+        self.last_changes = SyncChanges()
+        self.last_errors: Dict[str, str] = {}
+
+    # ----- manifest -----
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[Sync] Could not read manifest, starting from scratch: {e}")
+            return {}
+
+    def _save_manifest(self) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.manifest_path)
+
+    # ----- change detection -----
+
+    def _is_candidate(self, file_path: Path) -> bool:
+        name = file_path.name
+        # Skip hidden files and Office lock files such as "~$report.docx"
+        if name.startswith(".") or name.startswith("~$"):
+            return False
+        return file_path.suffix.lower() in self.supported_extensions
+
+    def compute_changes(self) -> SyncChanges:
+        """Compare DOCUMENTS_DIR with the manifest and return the pending changes"""
+        changes = SyncChanges()
+        seen = set()
+
+        if self.documents_dir.exists():
+            for file_path in sorted(self.documents_dir.rglob("*")):
+                if not file_path.is_file() or not self._is_candidate(file_path):
+                    continue
+                relative_path = file_path.relative_to(self.documents_dir).as_posix()
+                try:
+                    self._detect_change(file_path, relative_path, changes)
+                except FileNotFoundError:
+                    # Removed since the directory was listed: handled as deleted
+                    continue
+                seen.add(relative_path)
+
+        changes.deleted = [path for path in self.manifest if path not in seen]
+        return changes
+
+    def _detect_change(
+        self, file_path: Path, relative_path: str, changes: SyncChanges
+    ) -> None:
+        stat = file_path.stat()
+        entry = self.manifest.get(relative_path)
+        if entry is None:
+            changes.added.append(relative_path)
+        elif entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            # mtime changed: only re-ingest if the content really differs
+            if _file_sha256(file_path) != entry["sha256"]:
+                changes.modified.append(relative_path)
+            else:
+                entry["mtime_ns"] = stat.st_mtime_ns
+                entry["size"] = stat.st_size
+
+    # ----- ingestion -----
+
+    async def _build_storage_metadata(
+        self, file_path: Path, markdown_content: str
+    ) -> Dict[str, Any]:
+        """Run type identification and metadata extraction as /upload_document does"""
+        doc_type = self.doc_processor.identify_document_type(
+            file_path.name, markdown_content
+        )
+        metadata = await self.doc_processor.extract_metadata_with_pydantic(
+            markdown_content, doc_type
+        )
+
+        validated_dict: Dict[str, Any] = {}
+        if not metadata.get("extraction_error"):
+            try:
+                validated_dict = (
+                    get_model_for_type(doc_type)(**metadata["extracted_fields"])
+                ).model_dump()
+            except Exception as validation_error:
+                # No human confirms synced files: keep the document searchable
+                # and fall back to basic metadata
+                print(
+                    f"[Sync] Metadata validation failed for {file_path.name}: {validation_error}"
+                )
+
+        return {
+            "file_name": file_path.name,
+            "upload_time": datetime.now().isoformat(),
+            "document_type": doc_type,
+            # Schema key; "document_type" may be overridden by the validated fields
+            "document_schema": doc_type,
+            "source": "documents_sync",
+            **validated_dict,
+        }
+
+    async def _ingest_file(self, relative_path: str) -> None:
+        file_path = self.documents_dir / relative_path
+        doc_id = sync_doc_id(relative_path)
+
+        # Docling parsing is CPU bound: keep it off the event loop
+        markdown_content, original_document = await asyncio.to_thread(
+            self.doc_processor.read_and_process_document, file_path
+        )
+        storage_metadata = await self._build_storage_metadata(
+            file_path, markdown_content
+        )
+
+        original_document.id_ = doc_id
+        nodes = await asyncio.to_thread(
+            self.doc_processor.process_document_for_storage,
+            original_document,
+            storage_metadata,
+        )
+
+        if relative_path in self.manifest:
+            await asyncio.to_thread(ingestion_service.delete_document, doc_id)
+        nodes_added = await asyncio.to_thread(ingestion_service.add_nodes, nodes)
+        await asyncio.to_thread(
+            ingestion_service.add_document_summary,
+            doc_id,
+            storage_metadata,
+            markdown_content,
+        )
+
+        stat = file_path.stat()
+        self.manifest[relative_path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": await asyncio.to_thread(_file_sha256, file_path),
+            "doc_id": doc_id,
+            "nodes": nodes_added,
+        }
+        print(f"[Sync] Ingested {relative_path} ({nodes_added} nodes)")
+
+    async def sync_once(self) -> SyncChanges:
+        """Compute changes since the last run and apply them to the index"""
+        changes = await asyncio.to_thread(self.compute_changes)
+        self.last_errors = {}
+
+        if not changes.is_empty():
+            print(
+                f"[Sync] {len(changes.added)} added, {len(changes.modified)} modified, "
+                f"{len(changes.deleted)} deleted"
+            )
+
+        for relative_path in changes.deleted:
+            doc_id = self.manifest[relative_path].get(
+                "doc_id", sync_doc_id(relative_path)
+            )
+            await asyncio.to_thread(ingestion_service.delete_document, doc_id)
+            del self.manifest[relative_path]
+            print(f"[Sync] Removed {relative_path}")
+
+        for relative_path in changes.added + changes.modified:
+            await self.rate_limiter.wait()
+            try:
+                # Background work queues for an ingestion slot instead of being shed
+                async with request_scheduler.slot(WorkloadClass.INGESTION, shed=False):
+                    await self._ingest_file(relative_path)
+            except Exception as e:
+                # Leave the manifest untouched so the file is retried next run
+                print(f"[Sync] Failed to ingest {relative_path}: {e}")
+                self.last_errors[relative_path] = str(e)
+
+        if not changes.is_empty():
+            await asyncio.to_thread(ingestion_service.commit)
+        self._save_manifest()
+
+        self.last_run = datetime.now().isoformat()
+        self.last_changes = changes
+        return changes
+
+    async def run_forever(self) -> None:
+        print(f"[Sync] Watching '{self.documents_dir}' every {self.poll_interval:.0f}s")
+        while True:
+            try:
+                await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Sync] Sync run failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "documents_dir": str(self.documents_dir),
+            "tracked_files": len(self.manifest),
+            "last_run": self.last_run,
+            "last_changes": {
+                "added": len(self.last_changes.added),
+                "modified": len(self.last_changes.modified),
+                "deleted": len(self.last_changes.deleted),
+            },
+            "last_errors": self.last_errors,
+        }
@@ -1,110 +1,404 @@
 import asyncio
 import json
-from typing import AsyncGenerator, List
+import time
+from collections import deque
+from contextlib import aclosing, suppress
+from dataclasses import dataclass
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
 
+import numpy as np
+from fastapi.responses import StreamingResponse
 from llama_index.core.llms import ChatMessage
+
+from ..agents.budget import budget_guard
+from ..agents.context import RequestContext, request_scope
+from ..agents.fast_path import (
+    best_effort_messages,
+    direct_messages,
+    single_shot_messages,
+    single_shot_retrieve,
+    stream_llm_answer,
+)
+from ..agents.router import Route, RouteDecision, query_router
+from ..config import ChatConfig
 from ..services.agent_service import agent_service
 
+# SSE comment line: keeps idle connections open, ignored by EventSource clients
+SSE_HEARTBEAT = ": ping\n\n"
+
+# Recent streams kept for the latency percentiles reported on /metrics
+_SAMPLE_SIZE = 1000
+
 
 def create_sse_message(data: dict) -> str:
     """Create Server-Sent Events message format"""
     return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that closes its body and calls `release` however the
+    response ends: the body finished, the client disconnected (possibly
+    before the body was ever started) or sending failed. A body generator's
+    own finally never runs when the generator was never started, so the
+    response owns the release rather than the body.
+    """
+
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self._release()
+
+
+class TokenCoalescer:
+    """
+    Buffers answer tokens into fewer SSE frames.
+
+    A frame is due once its oldest token has waited `window` seconds or the
+    buffer reaches `max_bytes`; a token-per-frame stream spends most of its
+    bytes and serialization time on the envelope.
+    """
+
+    def __init__(self, window: float = 0.04, max_bytes: int = 1024):
+        self.window = window
+        self.max_bytes = max_bytes
+        self._parts: List[str] = []
+        self._size = 0
+        self._since = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._parts)
+
+    def add(self, token: str, now: Optional[float] = None) -> bool:
+        """Buffers a token; True when the frame should go out now."""
+        if not self._parts:
+            self._since = time.monotonic() if now is None else now
+        self._parts.append(token)
+        self._size += len(token.encode("utf-8"))
+        return self._size >= self.max_bytes or self.window <= 0
+
+    def deadline(self) -> Optional[float]:
+        """When the buffered tokens are due, or None if nothing is buffered"""
+        return self._since + self.window if self._parts else None
+
+    def flush(self) -> str:
+        text = "".join(self._parts)
+        self._parts, self._size = [], 0
+        return text
+
+
+class StreamStats:
+    """
+    Latency of the chat streams: time to the answer step and to the first
+    answer token (both from the request's arrival), and what the SSE
+    framing costs per token.
+    """
+
+    def __init__(self):
+        self._answer_step = deque(maxlen=_SAMPLE_SIZE)
+        self._first_token = deque(maxlen=_SAMPLE_SIZE)
+        self.streams = 0
+        self.tokens = 0
+        self.frames = 0
+        self.bytes = 0
+        self.heartbeats = 0
+        self.framing_seconds = 0.0
+
+    def record(self, context: RequestContext, meter: "StreamMeter") -> None:
+        self.streams += 1
+        if meter.answer_step_at is not None:
+            self._answer_step.append(meter.answer_step_at - context.started_at)
+        if meter.first_token_at is not None:
+            self._first_token.append(meter.first_token_at - context.started_at)
+        self.tokens += meter.tokens
+        self.frames += meter.frames
+        self.bytes += meter.sent_bytes
+        self.framing_seconds += meter.framing_seconds
+
+    def metrics(self) -> Dict[str, float]:
+        def percentiles(values) -> Dict[str, float]:
+            if not values:
+                return {}
+            p50, p95 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95])
+            return {
+                "p50_ms": round(1000 * float(p50), 1),
+                "p95_ms": round(1000 * float(p95), 1),
+            }
+
+        return {
+            "streams": self.streams,
+            "answer_step": percentiles(self._answer_step),
+            "time_to_first_token": percentiles(self._first_token),
+            "tokens": self.tokens,
+            "frames": self.frames,
+            "tokens_per_frame": (
+                round(self.tokens / self.frames, 2) if self.frames else 0.0
+            ),
+            "bytes_per_token": (
+                round(self.bytes / self.tokens, 1) if self.tokens else 0.0
+            ),
+            "framing_us_per_token": (
+                round(1e6 * self.framing_seconds / self.tokens, 2)
+                if self.tokens
+                else 0.0
+            ),
+            "heartbeats": self.heartbeats,
+        }
+
+
+# Create a single instance of the stats to be used across the application
+stream_stats = StreamStats()
+
+
+@dataclass
+class StreamMeter:
+    """Timings and framing cost of one answer stream"""
+
+    answer_step_at: Optional[float] = None
+    first_token_at: Optional[float] = None
+    tokens: int = 0
+    frames: int = 0
+    sent_bytes: int = 0
+    framing_seconds: float = 0.0
+
+    def token_frame(self, text: str) -> str:
+        started = time.perf_counter()
+        message = create_sse_message({"type": "token", "data": text})
+        self.framing_seconds += time.perf_counter() - started
+        self.frames += 1
+        self.sent_bytes += len(message.encode("utf-8"))
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        return message
+
+
+async def stream_answer_tokens(
+    tokens: AsyncIterator[str], meter: StreamMeter, answer_parts: List[str]
+) -> AsyncGenerator[str, None]:
+    """
+    SSE frames of an answer token stream: the first token goes out at once,
+    the rest coalesced; heartbeats while the model is silent. The tokens
+    are also collected into answer_parts.
+    """
+    heartbeat = ChatConfig.STREAM_HEARTBEAT_SECONDS
+    coalescer = TokenCoalescer(
+        window=ChatConfig.STREAM_COALESCE_MS / 1000,
+        max_bytes=ChatConfig.STREAM_MAX_FRAME_BYTES,
+    )
+    meter.answer_step_at = meter.answer_step_at or time.monotonic()
+    token_task = asyncio.ensure_future(tokens.__anext__())
+    try:
+        while True:
+            deadline = coalescer.deadline()
+            timeout = (
+                heartbeat if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            done, _ = await asyncio.wait({token_task}, timeout=timeout)
+            if done:
+                try:
+                    token = token_task.result()
+                except StopAsyncIteration:
+                    break
+                token_task = asyncio.ensure_future(tokens.__anext__())
+                if not token:
+                    continue
+                answer_parts.append(token)
+                meter.tokens += 1
+                if not coalescer.add(token) and meter.first_token_at is not None:
+                    continue
+            if coalescer.pending:
+                yield meter.token_frame(coalescer.flush())
+            elif not done:
+                stream_stats.heartbeats += 1
+                yield SSE_HEARTBEAT
+        if coalescer.pending:
+            yield meter.token_frame(coalescer.flush())
+    finally:
+        if not token_task.done():
+            token_task.cancel()
+
+
 async def stream_generator_with_steps(
     query: str,
     chat_history: List[ChatMessage],
     agent,
     callback_handler,
+    context: Optional[RequestContext] = None,
+    on_complete: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
 ) -> AsyncGenerator[str, None]:
     """
     Orchestrates the iterative Agentic RAG workflow.
-    - Creates a dedicated agent for the query.
+    - Runs the pooled agent taken for the query and gives it back at the end.
     - Streams tool calls and their structured results to the frontend.
-    - Streams the final synthesized answer token-by-token.
+    - Streams the final answer as soon as the agent starts its answer step,
+      the first token at once and the rest in coalesced frames.
+    - Sends heartbeats while nothing else is sent.
     - Cleans up state after completion.
+    - Hands the events of a successful run to on_complete (answer cache).
     """
     if not agent:
         yield create_sse_message({"type": "error", "data": "Agent not initialized"})
         return
 
-    # Clear any pending queue items from previous runs
-    while not callback_handler.step_queue.empty():
-        await callback_handler.step_queue.get()
+    if context is None:
+        context = RequestContext(user_query=query)
+    # This stream only receives the events of its own agent
+    channel = callback_handler.event_bus.open(context.request_id)
+    heartbeat = ChatConfig.STREAM_HEARTBEAT_SECONDS
+    response_task = None
+    final_response = None
+    meter = StreamMeter()
+    # Everything sent to the client, for replaying the run from the cache
+    trace: List[dict] = []
+    answer_parts: List[str] = []
 
-    try:
-        response_task = asyncio.create_task(
-            agent.astream_chat(query, chat_history=chat_history)
-        )
-        queue_task = asyncio.create_task(callback_handler.step_queue.get())
-        pending_tasks = {response_task, queue_task}
+    announced_budget = False
 
-        while pending_tasks:
-            done, pending_tasks = await asyncio.wait(
-                pending_tasks, return_when=asyncio.FIRST_COMPLETED
-            )
+    def emit(data: dict) -> str:
+        trace.append(data)
+        return create_sse_message(data)
 
-            if queue_task in done:
-                queue_item = queue_task.result()
-
-                # Forward the raw tool step event (start/end) to the frontend
-                yield create_sse_message(queue_item)
-
-                # If the researcher tool finished, parse and send its structured result
-                if (
-                    queue_item.get("type") == "tool_call_end"
-                    and queue_item.get("data", {}).get("tool_name") == "researcher"
-                ):
-                    try:
-                        tool_output_str = queue_item.get("data", {}).get("result", "{}")
-                        research_result = json.loads(tool_output_str)
-
-                        # Send document previews immediately
-                        if research_result.get("retrieved_docs_preview"):
-                            yield create_sse_message(
-                                {
-                                    "type": "retrieved_documents",
-                                    "data": research_result["retrieved_docs_preview"],
-                                }
-                            )
-
-                        # Send the research state summary
-                        yield create_sse_message(
+    def budget_messages() -> List[str]:
+        # Tells the client once that the answer comes from unfinished research
+        nonlocal announced_budget
+        if announced_budget or not context.budget_exhausted:
+            return []
+        announced_budget = True
+        return [emit({"type": "budget_exhausted", "data": budget_guard.usage(context)})]
+
+    def step_messages(queue_item: dict) -> List[str]:
+        # Forward the raw tool step event (start/end) to the frontend
+        messages = [emit(queue_item)]
+
+        # If the researcher tool finished, parse and send its structured result
+        if (
+            queue_item.get("type") == "tool_call_end"
+            and queue_item.get("data", {}).get("tool_name") == "researcher"
+        ):
+            try:
+                tool_output_str = queue_item.get("data", {}).get("result", "{}")
+                research_result = json.loads(tool_output_str)
+
+                # Send document previews immediately
+                if research_result.get("retrieved_docs_preview"):
+                    messages.append(
+                        emit(
                             {
-                                "type": "research_step",
-                                "data": {
-                                    "summary": research_result.get(
-                                        "summary_of_findings", ""
-                                    ),
-                                    "is_sufficient": research_result.get(
-                                        "is_sufficient", False
-                                    ),
-                                    "suggested_queries": research_result.get(
-                                        "suggested_next_queries", []
-                                    ),
-                                },
+                                "type": "retrieved_documents",
+                                "data": research_result["retrieved_docs_preview"],
                             }
                         )
-                    except json.JSONDecodeError:
-                        print(
-                            f"Warning: Could not parse JSON from researcher tool: {tool_output_str}"
-                        )
+                    )
 
-                if not response_task.done():
-                    queue_task = asyncio.create_task(callback_handler.step_queue.get())
-                    pending_tasks.add(queue_task)
+                # Send the research state summary
+                messages.append(
+                    emit(
+                        {
+                            "type": "research_step",
+                            "data": {
+                                "summary": research_result.get(
+                                    "summary_of_findings", ""
+                                ),
+                                "is_sufficient": research_result.get(
+                                    "is_sufficient", False
+                                ),
+                                "suggested_queries": research_result.get(
+                                    "suggested_next_queries", []
+                                ),
+                            },
+                        }
+                    )
+                )
+            except json.JSONDecodeError:
+                print(
+                    f"Warning: Could not parse JSON from researcher tool: {tool_output_str}"
+                )
+        return messages
 
-            if response_task in done:
-                break
+    try:
+        # The agent task inherits the request context, which routes its events
+        with request_scope(context):
+            response_task = asyncio.create_task(
+                agent.astream_chat(query, chat_history=chat_history)
+            )
+        queue_task = asyncio.create_task(channel.get())
 
-        if not queue_task.done():
-            queue_task.cancel()
+        # Research phase: astream_chat returns as soon as the agent starts
+        # its answer step, with the answer still streaming. An agent still
+        # reasoning past the deadline's grace period is stopped
+        hard_deadline = budget_guard.hard_deadline(context)
+        while not response_task.done():
+            timeout = heartbeat
+            if hard_deadline is not None:
+                timeout = max(0.0, min(timeout, hard_deadline - time.monotonic()))
+            done, _ = await asyncio.wait(
+                {response_task, queue_task},
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if queue_task in done:
+                for message in step_messages(queue_task.result()) + budget_messages():
+                    yield message
+                queue_task = asyncio.create_task(channel.get())
+            elif not done:
+                if hard_deadline is not None and time.monotonic() >= hard_deadline:
+                    break
+                stream_stats.heartbeats += 1
+                yield SSE_HEARTBEAT
 
-        final_response = response_task.result()
+        # Step events published right before the answer step still go out first
+        pending_events = [queue_task.result()] if queue_task.done() else []
+        queue_task.cancel()
+        for queue_item in pending_events + channel.drain():
+            for message in step_messages(queue_item):
+                yield message
 
-        # Stream the final synthesized answer token by token
-        async for token in final_response.async_response_gen():
-            yield create_sse_message({"type": "token", "data": token})
+        if response_task.done():
+            final_response = response_task.result()
+            tokens = final_response.async_response_gen()
+        else:
+            # The agent must be stopped before the stream answers in its place
+            response_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await response_task
+            budget_guard.hard_stop(context)
+            tokens = stream_llm_answer(
+                best_effort_messages(
+                    query,
+                    chat_history,
+                    budget_guard.findings_so_far(context),
+                    context.budget_exhausted,
+                )
+            )
+        for message in budget_messages():
+            yield message
+
+        async with aclosing(
+            stream_answer_tokens(tokens, meter, answer_parts)
+        ) as frames:
+            async for message in frames:
+                yield message
+
+        answer = "".join(answer_parts)
+        if on_complete is not None and answer.strip():
+            await on_complete(trace + [{"type": "token", "data": answer}])
 
     except Exception as e:
         import traceback
@@ -115,7 +409,134 @@ async def stream_generator_with_steps(
             {"type": "error", "data": f"Error processing request: {e}"}
         )
     finally:
-        # Crucial: clean up the state cache for this request
-        agent_service.cleanup_after_request()
+        # Crucial: clean up the state of this request. A client that went
+        # away leaves no agent running for nobody
+        # An unfinished answer stream would otherwise write its turn into
+        # the agent's memory after the agent went back to the pool (and
+        # into the next request's chat): stop both and wait until they have
+        writer = getattr(final_response, "awrite_response_to_history_task", None)
+        pending = [t for t in (response_task, writer) if t is not None and not t.done()]
+        for task in pending:
+            task.cancel()
+        try:
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            if any(not task.done() for task in pending):
+                # Interrupted while waiting: the agent is dropped, not pooled
+                agent = None
+            callback_handler.event_bus.close(context.request_id)
+            agent_service.cleanup_after_request(context, agent)
+            stream_stats.record(context, meter)
         print("✅ Streaming completed and state cleaned up.")
-        yield create_sse_message({"type": "done", "data": "Stream finished."})
+    # Not in the finally: a stream closed early (client gone) must not yield
+    yield create_sse_message({"type": "done", "data": "Stream finished."})
+
+
+async def stream_fast_path(
+    query: str,
+    chat_history: List[ChatMessage],
+    decision: RouteDecision,
+    callback_handler,
+    context: RequestContext,
+    on_complete: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Answers a query the router sent around the research loop: small talk
+    straight from the LLM, a simple lookup from one retrieval and one answer
+    call. A lookup whose retrieval is too weak is handed over to the agent
+    before anything of the answer was sent.
+    """
+    meter = StreamMeter()
+    trace: List[dict] = []
+    answer_parts: List[str] = []
+    handed_over = False
+
+    def emit(data: dict) -> str:
+        trace.append(data)
+        return create_sse_message(data)
+
+    try:
+        yield emit({"type": "route", "data": decision.to_dict()})
+        if decision.route == Route.SINGLE_SHOT:
+            if context.index is None:
+                raise RuntimeError("Knowledge base not loaded.")
+            # In the request's scope: an escalated agent's first step reuses these results
+            with request_scope(context):
+                retrieved, confidence = await single_shot_retrieve(query, context.index)
+            if retrieved is None:
+                escalation = query_router.escalate(context, "weak retrieval")
+                yield emit({"type": "route", "data": escalation.to_dict()})
+                agent = agent_service.get_agent_for_query(query, context)
+                if not agent:
+                    raise RuntimeError("Agent could not be created.")
+                handed_over = True
+
+                async def complete_escalated(events: List[dict]) -> None:
+                    # The cached run replays the routing events too
+                    await on_complete(trace + events)
+
+                async with aclosing(
+                    stream_generator_with_steps(
+                        query,
+                        chat_history,
+                        agent,
+                        callback_handler,
+                        context,
+                        complete_escalated if on_complete is not None else None,
+                    )
+                ) as messages:
+                    async for message in messages:
+                        yield message
+                return
+            yield emit(
+                {
+                    "type": "retrieved_documents",
+                    "data": retrieved.retrieved_docs_preview,
+                }
+            )
+            if confidence is not None:
+                # The retrieval passed the confidence check: an answer from it
+                # counts as grounded (answer cache)
+                yield emit(
+                    {"type": "confidence", "data": {"top_score": round(confidence, 4)}}
+                )
+            messages = single_shot_messages(query, chat_history, retrieved)
+        else:
+            messages = direct_messages(query, chat_history)
+
+        async with aclosing(
+            stream_answer_tokens(stream_llm_answer(messages), meter, answer_parts)
+        ) as frames:
+            async for message in frames:
+                yield message
+
+        answer = "".join(answer_parts)
+        if on_complete is not None and answer.strip():
+            await on_complete(trace + [{"type": "token", "data": answer}])
+
+    except Exception as e:
+        import traceback
+
+        error_details = traceback.format_exc()
+        print(f"❌ Streaming error: {e}\n{error_details}")
+        yield create_sse_message(
+            {"type": "error", "data": f"Error processing request: {e}"}
+        )
+    finally:
+        # After a hand-over the agent's stream has cleaned up and finished
+        if not handed_over:
+            agent_service.cleanup_after_request(context)
+            stream_stats.record(context, meter)
+            print(f"✅ {decision.route.value} answer streamed and state cleaned up.")
+    yield create_sse_message({"type": "done", "data": "Stream finished."})
+
+
+async def replay_cached_answer(
+    events: List[dict], cache_info: dict
+) -> AsyncGenerator[str, None]:
+    """Replays a cached run over the same SSE protocol, without the agent."""
+    yield create_sse_message({"type": "cache_hit", "data": cache_info})
+    for event in events:
+        yield create_sse_message(event)
+    yield create_sse_message({"type": "done", "data": "Stream finished."})
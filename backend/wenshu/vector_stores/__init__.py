@@ -0,0 +1,15 @@
+"""
+Vector store backends
+"""
+
+from .ivf import IVFVectorStore
+from .matrix import EmbeddingMatrix
+from .mmap_store import MmapVectorStore
+from .quantized_store import QuantizedVectorStore
+
+__all__ = [
+    "EmbeddingMatrix",
+    "IVFVectorStore",
+    "MmapVectorStore",
+    "QuantizedVectorStore",
+]
@@ -0,0 +1,302 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from .matrix import EmbeddingMatrix, normalize_rows, top_k_indices
+
+# Sub-directory of the storage dir holding the IVF index files
+IVF_DIR_NAME = "ivf_vector_store"
+
+# Rows scored per matrix multiplication when assigning vectors to centroids
+_ASSIGN_CHUNK = 65536
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) for every row, in bounded-memory chunks"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = vectors[start : start + _ASSIGN_CHUNK]
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0
+) -> np.ndarray:
+    """Train unit-norm centroids with Lloyd iterations on normalized vectors"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        sorted_assignments = assignments[order]
+        clusters, starts = np.unique(sorted_assignments, return_index=True)
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+
+        new_centroids = centroids.copy()
+        new_centroids[clusters] = sums
+        # Re-seed empty clusters from random points
+        empty = np.setdiff1d(np.arange(n_clusters), clusters)
+        if len(empty):
+            new_centroids[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = normalize_rows(new_centroids)
+
+    return centroids
+
+
+class IVFVectorStore(BasePydanticVectorStore):
+    """
+    Inverted-file (IVF) approximate nearest-neighbour vector store.
+
+    Vectors are clustered with spherical k-means; a query only scores the
+    vectors in the `nprobe` lists whose centroids are closest to it, so the
+    cost grows with the list size instead of the corpus size.
+
+    - Vectors live in a memory-mapped EmbeddingMatrix (float32 or float16).
+    - Until `train_threshold` vectors exist the store does exact search.
+    - Inserts are assigned to their nearest centroid incrementally; the
+      centroids are retrained once the corpus grows `retrain_growth` times.
+    - Deletes are tombstones, compacted on persist once they exceed a quarter of rows.
+    - Queries restricted to `node_ids` / `doc_ids` score only that subset exactly.
+    """
+
+    stores_text: bool = False
+
+    persist_dir: str
+    dtype: str = "float32"
+    nlist: int = 0  # 0 = derive from corpus size (~4 * sqrt(n))
+    nprobe: int = 8
+    train_threshold: int = 4096
+    retrain_growth: float = 4.0
+
+    _matrix: EmbeddingMatrix = PrivateAttr()
+    _centroids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _assignments: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(0, dtype=np.int32)
+    )
+    _lists: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _trained_size: int = PrivateAttr(default=0)
+
+    def __init__(self, **data: Any) -> None:
+        super().__init__(**data)
+        self._matrix = EmbeddingMatrix(self._index_dir(), self.dtype)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "IVFVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "IVFVectorStore":
+        """Load the IVF files from the storage dir, or create an empty store"""
+        store = cls(persist_dir=persist_dir, **kwargs)
+        store._load()
+        return store
+
+    # ----- bookkeeping -----
+
+    @property
+    def size(self) -> int:
+        return self._matrix.size
+
+    def _target_nlist(self, n: int) -> int:
+        if self.nlist:
+            return min(self.nlist, n)
+        return max(1, min(n, int(4 * np.sqrt(n))))
+
+    def _rebuild_lists(self) -> None:
+        if self._centroids is None:
+            self._lists = []
+            return
+        order = np.argsort(self._assignments, kind="stable")
+        bounds = np.searchsorted(
+            self._assignments[order], np.arange(len(self._centroids) + 1)
+        )
+        self._lists = [
+            order[bounds[i] : bounds[i + 1]].astype(np.int64)
+            for i in range(len(self._centroids))
+        ]
+
+    def _assign_rows(self, rows: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), _ASSIGN_CHUNK):
+            chunk = self._matrix.gather(rows[start : start + _ASSIGN_CHUNK])
+            assignments[start : start + len(chunk)] = assign_to_centroids(
+                chunk.astype(np.float32, copy=False), self._centroids
+            )
+        return assignments
+
+    def _train(self) -> None:
+        alive_rows = self._matrix.alive_rows()
+        nlist = self._target_nlist(len(alive_rows))
+        # k-means on a sample keeps training time bounded for large corpora
+        sample_size = min(len(alive_rows), max(nlist * 64, 16384))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(alive_rows, sample_size, replace=False))
+        sample = self._matrix.gather(sample_rows).astype(np.float32, copy=False)
+        print(f"[IVF] Training {nlist} lists on {sample_size} vectors...")
+        self._centroids = spherical_kmeans(sample, nlist)
+        self._assignments = self._assign_rows(np.arange(self._matrix.rows))
+        self._trained_size = len(alive_rows)
+        self._rebuild_lists()
+
+    def _maybe_retrain(self) -> None:
+        size = self.size
+        if self._centroids is None:
+            if size >= self.train_threshold:
+                self._train()
+        elif size >= self._trained_size * self.retrain_growth:
+            self._train()
+
+    def _append(self, node_ids: List[str], ref_doc_ids: List[str], vectors) -> None:
+        start = self._matrix.append(node_ids, ref_doc_ids, normalize_rows(vectors))
+        if self._centroids is not None:
+            new_assignments = self._assign_rows(np.arange(start, self._matrix.rows))
+            self._assignments = np.concatenate([self._assignments, new_assignments])
+            for list_id in np.unique(new_assignments):
+                rows = start + np.flatnonzero(new_assignments == list_id)
+                self._lists[list_id] = np.concatenate([self._lists[list_id], rows])
+        self._maybe_retrain()
+
+    # ----- BasePydanticVectorStore API -----
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        self._append(
+            [node.node_id for node in nodes],
+            [node.ref_doc_id or "None" for node in nodes],
+            [node.get_embedding() for node in nodes],
+        )
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        # VectorStoreIndex also calls delete() with node ids when cleaning up
+        self._matrix.delete(ref_doc_id)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        for node_id in node_ids or []:
+            self._matrix.delete(node_id)
+
+    def clear(self) -> None:
+        self._matrix.clear()
+        self._centroids = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+        self._rebuild_lists()
+        for name in ("centroids.npy", "assignments.npy", "ivf.json"):
+            if (self._index_dir() / name).exists():
+                os.remove(self._index_dir() / name)
+
+    def get_embeddings(self, node_ids: List[str]) -> np.ndarray:
+        """Normalized stored embeddings for the given node ids (unknown ids are zeros)"""
+        return self._matrix.get(node_ids)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError(
+                "IVFVectorStore does not support metadata filters; "
+                "restrict the query with node_ids instead."
+            )
+        matrix = self._matrix
+        if not matrix.size:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = normalize_rows(np.asarray(query.query_embedding))
+        if query.node_ids is not None or query.doc_ids is not None:
+            rows = matrix.rows_for(query.node_ids, query.doc_ids)
+        elif self._centroids is None:
+            rows = matrix.alive_rows()
+        else:
+            # Probe the lists whose centroids are closest to the query
+            centroid_scores = self._centroids @ query_vector
+            probe = top_k_indices(
+                centroid_scores, min(self.nprobe, len(self._centroids))
+            )
+            rows = np.sort(np.concatenate([self._lists[i] for i in probe]))
+            rows = rows[matrix.alive[rows]]
+
+        if len(rows) == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        scores = matrix.score(query_vector, rows)
+        best = top_k_indices(scores, query.similarity_top_k)
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in best],
+            ids=[matrix.node_ids[rows[i]] for i in best],
+        )
+
+    # ----- persistence -----
+
+    def _index_dir(self) -> Path:
+        return Path(self.persist_dir) / IVF_DIR_NAME
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Persist to <persist_dir>/ivf_vector_store; persist_path is ignored"""
+        keep = self._matrix.flush()
+        if keep is not None and self._centroids is not None:
+            self._assignments = self._assignments[keep]
+            self._rebuild_lists()
+        if not self._matrix.exists():
+            return
+
+        index_dir = self._index_dir()
+        if self._centroids is not None:
+            np.save(index_dir / "centroids.npy", self._centroids)
+            np.save(index_dir / "assignments.npy", self._assignments)
+        else:
+            for name in ("centroids.npy", "assignments.npy"):
+                if (index_dir / name).exists():
+                    os.remove(index_dir / name)
+        with open(index_dir / "ivf.json", "w", encoding="utf-8") as f:
+            json.dump({"trained_size": self._trained_size}, f)
+
+    def _load(self) -> None:
+        index_dir = self._index_dir()
+        self._matrix.load()
+        if not self._matrix.exists():
+            return
+
+        if (index_dir / "ivf.json").exists():
+            with open(index_dir / "ivf.json", "r", encoding="utf-8") as f:
+                self._trained_size = json.load(f).get("trained_size", 0)
+        if (index_dir / "centroids.npy").exists():
+            self._centroids = np.load(index_dir / "centroids.npy")
+            self._assignments = np.load(index_dir / "assignments.npy")
+            if len(self._assignments) != self._matrix.rows:
+                # Files from an interrupted persist; reassign from the vectors
+                self._assignments = self._assign_rows(np.arange(self._matrix.rows))
+        self._rebuild_lists()
+        print(f"[IVF] Loaded {self._matrix.size} vectors from {index_dir}")
+
+    def import_embeddings(
+        self, embedding_dict: Dict[str, List[float]], ref_doc_ids: Dict[str, str]
+    ) -> None:
+        """Bulk-load vectors, e.g. from an existing SimpleVectorStore"""
+        if not embedding_dict:
+            return
+        node_ids = list(embedding_dict)
+        self._append(
+            node_ids,
+            [ref_doc_ids.get(node_id, "None") for node_id in node_ids],
+            [embedding_dict[node_id] for node_id in node_ids],
+        )
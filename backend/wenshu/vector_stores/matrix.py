@@ -0,0 +1,362 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Rows converted to float32 per matrix-vector product when scoring float16 data
+_SCORE_CHUNK = 65536
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize rows so that inner product equals cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, in O(n + k log k)"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class EmbeddingMatrix:
+    """
+    Append-only, memory-mapped matrix of normalized embeddings plus an id map.
+
+    Files in `directory`:
+    - embeddings.bin: contiguous rows of `dtype` (float32 or float16)
+    - ids.tsv:        one "node_id<TAB>ref_doc_id" line per row
+    - meta.json:      dim and dtype
+    - deleted.npy:    tombstoned row numbers (until the next compaction)
+
+    The matrix is opened read-only with np.memmap, so loading costs a few
+    milliseconds regardless of size and every worker process maps the same
+    pages from the OS page cache instead of holding its own copy.
+
+    Appended rows stay in memory until flush(), which is called when the
+    index is persisted, so the files never get ahead of the docstore.
+    """
+
+    def __init__(self, directory: Path, dtype: str = "float32"):
+        self.directory = Path(directory)
+        self.dtype = np.dtype(dtype)
+        self.dim = 0
+        self.node_ids: List[str] = []
+        self.ref_doc_ids: List[str] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.row_of: Dict[str, int] = {}
+        self.rows_of_doc: Dict[str, List[int]] = {}
+        self._mapped: Optional[np.ndarray] = None
+        self._file_rows = 0
+        self._pending_ids: List[str] = []
+        self._pending_ref_doc_ids: List[str] = []
+        self._pending_chunks: List[np.ndarray] = []
+        self._pending: Optional[np.ndarray] = None
+
+    # ----- files -----
+
+    @property
+    def _bin_path(self) -> Path:
+        return self.directory / "embeddings.bin"
+
+    @property
+    def _ids_path(self) -> Path:
+        return self.directory / "ids.tsv"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    @property
+    def _deleted_path(self) -> Path:
+        return self.directory / "deleted.npy"
+
+    def exists(self) -> bool:
+        return self._meta_path.exists()
+
+    def _map(self) -> None:
+        if self._file_rows == 0 or self.dim == 0:
+            self._mapped = np.zeros((0, self.dim), dtype=self.dtype)
+        else:
+            self._mapped = np.memmap(
+                self._bin_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(self._file_rows, self.dim),
+            )
+
+    def load(self) -> "EmbeddingMatrix":
+        if not self.exists():
+            return self
+
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+
+        with open(self._ids_path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        # A torn write can leave more ids than complete vector rows, or vice versa
+        file_rows = os.path.getsize(self._bin_path) // (self.dim * self.dtype.itemsize)
+        lines = [line for line in lines if line][:file_rows]
+        self.node_ids = [line.split("\t", 1)[0] for line in lines]
+        self.ref_doc_ids = [line.split("\t", 1)[1] for line in lines]
+        self._file_rows = len(lines)
+
+        self.alive = np.ones(len(self.node_ids), dtype=bool)
+        if self._deleted_path.exists():
+            deleted = np.load(self._deleted_path)
+            self.alive[deleted[deleted < len(self.alive)]] = False
+
+        self._reindex()
+        self._map()
+        return self
+
+    def _reindex(self) -> None:
+        self.row_of = {}
+        self.rows_of_doc = {}
+        for row, (node_id, ref_doc_id) in enumerate(
+            zip(self.node_ids, self.ref_doc_ids)
+        ):
+            if self.alive[row]:
+                self.row_of[node_id] = row
+                self.rows_of_doc.setdefault(ref_doc_id, []).append(row)
+
+    # ----- reads -----
+
+    @property
+    def pending(self) -> np.ndarray:
+        """Rows appended since the last flush"""
+        if self._pending is None:
+            self._pending = (
+                np.concatenate(self._pending_chunks)
+                if self._pending_chunks
+                else np.zeros((0, self.dim), dtype=self.dtype)
+            )
+            self._pending_chunks = [self._pending] if len(self._pending) else []
+        return self._pending
+
+    def gather(self, rows: np.ndarray) -> np.ndarray:
+        """Vectors of the given row numbers, in the stored dtype"""
+        if self._mapped is None:
+            self._map()
+        if not self._pending_chunks:
+            return self._mapped[rows]
+        in_file = rows < self._file_rows
+        result = np.empty((len(rows), self.dim), dtype=self.dtype)
+        result[in_file] = self._mapped[rows[in_file]]
+        result[~in_file] = self.pending[rows[~in_file] - self._file_rows]
+        return result
+
+    @property
+    def rows(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def size(self) -> int:
+        return int(self.alive.sum())
+
+    def alive_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def rows_for(
+        self,
+        node_ids: Optional[Iterable[str]] = None,
+        doc_ids: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        """
+        Sorted live rows matching both restrictions: among the given node ids,
+        those of the given ref doc ids (None leaves a restriction out).
+        VectorStoreIndex.as_retriever() always passes every node id of the
+        index, so doc_ids must narrow node_ids rather than add to them.
+        """
+        if doc_ids is not None:
+            rows = {
+                row for doc_id in doc_ids for row in self.rows_of_doc.get(doc_id, [])
+            }
+            if node_ids is not None:
+                wanted = set(node_ids)
+                rows = {row for row in rows if self.node_ids[row] in wanted}
+        else:
+            rows = {self.row_of[n] for n in node_ids or [] if n in self.row_of}
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def get(self, node_ids: List[str]) -> np.ndarray:
+        """float32 embeddings for the given node ids (unknown ids are zero rows)"""
+        result = np.zeros((len(node_ids), self.dim), dtype=np.float32)
+        known = [i for i, node_id in enumerate(node_ids) if node_id in self.row_of]
+        if known:
+            rows = np.array([self.row_of[node_ids[i]] for i in known], dtype=np.int64)
+            result[known] = self.gather(rows)
+        return result
+
+    def score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Inner products of the (normalized, float32) query with the given rows,
+        or with every row when rows is None. float16 data is upcast chunk by
+        chunk so scoring never materializes a float32 copy of the matrix.
+        """
+        if rows is not None:
+            scores = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), _SCORE_CHUNK):
+                chunk = self.gather(rows[start : start + _SCORE_CHUNK])
+                scores[start : start + len(chunk)] = (
+                    chunk.astype(np.float32, copy=False) @ query
+                )
+            return scores
+
+        if self._mapped is None:
+            self._map()
+        scores = np.empty(self.rows, dtype=np.float32)
+        if self.dtype == np.float32:
+            scores[: self._file_rows] = self._mapped @ query
+        else:
+            for start in range(0, self._file_rows, _SCORE_CHUNK):
+                chunk = self._mapped[start : start + _SCORE_CHUNK]
+                scores[start : start + len(chunk)] = chunk.astype(np.float32) @ query
+        if self._pending_chunks:
+            scores[self._file_rows :] = self.pending.astype(np.float32) @ query
+        return scores
+
+    # ----- writes -----
+
+    def append(
+        self, node_ids: List[str], ref_doc_ids: List[str], vectors: np.ndarray
+    ) -> int:
+        """Append normalized rows (kept in memory until flush); returns the first new row"""
+        if not node_ids:
+            return self.rows
+        for value in node_ids + ref_doc_ids:
+            if "\t" in value or "\n" in value:
+                raise ValueError(f"Ids must not contain tabs or newlines: {value!r}")
+        if self.dim == 0:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match matrix dim {self.dim}"
+            )
+
+        # Re-inserting a node id replaces its previous row
+        for node_id in node_ids:
+            if node_id in self.row_of:
+                self._tombstone(self.row_of[node_id])
+
+        start = self.rows
+        self._pending_chunks.append(np.ascontiguousarray(vectors, dtype=self.dtype))
+        self._pending = None
+        self._pending_ids.extend(node_ids)
+        self._pending_ref_doc_ids.extend(ref_doc_ids)
+
+        self.node_ids.extend(node_ids)
+        self.ref_doc_ids.extend(ref_doc_ids)
+        self.alive = np.concatenate([self.alive, np.ones(len(node_ids), dtype=bool)])
+        for offset, (node_id, ref_doc_id) in enumerate(zip(node_ids, ref_doc_ids)):
+            self.row_of[node_id] = start + offset
+            self.rows_of_doc.setdefault(ref_doc_id, []).append(start + offset)
+        return start
+
+    def _tombstone(self, row: int) -> None:
+        self.alive[row] = False
+        node_id, ref_doc_id = self.node_ids[row], self.ref_doc_ids[row]
+        if self.row_of.get(node_id) == row:
+            del self.row_of[node_id]
+        doc_rows = self.rows_of_doc.get(ref_doc_id)
+        if doc_rows and row in doc_rows:
+            doc_rows.remove(row)
+            if not doc_rows:
+                del self.rows_of_doc[ref_doc_id]
+
+    def delete(self, key: str) -> List[int]:
+        """Tombstone every row of a ref doc id, or the row of a node id"""
+        rows = list(self.rows_of_doc.get(key, []))
+        if key in self.row_of:
+            rows.append(self.row_of[key])
+        for row in rows:
+            self._tombstone(row)
+        return rows
+
+    def flush(self, compact_ratio: float = 0.25) -> Optional[np.ndarray]:
+        """
+        Append pending rows to the files and persist tombstones, compacting
+        once dead rows exceed compact_ratio. Returns the kept old row numbers
+        if it compacted.
+        """
+        if self._pending_chunks:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if not self.exists():
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+            with open(self._bin_path, "ab") as f:
+                f.write(self.pending.tobytes())
+            with open(self._ids_path, "a", encoding="utf-8") as f:
+                f.writelines(
+                    f"{node_id}\t{ref_doc_id}\n"
+                    for node_id, ref_doc_id in zip(
+                        self._pending_ids, self._pending_ref_doc_ids
+                    )
+                )
+            self._file_rows = self.rows
+            self._pending_chunks, self._pending = [], None
+            self._pending_ids, self._pending_ref_doc_ids = [], []
+            self._map()
+
+        if not self.exists():
+            return None
+
+        dead = self.rows - self.size
+        if dead and dead > self.rows * compact_ratio:
+            return self.compact()
+
+        if dead:
+            np.save(self._deleted_path, np.flatnonzero(~self.alive))
+        elif self._deleted_path.exists():
+            os.remove(self._deleted_path)
+        return None
+
+    def compact(self) -> np.ndarray:
+        """Rewrite the files without dead rows; returns the kept old row numbers"""
+        self.flush(compact_ratio=1.0)
+        keep = self.alive_rows()
+
+        # Write new files next to the old ones and swap them in; readers that
+        # still map the old file keep a valid mapping of the old inode
+        tmp_bin = self._bin_path.with_suffix(".bin.tmp")
+        with open(tmp_bin, "wb") as f:
+            for start in range(0, len(keep), _SCORE_CHUNK):
+                f.write(self.gather(keep[start : start + _SCORE_CHUNK]).tobytes())
+        tmp_ids = self._ids_path.with_suffix(".tsv.tmp")
+        with open(tmp_ids, "w", encoding="utf-8") as f:
+            f.writelines(
+                f"{self.node_ids[row]}\t{self.ref_doc_ids[row]}\n" for row in keep
+            )
+
+        self._mapped = None
+        os.replace(tmp_bin, self._bin_path)
+        os.replace(tmp_ids, self._ids_path)
+        if self._deleted_path.exists():
+            os.remove(self._deleted_path)
+
+        self.node_ids = [self.node_ids[row] for row in keep]
+        self.ref_doc_ids = [self.ref_doc_ids[row] for row in keep]
+        self._file_rows = len(keep)
+        self.alive = np.ones(len(keep), dtype=bool)
+        self._reindex()
+        self._map()
+        return keep
+
+    def clear(self) -> None:
+        for path in (
+            self._bin_path,
+            self._ids_path,
+            self._meta_path,
+            self._deleted_path,
+        ):
+            if path.exists():
+                os.remove(path)
+        self.__init__(self.directory, self.dtype.name)
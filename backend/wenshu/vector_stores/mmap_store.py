@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from .matrix import EmbeddingMatrix, normalize_rows, top_k_indices
+
+# Sub-directory of the storage dir holding the memory-mapped matrix
+MMAP_DIR_NAME = "mmap_vector_store"
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Exact-search vector store over a memory-mapped float32/float16 matrix.
+
+    Replaces the nested-float-list vector_store.json: embeddings live in one
+    contiguous binary file scored with a single NumPy matrix-vector product,
+    and node / ref doc ids in a compact side file.
+    """
+
+    stores_text: bool = False
+
+    persist_dir: str
+    dtype: str = "float32"
+
+    _matrix: EmbeddingMatrix = PrivateAttr()
+
+    def __init__(self, **data: Any) -> None:
+        super().__init__(**data)
+        self._matrix = EmbeddingMatrix(
+            Path(self.persist_dir) / MMAP_DIR_NAME, self.dtype
+        ).load()
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "MmapVectorStore":
+        return cls(persist_dir=persist_dir, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def size(self) -> int:
+        return self._matrix.size
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        self._matrix.append(
+            [node.node_id for node in nodes],
+            [node.ref_doc_id or "None" for node in nodes],
+            normalize_rows([node.get_embedding() for node in nodes]),
+        )
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        # VectorStoreIndex also calls delete() with node ids when cleaning up
+        self._matrix.delete(ref_doc_id)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        for node_id in node_ids or []:
+            self._matrix.delete(node_id)
+
+    def clear(self) -> None:
+        self._matrix.clear()
+
+    def get_embeddings(self, node_ids: List[str]) -> np.ndarray:
+        """Normalized stored embeddings for the given node ids (unknown ids are zeros)"""
+        return self._matrix.get(node_ids)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError(
+                "MmapVectorStore does not support metadata filters; "
+                "restrict the query with node_ids instead."
+            )
+        matrix = self._matrix
+        if not matrix.size:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = normalize_rows(np.asarray(query.query_embedding))
+        if query.node_ids is not None or query.doc_ids is not None:
+            rows = matrix.rows_for(query.node_ids, query.doc_ids)
+            scores = matrix.score(query_vector, rows)
+        else:
+            rows = None
+            scores = matrix.score(query_vector)
+            scores[~matrix.alive] = -np.inf
+
+        if len(scores) == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        best = top_k_indices(scores, min(query.similarity_top_k, matrix.size))
+        rows_of_best = best if rows is None else rows[best]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in best],
+            ids=[matrix.node_ids[row] for row in rows_of_best],
+        )
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Append new rows to <persist_dir>/mmap_vector_store; persist_path is ignored"""
+        self._matrix.flush()
+
+    def import_embeddings(self, embedding_dict, ref_doc_ids) -> None:
+        """Bulk-load vectors, e.g. from an existing SimpleVectorStore"""
+        if not embedding_dict:
+            return
+        node_ids = list(embedding_dict)
+        self._matrix.append(
+            node_ids,
+            [ref_doc_ids.get(node_id, "None") for node_id in node_ids],
+            normalize_rows([embedding_dict[node_id] for node_id in node_ids]),
+        )
@@ -0,0 +1,143 @@
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+# Rows upcast per step when scanning int8 codes; small enough that the
+# float32 temporary stays in cache
+_SCAN_CHUNK = 4096
+
+
+def kmeans(
+    vectors: np.ndarray, n_clusters: int, n_iter: int = 15, seed: int = 0
+) -> np.ndarray:
+    """Plain (euclidean) Lloyd k-means, used for the PQ sub-codebooks"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = nearest_centroid(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points
+        if not filled.all():
+            centroids[~filled] = vectors[rng.choice(len(vectors), (~filled).sum())]
+
+    return centroids
+
+
+def nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmin ||c||^2 - 2 x.c
+    distances = (centroids**2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+class Int8Quantizer:
+    """
+    Symmetric per-dimension scalar quantization to int8 (4x smaller than float32).
+
+    score(q, x) ~= codes(x) @ (q * scale), so scanning needs no decoding
+    beyond an int8 -> float32 upcast per chunk.
+    """
+
+    def __init__(self):
+        self.scale = None
+
+    def fit(self, sample: np.ndarray) -> "Int8Quantizer":
+        max_abs = np.abs(sample).max(axis=0)
+        max_abs[max_abs == 0] = 1.0
+        self.scale = (max_abs / 127.0).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint(vectors / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        weights = query * self.scale
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _SCAN_CHUNK):
+            chunk = codes[start : start + _SCAN_CHUNK]
+            scores[start : start + len(chunk)] = chunk.astype(np.float32) @ weights
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        self.scale = state["scale"]
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into `m` sub-vectors, each
+    replaced by the id of its nearest of 256 sub-centroids (m bytes per vector).
+
+    A query builds an (m, 256) table of sub-vector inner products once; the
+    score of every code is then m table lookups summed.
+    """
+
+    def __init__(self, m: int = 64, n_iter: int = 15):
+        self.m = m
+        self.n_iter = n_iter
+        self.codebooks = None  # (m, 256, dim // m)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        n, dim = vectors.shape
+        if dim % self.m:
+            raise ValueError(f"Embedding dim {dim} is not divisible by PQ_M={self.m}")
+        return vectors.reshape(n, self.m, dim // self.m)
+
+    def fit(self, sample: np.ndarray) -> "ProductQuantizer":
+        sub_vectors = self._split(sample)
+        n_centroids = min(256, len(sample))
+        self.codebooks = np.stack(
+            [
+                kmeans(sub_vectors[:, j, :], n_centroids, self.n_iter, seed=j)
+                for j in range(self.m)
+            ]
+        ).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_vectors = self._split(vectors)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = nearest_centroid(sub_vectors[:, j, :], self.codebooks[j])
+        return codes
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        sub_query = query.reshape(self.m, -1)
+        table = np.einsum("jkd,jd->jk", self.codebooks, sub_query)
+        # One 1-D lookup per sub-space is much faster than a 2-D fancy index
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.m):
+            scores += table[j].take(codes[:, j])
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        self.codebooks = state["codebooks"]
+        self.m = self.codebooks.shape[0]
+
+
+def create_quantizer(scheme: str, pq_m: int = 64):
+    if scheme == "int8":
+        return Int8Quantizer()
+    if scheme == "pq":
+        return ProductQuantizer(m=pq_m)
+    raise ValueError(f"Unknown quantization scheme: {scheme}")
+
+
+def save_quantizer(quantizer, path: Path) -> None:
+    np.savez(path, **quantizer.state())
+
+
+def load_quantizer(quantizer, path: Path) -> None:
+    with np.load(path) as state:
+        quantizer.load_state(dict(state))
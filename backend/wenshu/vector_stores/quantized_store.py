@@ -0,0 +1,249 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from .matrix import EmbeddingMatrix, normalize_rows, top_k_indices
+from .quantization import create_quantizer, load_quantizer, save_quantizer
+
+# Sub-directory of the storage dir holding the codes and full-precision matrix
+QUANTIZED_DIR_NAME = "quantized_vector_store"
+
+
+class QuantizedVectorStore(BasePydanticVectorStore):
+    """
+    Two-pass vector store: a vectorized scan over compact codes (int8 or PQ)
+    held in RAM picks `rerank_candidates` rows, which are then re-scored
+    exactly against the full-precision vectors in the memory-mapped matrix.
+
+    Only the codes need to stay resident; the full vectors are read from disk
+    (via the page cache) for a few hundred candidates per query.
+
+    - Until `train_threshold` vectors exist the store does exact search.
+    - The quantizer is retrained once the corpus grows `retrain_growth` times.
+    - Queries restricted to `node_ids` / `doc_ids` score only that subset exactly.
+    """
+
+    stores_text: bool = False
+
+    persist_dir: str
+    dtype: str = "float32"
+    scheme: str = "int8"  # "int8" or "pq"
+    pq_m: int = 64
+    rerank_candidates: int = 200
+    train_threshold: int = 4096
+    retrain_growth: float = 4.0
+
+    _matrix: EmbeddingMatrix = PrivateAttr()
+    _quantizer: Any = PrivateAttr()
+    _codes: Optional[np.ndarray] = PrivateAttr(default=None)
+    _trained_size: int = PrivateAttr(default=0)
+
+    def __init__(self, **data: Any) -> None:
+        super().__init__(**data)
+        self._matrix = EmbeddingMatrix(self._index_dir(), self.dtype)
+        self._quantizer = create_quantizer(self.scheme, self.pq_m)
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: str, **kwargs: Any
+    ) -> "QuantizedVectorStore":
+        """Load the codes and matrix from the storage dir, or create an empty store"""
+        store = cls(persist_dir=persist_dir, **kwargs)
+        store._load()
+        return store
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "QuantizedVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    # ----- bookkeeping -----
+
+    @property
+    def size(self) -> int:
+        return self._matrix.size
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Resident bytes of the codes vs. what the full-precision vectors would take"""
+        matrix = self._matrix
+        return {
+            "vectors": matrix.size,
+            "code_bytes": 0 if self._codes is None else int(self._codes.nbytes),
+            "full_precision_bytes": int(
+                matrix.rows * matrix.dim * matrix.dtype.itemsize
+            ),
+        }
+
+    def _encode_rows(self, rows: np.ndarray) -> np.ndarray:
+        return self._quantizer.encode(
+            self._matrix.gather(rows).astype(np.float32, copy=False)
+        )
+
+    def _train(self) -> None:
+        alive_rows = self._matrix.alive_rows()
+        sample_size = min(len(alive_rows), 65536)
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(alive_rows, sample_size, replace=False))
+        sample = self._matrix.gather(sample_rows).astype(np.float32, copy=False)
+        print(
+            f"[Quantized] Training {self.scheme} quantizer on {sample_size} vectors..."
+        )
+        self._quantizer.fit(sample)
+        self._codes = self._encode_rows(np.arange(self._matrix.rows))
+        self._trained_size = len(alive_rows)
+
+    def _maybe_retrain(self) -> None:
+        size = self.size
+        if self._codes is None:
+            if size >= self.train_threshold:
+                self._train()
+        elif size >= self._trained_size * self.retrain_growth:
+            self._train()
+
+    def _append(self, node_ids: List[str], ref_doc_ids: List[str], vectors) -> None:
+        start = self._matrix.append(node_ids, ref_doc_ids, normalize_rows(vectors))
+        if self._codes is not None:
+            new_codes = self._encode_rows(np.arange(start, self._matrix.rows))
+            self._codes = np.concatenate([self._codes, new_codes])
+        self._maybe_retrain()
+
+    # ----- BasePydanticVectorStore API -----
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        self._append(
+            [node.node_id for node in nodes],
+            [node.ref_doc_id or "None" for node in nodes],
+            [node.get_embedding() for node in nodes],
+        )
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        # VectorStoreIndex also calls delete() with node ids when cleaning up
+        self._matrix.delete(ref_doc_id)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        for node_id in node_ids or []:
+            self._matrix.delete(node_id)
+
+    def clear(self) -> None:
+        self._matrix.clear()
+        self._quantizer = create_quantizer(self.scheme, self.pq_m)
+        self._codes = None
+        self._trained_size = 0
+        for name in ("codes.npy", "quantizer.npz", "quantized.json"):
+            if (self._index_dir() / name).exists():
+                os.remove(self._index_dir() / name)
+
+    def get_embeddings(self, node_ids: List[str]) -> np.ndarray:
+        """Normalized stored embeddings for the given node ids (unknown ids are zeros)"""
+        return self._matrix.get(node_ids)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError(
+                "QuantizedVectorStore does not support metadata filters; "
+                "restrict the query with node_ids instead."
+            )
+        matrix = self._matrix
+        if not matrix.size:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = normalize_rows(np.asarray(query.query_embedding))
+        if query.node_ids is not None or query.doc_ids is not None:
+            rows = matrix.rows_for(query.node_ids, query.doc_ids)
+        elif self._codes is None:
+            rows = matrix.alive_rows()
+        else:
+            # First pass: approximate scores from the codes
+            approx = self._quantizer.scores(query_vector, self._codes)
+            approx[~matrix.alive] = -np.inf
+            n_candidates = min(
+                max(self.rerank_candidates, query.similarity_top_k), matrix.size
+            )
+            rows = np.sort(top_k_indices(approx, n_candidates))
+
+        if len(rows) == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        # Second pass: exact scores from the full-precision vectors
+        scores = matrix.score(query_vector, rows)
+        best = top_k_indices(scores, query.similarity_top_k)
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in best],
+            ids=[matrix.node_ids[rows[i]] for i in best],
+        )
+
+    # ----- persistence -----
+
+    def _index_dir(self) -> Path:
+        return Path(self.persist_dir) / QUANTIZED_DIR_NAME
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Persist to <persist_dir>/quantized_vector_store; persist_path is ignored"""
+        keep = self._matrix.flush()
+        if keep is not None and self._codes is not None:
+            self._codes = self._codes[keep]
+        if not self._matrix.exists():
+            return
+
+        index_dir = self._index_dir()
+        if self._codes is not None:
+            np.save(index_dir / "codes.npy", self._codes)
+            save_quantizer(self._quantizer, index_dir / "quantizer.npz")
+        with open(index_dir / "quantized.json", "w", encoding="utf-8") as f:
+            json.dump({"scheme": self.scheme, "trained_size": self._trained_size}, f)
+
+    def _load(self) -> None:
+        index_dir = self._index_dir()
+        self._matrix.load()
+        if not self._matrix.exists():
+            return
+
+        meta = {}
+        if (index_dir / "quantized.json").exists():
+            with open(index_dir / "quantized.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta.get("scheme") == self.scheme and (index_dir / "codes.npy").exists():
+            load_quantizer(self._quantizer, index_dir / "quantizer.npz")
+            self._codes = np.load(index_dir / "codes.npy")
+            self._trained_size = meta.get("trained_size", 0)
+            if len(self._codes) != self._matrix.rows:
+                # Files from an interrupted persist; re-encode from the vectors
+                self._codes = self._encode_rows(np.arange(self._matrix.rows))
+        else:
+            # Scheme changed (or first load after import): train from the vectors
+            self._maybe_retrain()
+        print(f"[Quantized] Loaded {self._matrix.size} vectors from {index_dir}")
+
+    def import_embeddings(
+        self, embedding_dict: Dict[str, List[float]], ref_doc_ids: Dict[str, str]
+    ) -> None:
+        """Bulk-load vectors, e.g. from an existing SimpleVectorStore"""
+        if not embedding_dict:
+            return
+        node_ids = list(embedding_dict)
+        self._append(
+            node_ids,
+            [ref_doc_ids.get(node_id, "None") for node_id in node_ids],
+            [embedding_dict[node_id] for node_id in node_ids],
+        )
@@ -129,6 +129,8 @@ export interface ChatSession {
   id: string
   title: string
   messages: ChatMessage[]
+  // 后端会话 ID，首次对话后由服务端返回，之后只需发送新消息
+  conversationId?: string
   createdAt: Date
   updatedAt: Date
 }
@@ -137,6 +139,8 @@ export interface StreamCallbacks {
   onData: (data: { type: string; data: any }) => void
   onError: (error: Error) => void
   onClose: () => void
+  // 服务端会话不存在（已过期或被删除）时调用，返回重新开始会话用的完整历史
+  onConversationNotFound?: () => ChatMessage[]
 }
 
 // 文件上传回调接口
@@ -148,7 +152,12 @@ export interface UploadCallbacks {
 
 export interface ChatAPI {
   // 现有聊天方法
-  streamChat(query: string, history: ChatMessage[], callbacks: StreamCallbacks): Promise<void>
+  streamChat(
+    query: string,
+    history: ChatMessage[],
+    callbacks: StreamCallbacks,
+    conversationId?: string,
+  ): Promise<void>
   getSession(sessionId: string): Promise<ChatSession>
   createSession(): Promise<ChatSession>
   getSessions(): Promise<ChatSession[]>
@@ -175,17 +184,22 @@ class RealChatAPI implements ChatAPI {
     query: string,
     history: ChatMessage[],
     callbacks: StreamCallbacks,
+    conversationId?: string,
   ): Promise<void> {
     const formData = new FormData()
     formData.append('query', query)
 
-    // Prepare chat history for backend, removing UI-only fields
-    const historyForApi = history.map((msg) => ({
-      role: msg.role,
-      content: msg.content,
-    }))
-
-    formData.append('chat_history', JSON.stringify(historyForApi))
+    if (conversationId) {
+      // 服务端保存了会话历史，只发送新消息
+      formData.append('conversation_id', conversationId)
+    } else {
+      // Prepare chat history for backend, removing UI-only fields
+      const historyForApi = history.map((msg) => ({
+        role: msg.role,
+        content: msg.content,
+      }))
+      formData.append('chat_history', JSON.stringify(historyForApi))
+    }
 
     try {
       const response = await fetch(`${this.BASE_URL}/chat`, {
@@ -193,6 +207,11 @@ class RealChatAPI implements ChatAPI {
         body: formData,
       })
 
+      if (response.status === 404 && conversationId && callbacks.onConversationNotFound) {
+        // 会话已失效：带上完整历史重新发送，由服务端开始新会话
+        return this.streamChat(query, callbacks.onConversationNotFound(), callbacks)
+      }
+
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
@@ -202,6 +221,8 @@ class RealChatAPI implements ChatAPI {
       }
 
       const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+      // 一个 SSE 帧可能跨多次 read，未结束的部分留到下一次
+      let buffer = ''
 
       while (true) {
         const { value, done } = await reader.read()
@@ -210,7 +231,11 @@ class RealChatAPI implements ChatAPI {
           break
         }
 
-        const lines = value.split('\n\n').filter((line) => line.trim())
+        buffer += value
+        const frames = buffer.split('\n\n')
+        buffer = frames.pop() ?? ''
+        // 以 ':' 开头的心跳注释行不含 data:，直接忽略
+        const lines = frames.filter((line) => line.trim())
         for (const line of lines) {
           if (line.startsWith('data:')) {
             const jsonData = line.substring(5).trim()
@@ -74,10 +74,15 @@ export const useChatStore = defineStore('chat', () => {
     }
     currentSession.value.messages.push(placeholderMessage)
 
-    const historyToSend = currentSession.value.messages.slice(0, -1)
+    const session = currentSession.value
+    const historyToSend = session.conversationId ? [] : session.messages.slice(0, -1)
 
     await chatAPI.streamChat(content.trim(), historyToSend, {
       onData: (data: any) => {
+        if (data.type === 'conversation') {
+          session.conversationId = data.data.conversation_id
+          return
+        }
         const targetMessage = currentSession.value?.messages.find((m) => m.id === assistantMessageId)
         if (!targetMessage) return
         if (targetMessage.status) targetMessage.status = undefined
@@ -111,6 +116,16 @@ export const useChatStore = defineStore('chat', () => {
               },
             })
             break
+          case 'budget_exhausted':
+            targetMessage.steps.push({
+              id: 'budget-' + Date.now(),
+              type: 'thought',
+              status: 'complete',
+              data: {
+                content: `研究预算已用尽（${data.data.reason}），以下回答基于已有发现，可能不完整。`,
+              },
+            })
+            break
           case 'retrieved_documents':
             targetMessage.document_results = data.data
             break
@@ -138,7 +153,11 @@ export const useChatStore = defineStore('chat', () => {
       onClose: () => {
         isLoading.value = false
       },
-    })
+      onConversationNotFound: () => {
+        session.conversationId = undefined
+        return session.messages.slice(0, -1)
+      },
+    }, session.conversationId)
   }
   // #endregion
 